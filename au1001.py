@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import threading
 
 import requests
 import json
@@ -12,6 +13,52 @@ def load_env_json():
         env_json = json.load(f)
 
 
+def get_api_host():
+    """REST host. Set API_HOST in env.json (e.g. http://127.0.0.1:8009 for paper.py) to trade against the local paper engine."""
+    global env_json
+    if not env_json:
+        load_env_json()
+    return env_json.get('API_HOST', 'https://api.kiwoom.com')
+
+
+def validate_env_json(data):
+    """Raise ValueError when env.json content cannot be used."""
+    if not isinstance(data, dict):
+        raise ValueError('env.json must be an object')
+    accounts = data.get('ACCOUNT')
+    if not isinstance(accounts, list) or not accounts:
+        raise ValueError('env.json ACCOUNT must be a non-empty list')
+    seen = set()
+    for A in accounts:
+        if not isinstance(A, dict) or not A.get('ACCT') or not A.get('AK') or not A.get('SK'):
+            raise ValueError(f'env.json ACCOUNT entry needs ACCT, AK and SK: {A}')
+        if A['ACCT'] in seen:
+            raise ValueError(f"env.json ACCOUNT {A['ACCT']} appears twice")
+        seen.add(A['ACCT'])
+
+
+def reload_env_json():
+    """Re-read env.json and swap env_json/key_list in one step.
+    Tokens of accounts whose AK/SK did not change are kept.
+    Returns (added, removed, changed) account lists; raises on invalid content."""
+    global env_json, key_list, token_list
+    with open('env.json', 'r', encoding='utf-8') as f:
+        new_env = json.load(f)
+    validate_env_json(new_env)
+    new_keys = {A['ACCT']: A for A in new_env['ACCOUNT']}
+    old_keys = key_list or {}
+    added = [a for a in new_keys if a not in old_keys]
+    removed = [a for a in old_keys if a not in new_keys]
+    changed = [a for a in new_keys if a in old_keys and
+               (new_keys[a]['AK'] != old_keys[a].get('AK') or new_keys[a]['SK'] != old_keys[a].get('SK'))]
+    env_json = new_env
+    key_list = new_keys
+    with token_lock:
+        for a in removed + changed:
+            token_list.pop(a, None)
+    return added, removed, changed
+
+
 key_list = None
 
 def get_key_list():
@@ -32,7 +79,7 @@ def get_key_list():
 def fn_au10001(data):
     # 1. 요청할 API URL
     # host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com'  # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/oauth2/token'
     url = host + endpoint
 
@@ -56,51 +103,55 @@ def fn_au10001(data):
 
 
 token_list = {}
+token_lock = threading.Lock()  # token_list and token refresh
 
 def get_token(ACCT):
+    """Access token of an account, issuing a new one when the cached one expires within the hour.
+    Serialized by token_lock: the account shards call it at the same time."""
     global token_list, env_json
 
-    expires_dt = '00000000000000'
-    token = None
-    if ACCT in token_list:
-        token_pair = token_list[ACCT]
-        expires_dt = token_pair['expires_dt']
-        token = token_pair['token']
-    # compare expire dt
-    nowstr = datetime.now().strftime('%Y%m%d%H%M%S')
-    if token and expires_dt > nowstr :
-        return token
-
-    # it is expected to be expired in an hour, so refresh
-    k_list = get_key_list()
-    keys = k_list[ACCT]
-
-    AK = keys['AK']
-    SK = keys['SK']
-    # 1. 요청 데이터
-    params = {
-        'grant_type': 'client_credentials',  # grant_type
-        'appkey': AK,  # 앱키
-        'secretkey': SK,  # 시크릿키
-    }
-
-    # 2. API 실행
-    j = fn_au10001(data=params)
-    print('Refreshing token===')
-    print(str(j))
-    if 'token' in j:
-        token = j['token']
-        # replace hhmmss to 0s to compare expire.
-        expires_dt = j['expires_dt']
-        expires_dt = decrease_one_hour(expires_dt)
-        token_pair = {}
-        token_pair['token'] = token
-        token_pair['expires_dt'] = expires_dt
-        token_list[ACCT] = token_pair
-        return token
-    else:
-        print(f'For {ACCT} non token in response {str(j)}')
-        return ''
+    with token_lock:
+        expires_dt = '00000000000000'
+        token = None
+        if ACCT in token_list:
+            token_pair = token_list[ACCT]
+            expires_dt = token_pair['expires_dt']
+            token = token_pair['token']
+        # compare expire dt
+        nowstr = datetime.now().strftime('%Y%m%d%H%M%S')
+        if token and expires_dt > nowstr :
+            return token
+
+        # it is expected to be expired in an hour, so refresh
+        k_list = get_key_list()
+        keys = k_list[ACCT]
+
+        AK = keys['AK']
+        SK = keys['SK']
+        # 1. 요청 데이터
+        params = {
+            'grant_type': 'client_credentials',  # grant_type
+            'appkey': AK,  # 앱키
+            'secretkey': SK,  # 시크릿키
+        }
+
+        # 2. API 실행
+        j = fn_au10001(data=params)
+        print('Refreshing token===')
+        print(str(j))
+        if 'token' in j:
+            token = j['token']
+            # replace hhmmss to 0s to compare expire.
+            expires_dt = j['expires_dt']
+            expires_dt = decrease_one_hour(expires_dt)
+            token_pair = {}
+            token_pair['token'] = token
+            token_pair['expires_dt'] = expires_dt
+            token_list[ACCT] = token_pair
+            return token
+        else:
+            print(f'For {ACCT} non token in response {str(j)}')
+            return ''
 
 def decrease_one_hour(dtstr):
     dt = datetime.strptime(dtstr, '%Y%m%d%H%M%S')
@@ -10,7 +10,12 @@ from fn_kt00001 import get_yesu_list
 
 # load_dotenv is not required, as it is called in au1001
 # from dotenv import load_dotenv
-from au1001 import get_token, get_key_list, get_one_token, os_getenv
+from au1001 import get_token, get_key_list, get_one_token, os_getenv, get_api_host, reload_env_json
+import au1001
+import statedb
+import logwriter
+import decisions
+import configwatch
 import time as time_module
 import threading
 import asyncio
@@ -22,6 +27,7 @@ from contextlib import asynccontextmanager
 import secrets
 import socket
 import uuid
+import pickle
 
 
 from ka10080 import get_bun_chart, get_price_index, get_ka10080_error
@@ -29,19 +35,25 @@ from ka10081 import get_day_chart
 from ka10100 import get_stockinfo, get_pl
 
 
+# Chart request throttles (seconds); env.json BUN_CHART_SLEEP / DAY_CHART_SLEEP / BUN_CHARTS_INTERVAL override them
+BUN_CHART_SLEEP = 1
+DAY_CHART_SLEEP = 0.5
+BUN_CHARTS_INTERVAL = 15
+
+
 def get_bun_chart_throttled(MY_ACCESS_TOKEN, stk_cd, stk_nm):
-    """Call get_bun_chart then sleep 0.5s to throttle requests."""
+    """Call get_bun_chart then sleep BUN_CHART_SLEEP to throttle requests."""
     bun = get_bun_chart(MY_ACCESS_TOKEN, stk_cd, stk_nm)
     if bun is None:
         log_print('', stk_cd, get_ka10080_error())
     else:
-        time_module.sleep(1)
+        time_module.sleep(BUN_CHART_SLEEP)
     return bun
 
 
 def get_day_chart_throttled(MY_ACCESS_TOKEN, stk_cd, stk_nm):
     day = get_day_chart(MY_ACCESS_TOKEN, stk_cd, stk_nm)
-    time_module.sleep(0.5)
+    time_module.sleep(DAY_CHART_SLEEP)
     return day
 
 # Daily chart cache (filled by minute chart thread)
@@ -49,7 +61,9 @@ daily_charts = {}  # {(stock_code, date_str_or_None): {data:any, ts:float}}
 daily_charts_lock = threading.Lock()
 DAILY_CHART_TTL_SECONDS = 15
 
-now = datetime.now()
+# Clock of the trading loop (periodic_timer_handler, active_market); replay.py swaps it for a virtual clock
+now_func = datetime.now
+now = now_func()
 today_yyyymmdd = now.strftime("%Y%m%d")
 
 # Interested stocks list
@@ -245,7 +259,7 @@ def get_server_ip_last_digit():
 def fn_ka01690(token, data, cont_yn='N', next_key=''):
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
@@ -306,7 +320,7 @@ def old_get_jango():
 def fn_kt00018(log_jango, token, data, cont_yn='N', next_key=''):
     # 1. ¿äÃ»ÇÒ API URL
     #host = 'https://mockapi.kiwoom.com' # ¸ðÀÇÅõÀÚ
-    host = 'https://api.kiwoom.com' # ½ÇÀüÅõÀÚ
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
@@ -337,6 +351,26 @@ def fn_kt00018(log_jango, token, data, cont_yn='N', next_key=''):
 
 get_jango_count = 0
 
+# Account work runs on long-lived single-thread shards: the pools are not rebuilt every tick,
+# one account's calls never overlap, and accounts are spread over ACCOUNT_SHARDS threads.
+ACCOUNT_SHARDS = 8
+account_shards = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'AcctShard{i}') for i in range(ACCOUNT_SHARDS)]
+
+
+# ACCT -> shard index; fixed once assigned so accounts added by a config reload never move existing ones
+account_shard_index = {ACCT: i for i, ACCT in enumerate(sorted(key_list.keys()))}
+
+
+def account_shard(ACCT):
+    idx = account_shard_index.get(ACCT)
+    if idx is None:
+        idx = account_shard_index.setdefault(ACCT, len(account_shard_index))
+    return account_shards[idx % ACCOUNT_SHARDS]
+
+
+def submit_for_account(ACCT, fn, *args):
+    return account_shard(ACCT).submit(fn, *args)
+
 
 '''
     {
@@ -385,42 +419,41 @@ def get_jango(market = 'KRX'):
         tasks.append((acct, log_jango, market, MY_ACCESS_TOKEN))
     
     start = time_module.time()
-    # Execute all calls in parallel and wait for completion
-    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        futures = {}
-        for acct, log_jango_val, market_val, token in tasks:
-            future = executor.submit(call_fn_kt00018, log_jango_val, market_val, acct, token)
-            futures[future] = acct
-        
-        # Wait for all tasks to complete and collect results
-        for future in as_completed(futures):
-            acct = futures[future]
-            try:
-                j = future.result()
-                # fn_kt00018 returns {} on exception (network/parse/etc.)
-                if not isinstance(j, dict):
-                    log_print('', '000000', f"get_jango: non-dict response for account {acct}, type={type(j)}")
-                    jango[acct] = {
-                        "return_code": -1,
-                        "return_msg": "invalid jango response type",
-                        "ACCT": acct,
-                    }
-                    continue
-                if len(j) == 0:
-                    log_print('', '000000', f"get_jango: empty dict for account {acct} (fn_kt00018 failed)")
-                    jango[acct] = {
-                        "return_code": -1,
-                        "return_msg": "empty jango response (fn_kt00018 exception)",
-                        "ACCT": acct,
-                    }
-                    continue
-                j['ACCT'] = acct
-                jango[acct] = j
-            except Exception as e:
-                print(f"Error getting jango for account {acct}: {e}")
-                traceback.print_exc()
-                # Create error response for this account
-                jango[acct] = {"return_code": -1, "return_msg": str(e), "ACCT": acct}
+    # Execute all calls in parallel on the account shards and wait for completion
+    futures = {}
+    for acct, log_jango_val, market_val, token in tasks:
+        future = submit_for_account(acct, call_fn_kt00018, log_jango_val, market_val, acct, token)
+        futures[future] = acct
+
+    # Wait for all tasks to complete and collect results
+    for future in as_completed(futures):
+        acct = futures[future]
+        try:
+            j = future.result()
+            # fn_kt00018 returns {} on exception (network/parse/etc.)
+            if not isinstance(j, dict):
+                log_print('', '000000', f"get_jango: non-dict response for account {acct}, type={type(j)}")
+                jango[acct] = {
+                    "return_code": -1,
+                    "return_msg": "invalid jango response type",
+                    "ACCT": acct,
+                }
+                continue
+            if len(j) == 0:
+                log_print('', '000000', f"get_jango: empty dict for account {acct} (fn_kt00018 failed)")
+                jango[acct] = {
+                    "return_code": -1,
+                    "return_msg": "empty jango response (fn_kt00018 exception)",
+                    "ACCT": acct,
+                }
+                continue
+            j['ACCT'] = acct
+            jango[acct] = j
+        except Exception as e:
+            print(f"Error getting jango for account {acct}: {e}")
+            traceback.print_exc()
+            # Create error response for this account
+            jango[acct] = {"return_code": -1, "return_msg": str(e), "ACCT": acct}
 
     elapsed = time_module.time() - start
     if log_jango:
@@ -612,6 +645,9 @@ def cancel_different_sell_order(now, ACCT, stk_cd, stk_nm, new_price, skip_price
                 result = cancel_order_main(ACCT, now, jango_token[ACCT], m['stex_tp_txt'], m['ord_no'], stk_cd)
                 log_print(ACCT, stk_cd, 'cancel_different_sell_order old price={}, new price={}, old_qty={}, result={}'.format(
                           oqp, new_price, oqty, result))
+                decisions.record(ACCT, stk_cd, 'CANCEL', 'price_changed',
+                                 {'old_price': oqp, 'new_price': new_price, 'old_qty': oqty},
+                                 {'market': m['stex_tp_txt'], 'ord_no': m['ord_no']}, result, ts=now)
                 cancel_count += 1
     if cancel_count != 0:
         log_print(ACCT, stk_cd, 'cancel_different_sell_order np={} count={}.'.format(new_price, cancel_count))
@@ -895,6 +931,11 @@ def call_sell_order(ACCT, MY_ACCESS_TOKEN, market, stk_cd, stk_nm, indv, sell_co
                     ord_qty=str(split_qty), ord_uv=str(split_price),
                     trde_tp=trde_tp, cond_uv='')
                 log_print(ACCT, stk_cd, f'split ret_status={ret_status}')
+                decisions.record(ACCT, stk_cd, 'SPLIT_SELL', 'order',
+                                 {'pur_pric': pur_pric, 'split_rate': split_rate, 'trde_able_qty': trde_able_qty_int,
+                                  'upperlimit': upperlimit},
+                                 {'market': resolved_market, 'qty': split_qty, 'price': split_price, 'trde_tp': trde_tp},
+                                 ret_status, ts=now)
                 test_ret_status('SELL', stk_cd, stk_nm, ret_status, split_price)
                 if isinstance(ret_status, dict) and _is_success_return_code(ret_status.get('return_code')):
                     _finish_split_sell_order(stk_cd, split_qty, split_price)
@@ -950,6 +991,11 @@ def call_sell_order(ACCT, MY_ACCESS_TOKEN, market, stk_cd, stk_nm, indv, sell_co
     ret_status = sell_order(MY_ACCESS_TOKEN, dmst_stex_tp=market, stk_cd=stk_cd,
                             ord_qty=str(ord_qty), ord_uv=str(sell_price), trde_tp=trde_tp, cond_uv='')
     log_print(ACCT, stk_cd, f' ret_status={ret_status}')
+    decisions.record(ACCT, stk_cd, 'SELL', 'order',
+                     {'pur_pric': pur_pric, 'sell_cond': sell_cond, 'sell_price': sell_price,
+                      'upperlimit': upperlimit, 'trde_able_qty': trde_able_qty_int, 'old_sell_price': oprice},
+                     {'market': market, 'qty': ord_qty, 'price': sell_price, 'trde_tp': trde_tp},
+                     ret_status, ts=now)
     test_ret_status('SELL', stk_cd, stk_nm, ret_status, sell_price)
 
 
@@ -1104,7 +1150,7 @@ def fn_ka10075(token, data, cont_yn='N', next_key=''):
 
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
@@ -1127,32 +1173,39 @@ def fn_ka10075(token, data, cont_yn='N', next_key=''):
     return response.json()
 
 
+def get_miche_by_account(ACCT):
+    MY_ACCESS_TOKEN = get_token(ACCT)  # 접근토큰
+    # 2. 요청 데이터
+    params = {
+        'all_stk_tp': '0', # 전체종목구분 0:전체, 1:종목
+        'trde_tp': '0', # 매매구분 0:전체, 1:매도, 2:매수
+        'stk_cd': '', # 종목코드
+        'stex_tp': '0', # 거래소구분 0 : 통합, 1 : KRX, 2 : NXT
+    }
+
+    # 3. API 실행
+    m = fn_ka10075(token=MY_ACCESS_TOKEN, data=params)
+    m['ACCT'] = ACCT
+    m['TOKEN'] = MY_ACCESS_TOKEN
+    if 'oso' in m:
+        for order in m['oso']:
+            cur_prc = order.get('cur_prc', '0')
+            if cur_prc[0] == '-':
+                order['cur_prc'] = cur_prc[1:]
+    return m
+
+
 # 실행 구간
 def get_miche():
     global get_miche_failed, key_list
 
-    miche = {}
+    futures = {}
     for k, key in key_list.items():
         ACCT = key['ACCT']
-        MY_ACCESS_TOKEN = get_token(ACCT)  # 접근토큰
-        # 2. 요청 데이터
-        params = {
-            'all_stk_tp': '0', # 전체종목구분 0:전체, 1:종목
-            'trde_tp': '0', # 매매구분 0:전체, 1:매도, 2:매수
-            'stk_cd': '', # 종목코드
-            'stex_tp': '0', # 거래소구분 0 : 통합, 1 : KRX, 2 : NXT
-        }
-
-        # 3. API 실행
-        m = fn_ka10075(token=MY_ACCESS_TOKEN, data=params)
-        m['ACCT'] = ACCT
-        m['TOKEN'] = MY_ACCESS_TOKEN
-        if 'oso' in m:
-            for order in m['oso']:
-                cur_prc = order.get('cur_prc', '0')
-                if cur_prc[0] == '-':
-                    order['cur_prc'] = cur_prc[1:]
-        miche[ACCT] = m
+        futures[ACCT] = submit_for_account(ACCT, get_miche_by_account, ACCT)
+    miche = {}
+    for ACCT, future in futures.items():
+        miche[ACCT] = future.result()
 
     if get_miche_failed:
         get_miche_failed = False
@@ -1218,7 +1271,7 @@ def fn_kt10003(now, token, data, cont_yn='N', next_key=''):
     print("{} cancel order begin fn_kt10003".format(now))
     # 1. 요청할 API URL
     # host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com'  # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/ordr'
     url = host + endpoint
 
@@ -1320,40 +1373,24 @@ def is_new_log(acct, stk_cd, msg):
     return True
 
 
+def log_stock_name(stk_cd):
+    """File name part for logs/yyyymmdd/<code>_<name>.txt; runs on the log writer thread."""
+    return get_stockinfo(stk_cd)['name']
+
+
 def log_print(acct, stk_cd, msg):
-    """Append log message to file: logs/yyyymmdd/stock_code_stock_name.txt"""
-    global today_yyyymmdd, interested_stocks, interested_stocks_lock
+    """Queue log message for logs/yyyymmdd/stock_code_stock_name.txt (written by logwriter)"""
+    global today_yyyymmdd
     if acct == '':
         acct = 'ALLACCT'
 
     if not is_new_log(acct, stk_cd, msg):
         return
 
-
     try:
-        # Get yyyymmdd from global variable
-        yyyymmdd = today_yyyymmdd
-        
-        # Get stock name from interested_stocks if available, otherwise use get_stockname
-        stk_nm = get_stockinfo(stk_cd)['name']
-        if stk_nm == '':
-            stk_nm = stk_cd  # Fallback to stock code if get_stockname fails
-        
-        # Create directory structure if it doesn't exist
-        log_dir = os.path.join('logs', yyyymmdd)
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # Create log file name: stock_code_stock_name.txt
-        log_filename = f"{stk_cd}_{stk_nm}.txt"
-        log_filepath = os.path.join(log_dir, log_filename)
-        
         # Append message to log file with timestamp
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_line = f"[{timestamp}] {acct} {msg}\n"
-
-        with open(log_filepath, 'a', encoding='utf-8') as f:
-            f.write(log_line)
-            
+        logwriter.enqueue(today_yyyymmdd, stk_cd, f"[{timestamp}] {acct} {msg}\n")
     except Exception as e:
         # Don't fail silently, but don't crash the program either
         print(f"Error in log_print for {stk_cd}: {e}")
@@ -1361,10 +1398,9 @@ def log_print(acct, stk_cd, msg):
 
 def buy_cl(now, stex):
     global interested_stocks, gap_prices, bun_charts
-    global stored_jango_data, stored_miche_data, key_list
-
-    gap_prices = {} # clear on each call
+    global stored_jango_data, stored_miche_data, key_list, working_status
 
+    accounts = []
     for ACCT, key in key_list.items():
         # Check auto sell enabled for this specific account
         # Mode can be NONE, BUY, SELL, BOTH
@@ -1372,28 +1408,45 @@ def buy_cl(now, stex):
         # buy_cl runs if mode is BUY or BOTH
         if mode not in ['BUY', 'BOTH']:
             continue
+        accounts.append(ACCT)
+    if not accounts:
+        return
+
+    # gap prices once per pass, here, so the account shards do not each send the same TRs
+    with interested_stocks_lock:
+        istk_items = list(interested_stocks.items())
+    prices = {}
+    try:
+        token = get_token(accounts[0])
+        for stk_cd, int_stock in istk_items:
+            if int_stock.get('btype', '') == 'CL':
+                prices[stk_cd] = get_gap_price(token, stk_cd, '')
+            if not new_day:
+                break
+    except Exception as ex:
+        print(ex)
+    gap_prices = prices  # calculate_sell_price (main loop thread) reuses and extends this pass's prices
 
-        #ACCT = key['ACCT']
+    working_status = 'in buy_cl_by_account'
+    futures = []
+    for ACCT in accounts:
         MY_ACCESS_TOKEN = get_token(ACCT)  # 접근토큰
-        buy_cl_by_account(ACCT, MY_ACCESS_TOKEN, stex, '')
+        futures.append(submit_for_account(ACCT, buy_cl_by_account, ACCT, MY_ACCESS_TOKEN, stex, istk_items, prices))
+    for future in futures:
+        future.result()
 
 gap_prices = {}
 
-def buy_cl_by_account(ACCT, MY_ACCESS_TOKEN, stex, stk_nm):
-    global working_status
-    global gap_prices, new_day, interested_stocks, interested_stocks_lock
+def buy_cl_by_account(ACCT, MY_ACCESS_TOKEN, stex, istk_items, prices):
+    """Run on the account's shard with the interested stocks and gap prices buy_cl took for this pass."""
+    global new_day
 
     try:
-        working_status = 'in buy_cl_by_account'
-        with interested_stocks_lock:
-            istk_items = list(interested_stocks.items())
         for stk_cd, int_stock in istk_items:
             btype = int_stock.get('btype', '')
             if btype == 'CL':
-                if not stk_cd in gap_prices:
-                    gap_prices[stk_cd] = get_gap_price(MY_ACCESS_TOKEN, stk_cd, stk_nm)
-
-                buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_prices[stk_cd])
+                if stk_cd in prices:
+                    buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, prices[stk_cd])
             if not new_day:
                 break
         pass
@@ -1401,7 +1454,7 @@ def buy_cl_by_account(ACCT, MY_ACCESS_TOKEN, stex, stk_nm):
         print(ex)
 
 def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
-    global working_status, now, key_list
+    global now, key_list
     if not gap_price:
         return
     if stex == 'NXT' and not nxt_tradable.get(stk_cd, True) :
@@ -1409,7 +1462,6 @@ def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
 
     stk_nm = int_stock['stock_name']
 
-    working_status = 'in buy_cl_stk_cd'
     if get_order_count(ACCT, stk_cd) >= 2:
         return
 
@@ -1460,17 +1512,18 @@ def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
         if get_order_count(ACCT, stk_cd) >= 2:
             return
 
-        if not stk_cd in gap_prices:
-            log_print('', stk_cd, 'getting bun_chart or bun_price failed');
-            return
 
         price_index = get_price_index(scolor)
         trde_tp = '0'
+        inputs = {'gap_price': gap_price, 'bsum': bsum, 'bamount': bamount, 'color': scolor,
+                  'bc1': bc1, 'bc2': bc2, 'hold_count': hold_count,
+                  'order_count': get_order_count(ACCT, stk_cd), 'price_index': price_index}
         if get_order_count(ACCT, stk_cd) < 1 and hold_count < 1 : # 보유량이 없고 주문 사실도 없다면
             bp = gap_price['price'][price_index]
             buy_rate = (float(gap_price.get('current_price', 0))-bp) / bp # 현재 가격과 매수 가격의 차이
             if buy_rate >= 0.03 : # 매수 가격이랑 3%이상 차이가 난다면 매수 하지 않는다,
                 log_print('', stk_cd, f'gap over skip 1 for {stk_nm} {bp} {buy_rate:.3f}')
+                decisions.record(ACCT, stk_cd, 'BUY', 'skip_gap_1', dict(inputs, bp=bp, buy_rate=buy_rate), ts=now)
             else:
                 ord_price = round_trunc(bp)
                 if scolor == 'O':
@@ -1482,6 +1535,8 @@ def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
                     log_print(ACCT, stk_cd, 'buy_order market={}, qty={} price={}'.format(stex, ord_qty, ord_price))
                     ret_status = buy_order(MY_ACCESS_TOKEN, stk_nm, stex, stk_cd, str(ord_qty), str(ord_price), trde_tp=trde_tp, cond_uv='')
                     log_print(ACCT, stk_cd, '1_buy_order_result: {}'.format(ret_status))
+                    decisions.record(ACCT, stk_cd, 'BUY', 'order_1', dict(inputs, bp=bp, buy_rate=buy_rate),
+                                     {'market': stex, 'qty': ord_qty, 'price': ord_price, 'trde_tp': trde_tp}, ret_status, ts=now)
                     tr = test_ret_status('BUY', stk_cd, stk_nm, ret_status, ord_price)
                     if tr == 0 or tr == 20 or tr == 200 :
                         add_order_count(ACCT, stk_cd, 1)
@@ -1494,6 +1549,7 @@ def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
             buy_rate = (float(gap_price.get('current_price', 0))-bp) / bp # 현재 가격과 매수 가격의 차이
             if buy_rate >= 0.03 : # 매수 가격이랑 3%이상 차이가 난다면 매수 하지 않는다,
                 log_print('', stk_cd, f'gap over skip 2 for {stk_nm} {bp} {buy_rate:.3f}')
+                decisions.record(ACCT, stk_cd, 'BUY', 'skip_gap_2', dict(inputs, bp=bp, buy_rate=buy_rate), ts=now)
             else:
                 ord_price = round_trunc(bp)
                 ord_qty = int(bamount // ord_price)
@@ -1501,6 +1557,8 @@ def buy_cl_stk_cd(stex, ACCT, MY_ACCESS_TOKEN, stk_cd, int_stock, gap_price):
                 if ord_qty > 0 :
                     log_print(ACCT, stk_cd, 'buy_order market={}, qty={} price={}'.format(stex, ord_qty, ord_price))
                     ret_status = buy_order(MY_ACCESS_TOKEN, stk_nm, stex, stk_cd, str(ord_qty), str(ord_price), trde_tp=trde_tp, cond_uv='')
+                    decisions.record(ACCT, stk_cd, 'BUY', 'order_2', dict(inputs, bp=bp, buy_rate=buy_rate),
+                                     {'market': stex, 'qty': ord_qty, 'price': ord_price, 'trde_tp': trde_tp}, ret_status, ts=now)
                     tr = test_ret_status('BUY', stk_cd, stk_nm, ret_status, ord_price)
                     if tr == 0 or tr == 20 or tr == 200 :
                         log_print(ACCT, stk_cd, '2_buy_order_result success : {}'.format(ret_status))
@@ -1641,97 +1699,90 @@ def set_new_day_false():
 AUTO_SELL_FILE = 'auto_sell_enabled.json'
 auto_sell_enabled = {}
 
+def apply_pc_settings(loaded_pc):
+    """Set pc_color / pc_sellrate / pc_bamount from a dict; invalid values are skipped."""
+    global pc_color, pc_sellrate, pc_bamount
+    if isinstance(loaded_pc, dict):
+        with pc_settings_lock:
+            if 'pc_color' in loaded_pc and loaded_pc['pc_color'] is not None:
+                pc_color = str(loaded_pc['pc_color']).strip() or pc_color
+            if 'pc_sellrate' in loaded_pc and loaded_pc['pc_sellrate'] is not None:
+                try:
+                    pc_sellrate = float(loaded_pc['pc_sellrate'])
+                except (ValueError, TypeError):
+                    pass
+            if 'pc_bamount' in loaded_pc and loaded_pc['pc_bamount'] is not None:
+                try:
+                    pc_bamount = int(float(loaded_pc['pc_bamount']))
+                except (ValueError, TypeError):
+                    pass
+
+
 def load_dictionaries_from_json():
-    """Load auto_sell_enabled, and interested_stocks from JSON files"""
+    """Load sell_exclude, pc settings, auto_sell_enabled and interested_stocks from the state store.
+    The legacy JSON files are imported into the store once."""
     global auto_sell_enabled, interested_stocks, interested_stocks_lock
     global sell_exclude, sell_exclude_lock
     global pc_color, pc_sellrate, pc_bamount
 
     # Load sell_exclude
-    if os.path.exists(SELL_EXCLUDE_FILE):
-        try:
-            with open(SELL_EXCLUDE_FILE, 'r', encoding='utf-8') as f:
-                loaded_exclude = json.load(f)
-            with sell_exclude_lock:
-                sell_exclude = loaded_exclude if isinstance(loaded_exclude, dict) else {}
-            print(f"Loaded sell_exclude from {SELL_EXCLUDE_FILE}: {sell_exclude}")
-        except Exception as e:
-            print(f"Error loading sell_exclude: {e}")
-            with sell_exclude_lock:
-                sell_exclude = {}
-    else:
+    try:
+        statedb.migrate_json('sell_exclude', SELL_EXCLUDE_FILE)
+        loaded_exclude = statedb.load_table('sell_exclude')
+        with sell_exclude_lock:
+            sell_exclude = loaded_exclude
+        print(f"Loaded sell_exclude from {statedb.STATE_DB_FILE}: {sell_exclude}")
+    except Exception as e:
+        print(f"Error loading sell_exclude: {e}")
         with sell_exclude_lock:
             sell_exclude = {}
-        print(f"Created new sell_exclude dictionary")
 
     # Load pc settings (pctoken defaults)
-    if os.path.exists(PC_SETTINGS_FILE):
+    statedb.migrate_json('pc_settings', PC_SETTINGS_FILE)
+    loaded_pc = statedb.load_table('pc_settings')
+    if loaded_pc:
         try:
-            with open(PC_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                loaded_pc = json.load(f)
-            if isinstance(loaded_pc, dict):
-                with pc_settings_lock:
-                    if 'pc_color' in loaded_pc and loaded_pc['pc_color'] is not None:
-                        pc_color = str(loaded_pc['pc_color']).strip() or pc_color
-                    if 'pc_sellrate' in loaded_pc and loaded_pc['pc_sellrate'] is not None:
-                        try:
-                            pc_sellrate = float(loaded_pc['pc_sellrate'])
-                        except (ValueError, TypeError):
-                            pass
-                    if 'pc_bamount' in loaded_pc and loaded_pc['pc_bamount'] is not None:
-                        try:
-                            pc_bamount = int(float(loaded_pc['pc_bamount']))
-                        except (ValueError, TypeError):
-                            pass
-            print(f"Loaded pc settings from {PC_SETTINGS_FILE}: "
+            apply_pc_settings(loaded_pc)
+            print(f"Loaded pc settings from {statedb.STATE_DB_FILE}: "
                   f"color={pc_color}, sellrate={pc_sellrate}, bamount={pc_bamount}")
         except Exception as e:
             print(f"Error loading pc settings: {e}")
     else:
         save_pc_settings_to_json()
-        print(f"Created new pc settings file {PC_SETTINGS_FILE}")
+        print(f"Created new pc settings in {statedb.STATE_DB_FILE}")
 
     # Load auto_sell_enabled
-    if os.path.exists(AUTO_SELL_FILE):
-        try:
-            with open(AUTO_SELL_FILE, 'r', encoding='utf-8') as f:
-                auto_sell_enabled = json.load(f)
-            
-            # Migration: Convert boolean values to strings
-            modified_migration = False
-            for acct, val in auto_sell_enabled.items():
-                if isinstance(val, bool):
-                    auto_sell_enabled[acct] = 'SELL' if val else 'NONE'
-                    modified_migration = True
-            
-            if modified_migration:
-                save_auto_sell_to_json()
-                print(f"Migrated auto_sell_enabled boolean values to strings")
-                
-            print(f"Loaded auto_sell_enabled from {AUTO_SELL_FILE}: {auto_sell_enabled}")
-        except Exception as e:
-            print(f"Error loading auto_sell_enabled: {e}")
-            auto_sell_enabled = {}
-    else:
+    try:
+        statedb.migrate_json('auto_sell_enabled', AUTO_SELL_FILE)
+        auto_sell_enabled = statedb.load_table('auto_sell_enabled')
+
+        # Migration: Convert boolean values to strings
+        modified_migration = False
+        for acct, val in auto_sell_enabled.items():
+            if isinstance(val, bool):
+                auto_sell_enabled[acct] = 'SELL' if val else 'NONE'
+                modified_migration = True
+
+        if modified_migration:
+            save_auto_sell_to_json()
+            print(f"Migrated auto_sell_enabled boolean values to strings")
+
+        print(f"Loaded auto_sell_enabled from {statedb.STATE_DB_FILE}: {auto_sell_enabled}")
+    except Exception as e:
+        print(f"Error loading auto_sell_enabled: {e}")
         auto_sell_enabled = {}
-        print(f"Created new auto_sell_enabled dictionary")
 
     # Load interested_stocks
-    if os.path.exists(INTERESTED_STOCKS_FILE):
-        try:
-            with open(INTERESTED_STOCKS_FILE, 'r', encoding='utf-8') as f:
-                loaded = json.load(f)
-            with interested_stocks_lock:
-                interested_stocks = loaded
-            print(f"Loaded interested_stocks from {INTERESTED_STOCKS_FILE}: {interested_stocks}")
-        except Exception as e:
-            print(f"Error loading interested_stocks: {e}")
-            with interested_stocks_lock:
-                interested_stocks = {}
-    else:
+    try:
+        statedb.migrate_json('interested_stocks', INTERESTED_STOCKS_FILE)
+        loaded = statedb.load_table('interested_stocks')
+        with interested_stocks_lock:
+            interested_stocks = loaded
+        print(f"Loaded interested_stocks from {statedb.STATE_DB_FILE}: {interested_stocks}")
+    except Exception as e:
+        print(f"Error loading interested_stocks: {e}")
         with interested_stocks_lock:
             interested_stocks = {}
-        print(f"Created new interested_stocks dictionary")
 
     try:
         with interested_stocks_lock:
@@ -1817,12 +1868,11 @@ def fill_charts_for_CL(MY_ACCESS_TOKEN):
 
 
 def save_auto_sell_to_json():
-    """Save auto_sell_enabled to JSON file"""
+    """Save auto_sell_enabled to the state store"""
     global auto_sell_enabled
     try:
-        with open(AUTO_SELL_FILE, 'w', encoding='utf-8') as f:
-            json.dump(auto_sell_enabled, f, indent=2, ensure_ascii=False)
-        print(f"Saved auto_sell_enabled to {AUTO_SELL_FILE}")
+        statedb.sync_table('auto_sell_enabled', auto_sell_enabled)
+        print(f"Saved auto_sell_enabled to {statedb.STATE_DB_FILE}")
         return True
     except Exception as e:
         print(f"Error saving auto_sell_enabled: {e}")
@@ -1840,12 +1890,11 @@ def get_pc_settings_snapshot():
 
 
 def save_pc_settings_to_json():
-    """Save pc_color / pc_sellrate / pc_bamount to JSON file"""
+    """Save pc_color / pc_sellrate / pc_bamount to the state store"""
     try:
         data = get_pc_settings_snapshot()
-        with open(PC_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Saved pc settings to {PC_SETTINGS_FILE}: {data}")
+        statedb.sync_table('pc_settings', data)
+        print(f"Saved pc settings to {statedb.STATE_DB_FILE}: {data}")
         return True
     except Exception as e:
         print(f"Error saving pc settings: {e}")
@@ -1853,14 +1902,13 @@ def save_pc_settings_to_json():
 
 
 def save_sell_exclude_to_json():
-    """Save sell_exclude to JSON file"""
+    """Save sell_exclude to the state store"""
     global sell_exclude, sell_exclude_lock
     try:
         with sell_exclude_lock:
             data = copy.deepcopy(sell_exclude)
-        with open(SELL_EXCLUDE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Saved sell_exclude to {SELL_EXCLUDE_FILE}")
+        statedb.sync_table('sell_exclude', data)
+        print(f"Saved sell_exclude to {statedb.STATE_DB_FILE}")
         return True
     except Exception as e:
         print(f"Error saving sell_exclude: {e}")
@@ -1876,14 +1924,13 @@ def is_sell_excluded(stk_cd):
 
 
 def save_interested_stocks_to_json():
-    """Save interested_stocks to JSON file"""
+    """Save interested_stocks to the state store"""
     global interested_stocks, interested_stocks_lock
     try:
         with interested_stocks_lock:
             data = copy.deepcopy(interested_stocks)
-        with open(INTERESTED_STOCKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Saved interested_stocks to {INTERESTED_STOCKS_FILE}")
+        statedb.sync_table('interested_stocks', data)
+        print(f"Saved interested_stocks to {statedb.STATE_DB_FILE}")
         return True
     except Exception as e:
         print(f"Error saving interested_stocks: {e}")
@@ -1906,28 +1953,25 @@ def extract_stock_codes_and_amounts(jango_data):
     return result
 
 def save_jango_data_to_json(stock_data):
-    """Save jango data to JSON file: {account: {stock_code: amount}}"""
+    """Save jango data to the state store: {account: {stock_code: amount}}"""
     try:
-        with open(JANGO_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(stock_data, f, indent=2, ensure_ascii=False)
-        print(f"Saved jango data (stock codes and amounts) to {JANGO_DATA_FILE}")
+        changed = statedb.sync_table('jango_data', stock_data)
+        print(f"Saved jango data (stock codes and amounts) to {statedb.STATE_DB_FILE}: {changed} accounts changed")
         return True
     except Exception as e:
         print(f"Error saving jango data: {e}")
         return False
 
 def load_jango_data_from_json():
-    """Load jango data from JSON file: {account: {stock_code: amount}}"""
+    """Load jango data from the state store: {account: {stock_code: amount}}"""
     try:
-        if os.path.exists(JANGO_DATA_FILE):
-            with open(JANGO_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Ignore old format - if values are not dicts, return empty
-                if data and isinstance(next(iter(data.values())), dict):
-                    return {acct: {k: int(v) for k, v in stocks.items()} for acct, stocks in data.items()}
-                else:
-                    print(f"Old format in {JANGO_DATA_FILE}, ignoring")
-                    return {}
+        statedb.migrate_json('jango_data', JANGO_DATA_FILE)
+        data = statedb.get_table('jango_data')
+        # Ignore old format - if values are not dicts, return empty
+        if data and isinstance(next(iter(data.values())), dict):
+            return {acct: {k: int(v) for k, v in stocks.items()} for acct, stocks in data.items()}
+        elif data:
+            print(f"Old format in {JANGO_DATA_FILE}, ignoring")
         return {}
     except Exception as e:
         print(f"Error loading jango data: {e}")
@@ -2170,6 +2214,15 @@ def query_day_charts(MY_ACCESS_TOKEN, cl_stocks):
                 daily_charts[_stk] = {'data': _day, 'ts': now_ts}
 
 
+def request_datagather_prerender():
+    """Tell datagather the charts were refreshed so it pre-renders the holdings' chart images
+    (it merges frequent requests and spaces its passes out while the market is open)."""
+    try:
+        requests.post("http://localhost:8007/api/prerender", params={'source': 'autotr', 'scope': 'holdings'}, timeout=1)
+    except requests.exceptions.RequestException:
+        pass  # datagather not running: its charts are rendered on first view instead
+
+
 def update_bun_charts_thread():
     """Background thread that updates bun_charts dict in parallel for stocks with btype 'CL'"""
     global bun_charts, bun_charts_lock, interested_stocks, bun_charts_thread_stop_event, interested_stocks_lock
@@ -2195,16 +2248,122 @@ def update_bun_charts_thread():
 
             query_bun_charts(MY_ACCESS_TOKEN, cl_stocks)
             query_day_charts(MY_ACCESS_TOKEN, cl_stocks)
+            save_warm_state()
+            request_datagather_prerender()
         else:
             print('No MY_ACCESS_TOKEN')
 
-        # Sleep for 15 seconds before next update
-        for _ in range(150):  # Check every 0.1 seconds for 15 seconds total
+        # Sleep for BUN_CHARTS_INTERVAL seconds before next update
+        for _ in range(int(BUN_CHARTS_INTERVAL * 10)):  # Check every 0.1 seconds
             if bun_charts_thread_stop_event.is_set():
                 break
             time_module.sleep(0.1)
 
 
+def apply_env_config():
+    """Apply the non-account settings of env.json (login, PCTOKEN, chart throttles)."""
+    global LOGIN_USERNAME, LOGIN_PASSWORD, env_pctoken
+    global BUN_CHART_SLEEP, DAY_CHART_SLEEP, BUN_CHARTS_INTERVAL
+    env = au1001.env_json or {}
+    LOGIN_USERNAME = env.get('LOGIN_USERNAME', LOGIN_USERNAME)
+    LOGIN_PASSWORD = env.get('LOGIN_PASSWORD', LOGIN_PASSWORD)
+    env_pctoken = env.get('PCTOKEN', env_pctoken)
+    BUN_CHART_SLEEP = float(env.get('BUN_CHART_SLEEP', BUN_CHART_SLEEP))
+    DAY_CHART_SLEEP = float(env.get('DAY_CHART_SLEEP', DAY_CHART_SLEEP))
+    BUN_CHARTS_INTERVAL = float(env.get('BUN_CHARTS_INTERVAL', BUN_CHARTS_INTERVAL))
+
+
+def on_env_json_changed(path):
+    """env.json changed: swap accounts in key_list and re-apply settings; tokens and caches of
+    unchanged accounts stay as they are."""
+    global key_list
+    added, removed, changed = reload_env_json()
+    key_list = get_key_list()
+    for ACCT in added:
+        order_count.setdefault(ACCT, {})
+    apply_env_config()
+    log_print('', '000000', f'{path} reloaded: added={added} removed={removed} changed={changed} '
+                            f'throttle bun={BUN_CHART_SLEEP} day={DAY_CHART_SLEEP} interval={BUN_CHARTS_INTERVAL}')
+
+
+WARM_STATE_FILE = 'warm_state.pkl'
+WARM_STATE_MAX_AGE = 300  # seconds; older minute charts / holdings are not restored
+
+
+def save_warm_state():
+    """Snapshot charts, upper limits and holdings so a restart can trade without waiting for the first sweep."""
+    try:
+        with bun_charts_lock:
+            bun = dict(bun_charts)
+            btimes = dict(bun_times)
+        with daily_charts_lock:
+            daily = dict(daily_charts)
+        state = {
+            'saved_at': time_module.time(),
+            'date': today_yyyymmdd,
+            'bun_charts': bun,
+            'bun_times': btimes,
+            'daily_charts': daily,
+            'upper_limits': dict(upper_limits),
+            'nxt_tradable': dict(nxt_tradable),
+            'stored_jango_data': stored_jango_data,
+            # access tokens stay in memory: get_token() issues them again after a restore
+            'stored_miche_data': {ACCT: {k: v for k, v in m.items() if k != 'TOKEN'}
+                                  for ACCT, m in stored_miche_data.items()},
+        }
+        tmp_file = WARM_STATE_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, WARM_STATE_FILE)
+        return True
+    except Exception as e:
+        print(f"Error saving warm state: {e}")
+        return False
+
+
+def load_warm_state():
+    """Restore the snapshot written by save_warm_state if it is from today.
+    Daily charts, upper limits and nxt_tradable are kept for the whole day;
+    minute charts and holdings only when younger than WARM_STATE_MAX_AGE."""
+    global stored_jango_data, stored_miche_data
+    if not os.path.exists(WARM_STATE_FILE):
+        return False
+    try:
+        with open(WARM_STATE_FILE, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('date') != today_yyyymmdd:
+            print(f"Warm state is from {state.get('date')}, ignoring")
+            return False
+        age = time_module.time() - state.get('saved_at', 0)
+        with daily_charts_lock:
+            for stk_cd, entry in state.get('daily_charts', {}).items():
+                daily_charts.setdefault(stk_cd, entry)
+        for stk_cd, price in state.get('upper_limits', {}).items():
+            upper_limits.setdefault(stk_cd, price)
+        for stk_cd, tradable in state.get('nxt_tradable', {}).items():
+            nxt_tradable.setdefault(stk_cd, tradable)
+        if age <= WARM_STATE_MAX_AGE:
+            with bun_charts_lock:
+                for stk_cd, chart in state.get('bun_charts', {}).items():
+                    if stk_cd not in bun_charts:
+                        bun_charts[stk_cd] = chart
+                        bun_times[stk_cd] = state.get('bun_times', {}).get(stk_cd)
+            if not stored_jango_data:
+                stored_jango_data = state.get('stored_jango_data') or {}
+            if not stored_miche_data:
+                miche = state.get('stored_miche_data') or {}
+                for ACCT, m in miche.items():
+                    m['TOKEN'] = get_token(ACCT)
+                stored_miche_data = miche
+        print(f"Restored warm state from {WARM_STATE_FILE} (age {age:.0f}s, "
+              f"{len(state.get('daily_charts', {}))} daily / "
+              f"{len(state.get('bun_charts', {})) if age <= WARM_STATE_MAX_AGE else 0} minute charts)")
+        return True
+    except Exception as e:
+        print(f"Error loading warm state: {e}")
+        return False
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown"""
@@ -2214,6 +2373,7 @@ async def lifespan(app: FastAPI):
 
     # Startup
     print("Starting application...")
+    logwriter.start(log_stock_name)
     # Initialize stored jango data - first try to load from file, then update
     log_print('', '000000', f'from lifespan calling set_new_day_true at {now}')
     set_new_day_true()
@@ -2225,6 +2385,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Error loading dictionaries: {e}")
 
+    load_warm_state()
+
+    apply_env_config()
+    configwatch.watch('env.json', on_env_json_changed)
+    configwatch.start()
+
     #fill_charts_for_CL(get_one_token()) # bun_charts is filled by thread.
 
     print("Initializing jango data...")
@@ -2313,6 +2479,13 @@ async def lifespan(app: FastAPI):
                 print("Background timer thread stopped successfully")
     except Exception as e:
         print(f"Error stopping background timer thread: {e}")
+
+    for shard in account_shards:
+        shard.shutdown(wait=False)
+    configwatch.stop()
+    logwriter.stop()
+    decisions.close()
+    save_warm_state()
     print("Application shutdown complete")
 
 # FastAPI app
@@ -2338,50 +2511,58 @@ def calculate_pl():
     total_pl = {}
     key_list = get_key_list()
     tdy_dt = today_yyyymmdd
+    futures = {}
     for k, key in key_list.items():
         ACCT = key['ACCT']
         MY_ACCESS_TOKEN = get_token(ACCT)  # 접근토큰
-        pl = get_pl(ACCT, MY_ACCESS_TOKEN, tdy_dt)
-        total_pl[ACCT] = pl
+        futures[ACCT] = submit_for_account(ACCT, get_pl, ACCT, MY_ACCESS_TOKEN, tdy_dt)
+    for ACCT, future in futures.items():
+        total_pl[ACCT] = future.result()
     save_total_pl(today_yyyymmdd, total_pl)
 
-def order_queued_buy(bqlen):
+def order_queued_buy():
+    """Send every queued buy whose trade window is open, dispatching the entries concurrently."""
     global buy_queue
-    for bidx in range(bqlen):
-        bq = buy_queue[bidx]
-        trde_begin_h = bq[0]
-        stk_cd = bq[1]
-        if trde_begin_h == 8 :
-            if not nxt_tradable.get(stk_cd, True):
+    eligible = []
+    with buy_queue_lock:
+        for bq in buy_queue:
+            stk_cd = bq[1]
+            if bq[0] == 8 and not nxt_tradable.get(stk_cd, True):
                 bq[0] = 9
-                trde_begin_h = 9
-                save_buy_queue_to_json()
-        if trde_begin_h == 8:
-            trde_end_h = 20
-        else:
-            trde_end_h = 16
+            trde_begin_h, trde_end_h = BUY_QUEUE_WINDOWS.get(bq[0], (bq[0], 16))
+            if now.hour >= trde_begin_h and now.hour < trde_end_h:  # trade_begin_hour
+                eligible.append(bq)
+    if not eligible:
+        return 0
 
-        if now.hour >= trde_begin_h and now.hour < trde_end_h:  # trade_begin_hour
-            stk_cd = bq[1]
-            stk_nm = bq[2]
-            ord_uv = bq[3]
-            ord_qty = bq[4]
-            accounts = bq[5]
-            stex = active_market() # bq[6]
-            trde_tp = bq[7]
-            log_print('', stk_cd,
-                      f"Try buy queued orders {bq[0]} o'clock : {ord_qty} shares of {stk_nm or stk_cd} at {ord_uv}")
-            results = call_issue_buy_order(stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp)
-            all_success = all(r.get('status') == 'success' for r in results)
-            if bq[0] == 8 and nxt_order_fail(stk_cd, results[0].get('ret_status', {})):
+    stex = active_market() # bq[6]
+    futures = {}
+    for bq in eligible:
+        trde_begin_h, stk_cd, stk_nm, ord_uv, ord_qty, accounts, _, trde_tp = bq
+        log_print('', stk_cd,
+                  f"Try buy queued orders {trde_begin_h} o'clock : {ord_qty} shares of {stk_nm or stk_cd} at {ord_uv}")
+        future = buy_queue_executor.submit(call_issue_buy_order, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp)
+        futures[future] = bq
+
+    for future in as_completed(futures):
+        bq = futures[future]
+        try:
+            results = future.result()
+        except Exception as e:
+            log_print('', bq[1], f'order_queued_buy error: {e}')
+            continue
+        with buy_queue_lock:
+            idx = next((i for i, b in enumerate(buy_queue) if b is bq), None)
+            if idx is None:  # deleted while the order was being sent
+                continue
+            if bq[0] == 8 and results and nxt_order_fail(bq[1], results[0].get('ret_status', {})):
                 # set trade begin hour to 9
-                buy_queue[bidx][0] = 9
-                save_buy_queue_to_json()
+                bq[0] = 9
             else:
                 # else delete that queued order
-                del buy_queue[bidx]
-                save_buy_queue_to_json()
-            break
+                del buy_queue[idx]
+    save_buy_queue_to_json()
+    return len(eligible)
 
 
 def equal_hh_mm(t1, t2):
@@ -2393,7 +2574,7 @@ def periodic_timer_handler():
     global prev_hour, new_day, stored_jango_data, stored_miche_data, working_status, now, cleanup_run_today
     global wait_hour_change, calculate_pl_today, new_day, day_change_time
 
-    now = datetime.now()
+    now = now_func()
     now_hour = now.hour
     now_time = now.time()
     # Check if it's 20:30 and cleanup hasn't run today
@@ -2433,10 +2614,9 @@ def periodic_timer_handler():
         elif equal_hh_mm(now_time, day_change_time) :
             set_new_day_false()
         elif is_between(now, nxt_start_time, nxt_fin_time_2000):
-            bqlen = len(buy_queue)
-            if bqlen > 0 :
+            if len(buy_queue) > 0 :
                 log_print('', '00000', 'call order_queued_buy')
-                order_queued_buy(bqlen)
+                order_queued_buy()
             daily_work()
     except Exception as ex:
         log_print('', '00000', str(ex))
@@ -3468,7 +3648,7 @@ async def clear_split_sell_protected_api(
 
 def cancel_related_buy_order(stk_cd):
     global stored_miche_data, jango_token
-    now = datetime.now()
+    now = now_func()
     cancel_count = 0
     for ACCT, miche in stored_miche_data.items():
         if 'oso' in miche:
@@ -3531,7 +3711,7 @@ def issue_buy_order(stk_nm, stk_cd, ord_uv, ord_qty, stex, trde_tp, account):
 
 
 def active_market():
-    now = datetime.now()
+    now = now_func()  # the virtual clock under replay.py
     if is_between(now, nxt_start_time, nxt_end_time):
         return 'NXT'
     if is_between(now, nxt_end_time, krx_start_time):  # NXT 끝나고 KRX 시작 전
@@ -3545,22 +3725,43 @@ def active_market():
 
 buy_queue = []
 BUY_QUEUE_FILE = 'buy_queue.json'
+buy_queue_lock = threading.RLock()
+# trade begin hour -> (begin, end) hours in which the queued order may be sent
+BUY_QUEUE_WINDOWS = {8: (8, 20), 9: (9, 16)}
+buy_queue_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='BuyQueue')
+# id(entry) -> (entry, state store row key); keys are zero-padded sequence numbers so rows load
+# in queue order. Holding the entry keeps its id from being reused by a new entry, and the
+# identity check below ignores a stale mapping all the same.
+buy_queue_keys = {}
+buy_queue_seq = 0
+
+
+def _buy_queue_rows():
+    """Return {row key: entry} for buy_queue, assigning keys to new entries."""
+    global buy_queue_seq, buy_queue_keys
+    rows = {}
+    keys = {}
+    with buy_queue_lock:
+        for bq in buy_queue:
+            known = buy_queue_keys.get(id(bq))
+            if known is not None and known[0] is bq:
+                key = known[1]
+            else:
+                buy_queue_seq += 1
+                key = f'{buy_queue_seq:09d}'
+            keys[id(bq)] = (bq, key)
+            rows[key] = list(bq)
+        buy_queue_keys = keys
+    return rows
 
 
 def save_buy_queue_to_json():
-    """Persist buy_queue to BUY_QUEUE_FILE."""
-    global buy_queue
+    """Persist buy_queue to the state store; only added, changed or removed entries are written."""
     try:
-        # Store as list-of-lists so entries stay mutable after reload
-        data = []
-        for bq in buy_queue:
-            try:
-                data.append(list(bq))
-            except TypeError:
-                continue
-        with open(BUY_QUEUE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Saved buy_queue to {BUY_QUEUE_FILE}: {len(data)} entries")
+        with buy_queue_lock:
+            rows = _buy_queue_rows()
+            changed = statedb.sync_table('buy_queue', rows)
+        print(f"Saved buy_queue to {statedb.STATE_DB_FILE}: {len(rows)} entries, {changed} rows written")
         return True
     except Exception as e:
         print(f"Error saving buy_queue: {e}")
@@ -3568,63 +3769,84 @@ def save_buy_queue_to_json():
         return False
 
 
+def _normalize_buy_queue_item(item):
+    """Return a [hour, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp] entry or None."""
+    if isinstance(item, list) and len(item) >= 8:
+        entry = list(item[:8])
+        # Ensure accounts is a list
+        accounts = entry[5]
+        if not isinstance(accounts, list):
+            if isinstance(accounts, str):
+                accounts = [a.strip() for a in accounts.split(',') if a.strip()]
+            else:
+                accounts = list(accounts) if accounts else []
+            entry[5] = accounts
+        return entry
+    elif isinstance(item, dict):
+        accounts = item.get('accounts', [])
+        if not isinstance(accounts, list):
+            if isinstance(accounts, str):
+                accounts = [a.strip() for a in accounts.split(',') if a.strip()]
+            else:
+                accounts = list(accounts) if accounts else []
+        return [
+            item.get('trade_begin_hour', 8),
+            item.get('stock_code') or item.get('stk_cd') or '',
+            item.get('stock_name') or item.get('stk_nm') or '',
+            item.get('price', item.get('ord_uv', 0)),
+            item.get('qty', item.get('ord_qty', 0)),
+            accounts,
+            item.get('market', item.get('stex', '')),
+            item.get('trade_type', item.get('trde_tp', '0')),
+        ]
+    return None
+
+
+def _convert_buy_queue_json(loaded):
+    """Turn the legacy BUY_QUEUE_FILE list into state store rows."""
+    normalized = []
+    if isinstance(loaded, list):
+        for item in loaded:
+            entry = _normalize_buy_queue_item(item)
+            if entry is not None:
+                normalized.append(entry)
+    else:
+        print(f"Invalid buy_queue file format; starting empty")
+    return {f'{i + 1:09d}': entry for i, entry in enumerate(normalized)}
+
+
 def load_buy_queue_from_json():
-    """Load buy_queue from BUY_QUEUE_FILE at startup."""
-    global buy_queue
-    if not os.path.exists(BUY_QUEUE_FILE):
-        buy_queue = []
-        print(f"No {BUY_QUEUE_FILE}; starting with empty buy_queue")
-        return
+    """Load buy_queue from the state store at startup."""
+    global buy_queue, buy_queue_keys, buy_queue_seq
+    normalized = []
+    keys = {}
     try:
-        with open(BUY_QUEUE_FILE, 'r', encoding='utf-8') as f:
-            loaded = json.load(f)
-        if not isinstance(loaded, list):
-            print(f"Invalid buy_queue file format; starting empty")
-            buy_queue = []
-            return
-        normalized = []
-        for item in loaded:
-            if isinstance(item, list) and len(item) >= 8:
-                entry = list(item[:8])
-                # Ensure accounts is a list
-                accounts = entry[5]
-                if not isinstance(accounts, list):
-                    if isinstance(accounts, str):
-                        accounts = [a.strip() for a in accounts.split(',') if a.strip()]
-                    else:
-                        accounts = list(accounts) if accounts else []
-                    entry[5] = accounts
+        statedb.migrate_json('buy_queue', BUY_QUEUE_FILE, convert=_convert_buy_queue_json)
+        rows = statedb.load_table('buy_queue')
+        for key in sorted(rows):
+            entry = _normalize_buy_queue_item(rows[key])
+            if entry is not None:
                 normalized.append(entry)
-            elif isinstance(item, dict):
-                accounts = item.get('accounts', [])
-                if not isinstance(accounts, list):
-                    if isinstance(accounts, str):
-                        accounts = [a.strip() for a in accounts.split(',') if a.strip()]
-                    else:
-                        accounts = list(accounts) if accounts else []
-                normalized.append([
-                    item.get('trade_begin_hour', 8),
-                    item.get('stock_code') or item.get('stk_cd') or '',
-                    item.get('stock_name') or item.get('stk_nm') or '',
-                    item.get('price', item.get('ord_uv', 0)),
-                    item.get('qty', item.get('ord_qty', 0)),
-                    accounts,
-                    item.get('market', item.get('stex', '')),
-                    item.get('trade_type', item.get('trde_tp', '0')),
-                ])
-        buy_queue = normalized
-        print(f"Loaded buy_queue from {BUY_QUEUE_FILE}: {len(buy_queue)} entries")
+                keys[id(entry)] = (entry, key)
+        with buy_queue_lock:
+            buy_queue = normalized
+            buy_queue_keys = keys
+            buy_queue_seq = max([int(k) for k in rows if k.isdigit()] or [0])
+        print(f"Loaded buy_queue from {statedb.STATE_DB_FILE}: {len(buy_queue)} entries")
     except Exception as e:
         print(f"Error loading buy_queue: {e}")
         traceback.print_exc()
-        buy_queue = []
+        with buy_queue_lock:
+            buy_queue = normalized
 
 
 def format_queued_buy():
     """Format buy_queue entries for API/UI display."""
     global buy_queue
     formatted = []
-    for idx, bq in enumerate(buy_queue):
+    with buy_queue_lock:
+        entries = [list(bq) for bq in buy_queue]
+    for idx, bq in enumerate(entries):
         try:
             trade_begin_hour, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp = bq
         except (TypeError, ValueError):
@@ -3664,9 +3886,10 @@ def delete_queued_buy(queue_index: int):
         idx = int(queue_index)
     except (TypeError, ValueError):
         return {"status": "error", "message": "Invalid queue index"}
-    if idx < 0 or idx >= len(buy_queue):
-        return {"status": "error", "message": f"Queue index {idx} not found"}
-    removed = buy_queue.pop(idx)
+    with buy_queue_lock:
+        if idx < 0 or idx >= len(buy_queue):
+            return {"status": "error", "message": f"Queue index {idx} not found"}
+        removed = buy_queue.pop(idx)
     save_buy_queue_to_json()
     try:
         trade_begin_hour, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp = removed
@@ -3687,6 +3910,8 @@ def call_issue_buy_order(stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_t
         try:
             ret_status = issue_buy_order(stk_nm, stk_cd, ord_uv, ord_qty, stex, trde_tp, account=account)
             log_print(account, stk_cd, ret_status)
+            decisions.record(account, stk_cd, 'QUEUED_BUY', 'order', {},
+                             {'market': stex, 'qty': ord_qty, 'price': ord_uv, 'trde_tp': trde_tp}, ret_status, ts=now)
             rc = ret_status.get('return_code') if isinstance(ret_status, dict) else None
             ok = _is_success_return_code(rc)
             results.append({
@@ -3773,7 +3998,9 @@ async def buy_order_api(request: dict, proxy_path: str = "", token: str = Cookie
             accounts = list(key_list.keys())
         print('buy_order_api accounts={}'.format(accounts))
 
-        buy_queue.append([8, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp])
+        entry = [8, stk_cd, stk_nm, ord_uv, ord_qty, accounts, stex, trde_tp]
+        with buy_queue_lock:
+            buy_queue.append(entry)
         save_buy_queue_to_json()
         msg = f"Buy orders queued for {8} o'clock : {ord_qty} shares of {stk_nm or stk_cd} at {ord_uv}"
         log_print('', stk_cd, msg)
@@ -4348,32 +4575,19 @@ def get_gap_price(token_for_api, stk_cd, stk_nm):
         cur_prc = latest.get('cur_prc', '0')
         current_price = abs(int(cur_prc))
 
-        # Get last 16 days
-        high_16 = 0
-        high_index = 0
-        high_date = ''
+        # 16-day high and the low of the 16 days up to it (same rule as the feature store)
         if len(day_data) < 16 :
             return {}
 
-        for data_idx in range(16) :
-            day = day_data[data_idx]
-            high_pric = int(day.get('high_pric', '0'))
-            if high_pric < 0:
-                high_pric = -high_pric
-            if high_pric > high_16:
-                high_16 = high_pric
-                high_index = data_idx
-                high_date = day['dt']
-
-        low_16 = float('inf')
-        last_16_days = day_data[high_index:high_index+16]
-        for day in last_16_days:
-            low_pric = int(day.get('low_pric', '0'))
-            if low_pric < 0:
-                low_pric = -low_pric
-            if low_pric < low_16:
-                low_16 = low_pric
-                low_date = day['dt']
+        bars = day_data[:31][::-1]  # oldest first; the low window reaches 15 days before the high
+        highs = [abs(int(day.get('high_pric', '0'))) for day in bars]
+        lows = [abs(int(day.get('low_pric', '0'))) for day in bars]
+        import features  # numpy + chartstore: loaded on the first gap price, not at startup
+        high_index, low_index = features.gap_range(highs, lows, 16)
+        high_16 = highs[high_index]
+        high_date = bars[high_index]['dt']
+        low_16 = lows[low_index]
+        low_date = bars[low_index]['dt']
 
         # Calculate yellow line price: high - (high - low) * 4 / 10
         gap = (high_16 - low_16) / 10
@@ -4527,6 +4741,30 @@ async def serve_upload_image_file(
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/decisions")
+@app.get("/stock/api/decisions")
+async def get_decisions_api(date: str = '', stock_code: str = '', start: str = '', end: str = '', kind: str = '',
+                            limit: int = 1000, token: str = Cookie(None, alias="stoken")):
+    """Look up decision journal records of one day (date=yyyymmdd, start/end=HHMMSS)"""
+    if not token or not verify_token(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    try:
+        yyyymmdd = date or today_yyyymmdd
+        data = await asyncio.to_thread(decisions.query, yyyymmdd, _normalize_stk_cd(stock_code) or None,
+                                       start or None, end or None, kind or None, limit)
+        return {"status": "success", "date": yyyymmdd, "count": len(data), "data": data}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/api/log-stats")
+@app.get("/stock/api/log-stats")
+async def get_log_stats():
+    """Log writer queue depth, drop and write counters"""
+    return {"status": "success", "data": logwriter.get_stats()}
+
 @app.get("/jango")
 async def get_jango_endpoint(market: str = 'KRX'):
     """Get account balance and holdings from stored data"""
@@ -0,0 +1,164 @@
+"""Background analytics jobs for datagather: a process pool with job ids, progress and cancel.
+
+submit(kind, func, shards, finish) runs func(*shard) for every shard in a spawned process
+pool (one worker per core by default), then finish(results) on the job's thread with the
+shard results in shard order; finish's return value becomes the job result. With
+on_result(i, result) each shard result is handed over as soon as it arrives instead and
+is not kept, so a job's output never has to fit in memory at once. The event loop only
+polls get() or awaits result_future(); it never runs the analytics itself.
+
+job (as returned by get()):
+{
+    "id": "3f2a9c1b04de", "kind": "make-bounce-csv", "params": {...},
+    "state": "queued" | "running" | "done" | "error" | "cancelled",
+    "total": shards, "done": finished shards, "progress": 0-100,
+    "created": iso, "started": iso, "finished": iso,
+    "result": finish() return value, "error": message
+}
+"""
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import spawnpool
+
+
+JOB_WORKERS = max(1, os.cpu_count() or 1)
+JOB_HISTORY = 50  # finished jobs kept for polling
+
+_pool = spawnpool.SpawnPool(JOB_WORKERS)
+_jobs = OrderedDict()  # job_id -> job dict (keys starting with '_' are internal)
+_jobs_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def configure(initializer=None, initargs=()):
+    """Set the worker initializer (e.g. bounce.init_worker, (store_dir,)) before the first job."""
+    _pool.initializer = initializer
+    _pool.initargs = initargs
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def submit(kind, func, shards, finish=None, params=None, on_result=None):
+    """Start a job over shards (a list of argument tuples for func); returns the job id."""
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'params': params or {},
+        'state': 'queued',
+        'total': len(shards),
+        'done': 0,
+        'progress': 0.0,
+        'created': _now(),
+        'started': None,
+        'finished': None,
+        'result': None,
+        'error': None,
+        '_future': Future(),
+        '_cancel': threading.Event(),
+        '_shard_futures': [],
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        finished = [k for k, j in _jobs.items() if j['finished']]
+        for k in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del _jobs[k]
+    threading.Thread(target=_run_job, args=(job, func, shards, finish, on_result), daemon=True, name=f'Job-{job_id}').start()
+    return job_id
+
+
+def _run_job(job, func, shards, finish, on_result):
+    job['state'] = 'running'
+    job['started'] = _now()
+    results = [None] * len(shards)
+    try:
+        if shards:
+            pool = _pool.get()
+            futures = {pool.submit(func, *shard): i for i, shard in enumerate(shards)}
+            job['_shard_futures'] = list(futures)
+            for fut in as_completed(futures):
+                if job['_cancel'].is_set():
+                    break
+                if on_result is not None:
+                    on_result(futures[fut], fut.result())
+                else:
+                    results[futures[fut]] = fut.result()
+                job['done'] += 1
+                job['progress'] = round(job['done'] * 100.0 / len(shards), 1)
+        if job['_cancel'].is_set():
+            raise JobCancelled()
+        result = finish(results) if finish is not None else results
+        job['result'] = result
+        job['progress'] = 100.0
+        job['state'] = 'done'
+        job['_future'].set_result(result)
+    except JobCancelled:
+        for fut in job['_shard_futures']:
+            fut.cancel()
+        job['state'] = 'cancelled'
+        job['_future'].set_exception(JobCancelled(job['id']))
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _pool.reset()
+        print(f"Error in background job {job['id']} ({job['kind']}): {e}")
+        job['state'] = 'error'
+        job['error'] = str(e)
+        job['_future'].set_exception(e)
+    finally:
+        job['finished'] = _now()
+
+
+def _public(job):
+    return {k: v for k, v in job.items() if not k.startswith('_')}
+
+
+def get(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return _public(job) if job else None
+
+
+def list_jobs():
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    # the list omits results, which can be large; get() returns them
+    return [{k: v for k, v in _public(j).items() if k != 'result'} for j in reversed(jobs)]
+
+
+def cancel(job_id):
+    """Stop a queued/running job: pending shards are dropped, running ones finish unused."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job or job['finished']:
+        return False
+    job['_cancel'].set()
+    for fut in job['_shard_futures']:
+        fut.cancel()
+    return True
+
+
+def result_future(job_id):
+    """concurrent.futures.Future resolved with the job result (await it with asyncio.wrap_future)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return job['_future'] if job else None
+
+
+def shutdown():
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    for job in jobs:
+        if not job['finished']:
+            job['_cancel'].set()
+    _pool.reset()
@@ -0,0 +1,338 @@
+"""Bounce analytics over the chart store, run in datagather's background job processes.
+
+Only chartstore, features (numpy) and the standard library are imported here, not
+datagather, so spawning a job worker stays cheap; every function takes plain arguments
+and returns JSON-ready values.
+"""
+from datetime import datetime, timedelta
+
+import chartstore
+import features
+
+
+def init_worker(store_dir):
+    """Process pool initializer: point the worker's chartstore at datagather's store."""
+    chartstore.STORE_DIR = store_dir
+
+
+def _price(price_str):
+    if not price_str:
+        return 0
+    cleaned = str(price_str).replace('+', '').replace('-', '').replace(',', '')
+    return abs(float(cleaned)) if cleaned else 0
+
+
+def compute_bounce_rows(stock_code, file_date_str):
+    """
+    Bounce-analysis CSV rows of one daily chart entry and its minute chart entry,
+    without the stock name column. Returns None when the entry could not be read.
+    """
+    try:
+        daily_data = chartstore.daily_records(stock_code, file_date_str)
+    except Exception as e:
+        print(f"Error reading daily chart {file_date_str}_{stock_code}: {e}")
+        return None
+    
+    if not isinstance(daily_data, list) or len(daily_data) == 0:
+        return []
+    
+    # Sort by date (old to new) - use only this entry's data
+    daily_data.sort(key=lambda x: x.get('dt', ''))
+
+    # Test 4 & 5: Load minute chart using the date of the daily chart entry
+    # Use only the minute chart entry that matches the date of the daily chart entry
+    if not chartstore.entry_exists(stock_code, file_date_str, 'minute'):
+        return []  # Skip if minute chart entry doesn't exist
+
+    try:
+        minute_data_all = chartstore.minute_records(stock_code, file_date_str)
+    except Exception as e:
+        print(f"Error reading minute chart {file_date_str}_{stock_code}: {e}")
+        return None
+
+    if not isinstance(minute_data_all, list) or len(minute_data_all) == 0:
+        return []
+
+    # Sort minute data by timestamp
+    minute_data_all.sort(key=lambda x: x.get('cntr_tm', ''))
+
+    min_date_in_minutes = minute_data_all[0].get('cntr_tm', '')[:8]
+
+    # Indicators over this entry's bars only (the entry is a snapshot, not the whole series)
+    closes = [_price(item.get('cur_prc', 0)) for item in daily_data]
+    moving_averages = {p: features.moving_average(closes, p, partial=True) for p in features.MA_PERIODS}
+    high16 = features.rolling_max([_price(item.get('high_pric', 0)) for item in daily_data])
+    low16 = features.rolling_min([_price(item.get('low_pric', 0)) for item in daily_data])
+
+    rows = []
+    if len(daily_data) < 16:
+        return rows
+    # Trace daily chart from old to new within this entry
+    prev_cur_prc = _price(daily_data[15].get('cur_prc', 0))
+    for current_idx in range(16, len(daily_data)-1):
+        current_item = daily_data[current_idx]
+        current_date = current_item.get('dt', '')
+
+        if not current_date or current_date < min_date_in_minutes :
+            continue
+            
+        current_high = _price(current_item.get('high_pric', 0))
+        current_trde_prica = _price(current_item.get('trde_prica', 0))
+        peak_rate = current_high / prev_cur_prc
+        prev_cur_prc = _price(current_item.get('cur_prc', 0))
+        if peak_rate < 0.12:
+            continue
+        # Test 1: Check if current day's high price is 16-day highest
+        max_high_in_window = float(high16[current_idx])
+        
+        if current_high != max_high_in_window:
+            continue  # Not highest, continue to next day
+        
+        # Test 2: Check if trading amount > 150000
+        if current_trde_prica <= 150000:
+            continue  # Not large enough, continue to next day
+        
+        # Calculate dif16, h16, l16, touch_price, gap
+        h16 = max_high_in_window
+        l16 = float(low16[current_idx])
+        dif16 = h16 - l16
+        touch_price = h16 - (dif16 / 10) * 4
+        gap = (h16 - l16) / 5
+        
+        # Test 4: During 2 data items after current day, find low price go under touch_price
+        # Get the dates from data items (current_idx + 1 and current_idx + 2)
+        if current_idx + 2 >= len(daily_data):
+            continue
+        
+        # Filter minute data for the 2 data items after (using their date values)
+        day_count = 0
+        enter_count = 0 # day_count when low price cross touch_price
+        enter_date = ''  # date when price crosses below touch_price
+        prev_dt_minute = ''
+        touched = False
+        low_bounce = None
+        # Check if high price goes over (low_bounce + gap) AND over touch_price
+        condition1_met = False  # high > (low_bounce + gap)
+        condition2_met = False  # high > touch_price
+        for item in minute_data_all:
+            # Extract date from cntr_tm (YYYYMMDDHHMMSS format)
+            cntr_tm = str(item.get('cntr_tm', ''))
+            if len(cntr_tm) >= 8:
+                item_date_str = cntr_tm[:8]
+            if item_date_str <= current_date:
+                continue
+
+            if item_date_str != prev_dt_minute:
+                prev_dt_minute = item_date_str
+                day_count += 1
+            if day_count >= 5:
+                break
+            low = _price(item.get('low_pric', 0))
+            if low_bounce is None or low < low_bounce:
+                low_bounce = low
+            if not touched : # test go below
+                if low < touch_price:
+                    enter_count = day_count
+                    enter_date = item_date_str  # Store the date when price crosses below touch_price
+                    touched = True
+            else: # touched
+                high = _price(item.get('high_pric', 0))
+                if high > (low_bounce + gap):
+                    condition1_met = True
+                if high > touch_price:
+                    condition2_met = True
+                if condition1_met and condition2_met:
+                    break
+        if not touched: # price never crossed down, or no minutes data for current_date
+            continue
+
+        # Tag as success if both conditions met, otherwise failure
+        is_success = condition1_met and condition2_met
+        success_failure = "success" if is_success else "failure"
+        
+        # Calculate moving averages at current day (using only this entry's data)
+        ma5, ma10, ma20, ma60, ma120 = (float(moving_averages[p][current_idx]) for p in features.MA_PERIODS)
+        
+        # Calculate ratios
+        ma5_10 = ma5 / ma10 if ma10 > 0 else 0
+        ma10_20 = ma10 / ma20 if ma20 > 0 else 0
+        ma20_60 = ma20 / ma60 if ma60 > 0 else 0
+        ma60_120 = ma60 / ma120 if ma120 > 0 else 0
+        
+        # Calculate gap/dif16
+        gap_dif16 = h16 / l16
+        
+        rows.append([
+            stock_code,
+            success_failure,
+            current_date,
+            enter_date,
+            enter_count,
+            f"{file_date_str}_{stock_code}.json",
+            f"{file_date_str}_{stock_code}_min.json",
+            f"{current_trde_prica:.2f}",
+            f"{peak_rate:.6f}",
+            f"{gap_dif16:.6f}",
+            f"{ma5:.2f}",
+            f"{ma10:.2f}",
+            f"{ma20:.2f}",
+            f"{ma60:.2f}",
+            f"{ma120:.2f}",
+            f"{ma5_10:.6f}",
+            f"{ma10_20:.6f}",
+            f"{ma20_60:.6f}",
+            f"{ma60_120:.6f}"
+        ])
+    return rows
+
+
+def compute_entries(entries):
+    """compute_bounce_rows for a shard of [stock_code, date] entries -> [[stock_code, date, rows]]."""
+    return [[stock_code, date_str, compute_bounce_rows(stock_code, date_str)] for stock_code, date_str in entries]
+
+
+def bounce_decision_tree(stock_code):
+    """Analyze bounce after peak in 16 days daily chart using minute chart data."""
+    # The stock's whole deduplicated daily series
+    all_daily_data = chartstore.daily_records(stock_code)
+    
+    if not all_daily_data:
+        return {"status": "error", "message": "No daily chart data found"}
+    
+    # Sort by date (oldest first)
+    all_daily_data.sort(key=lambda x: x.get('dt', ''))
+    
+    # Get last 16 days
+    last_16_days = all_daily_data[-16:] if len(all_daily_data) >= 16 else all_daily_data
+    
+    if not last_16_days:
+        return {"status": "error", "message": "Insufficient data for 16-day analysis"}
+    
+    # Find date with highest high_pric
+    highest_high = 0
+    peak_date = None
+    peak_high = 0
+    peak_low = 0
+    
+    for item in last_16_days:
+        high = _price(item.get('high_pric', 0))
+        low = _price(item.get('low_pric', 0))
+        if high > highest_high:
+            highest_high = high
+            peak_date = item.get('dt', '')
+            peak_high = high
+            peak_low = low
+    
+    if not peak_date:
+        return {"status": "error", "message": "Could not find peak date"}
+    
+    # Calculate 16-day range (highest - lowest)
+    all_highs = [_price(item.get('high_pric', 0)) for item in last_16_days]
+    all_lows = [_price(item.get('low_pric', 0)) for item in last_16_days]
+    range_16d = max(all_highs) - min(all_lows)
+    threshold = (1.0 / 5.0) * range_16d  # 2/5 of range
+    
+    # Get minute chart data for peak date and next 4 days
+    peak_datetime = datetime.strptime(peak_date, "%Y%m%d")
+    minute_data_all = []
+    
+    for day_offset in range(5):  # Peak day + next 4 days
+        check_date = peak_datetime + timedelta(days=day_offset)
+        check_date_str = check_date.strftime("%Y%m%d")
+        
+        try:
+            minute_data = chartstore.minute_records(stock_code, check_date_str)
+            for item in minute_data:
+                item['_analysis_date'] = check_date_str
+            minute_data_all.extend(minute_data)
+        except Exception as e:
+            print(f"Error reading minute chart {check_date_str}_{stock_code}: {e}")
+    
+    # Sort minute data by timestamp
+    minute_data_all.sort(key=lambda x: x.get('cntr_tm', ''))
+    
+    # Calculate bounce from minute chart
+    # Bounce = maximum recovery from low after peak
+    # Find the lowest point after peak, then find highest recovery
+    peak_minute_high = 0
+    lowest_after_peak = float('inf')
+    highest_recovery = 0
+    
+    found_peak = False
+    for item in minute_data_all:
+        item_date = item.get('_analysis_date', '')
+        if item_date == peak_date:
+            high = _price(item.get('high_pric', 0))
+            if high > peak_minute_high:
+                peak_minute_high = high
+            found_peak = True
+        elif found_peak:
+            low = _price(item.get('low_pric', 0))
+            high = _price(item.get('high_pric', 0))
+            if low < lowest_after_peak:
+                lowest_after_peak = low
+            # Calculate recovery from lowest point
+            if lowest_after_peak != float('inf'):
+                recovery = high - lowest_after_peak
+                if recovery > highest_recovery:
+                    highest_recovery = recovery
+    
+    # Determine success/failure
+    # Success: bounce >= 2/5 of 16-day range
+    # Failure: bounce < 2/5 of 16-day range within 4 days
+    is_success = highest_recovery >= threshold
+    result_type = "success" if is_success else "failure"
+    
+    # Build decision tree structure
+    decision_tree = {
+        "nodes": [
+            {
+                "id": "root",
+                "level": 0,
+                "type": "condition",
+                "title": "Peak Analysis",
+                "value": f"Peak Date: {peak_date}",
+                "label": f"Highest High: {highest_high:.2f}"
+            },
+            {
+                "id": "range",
+                "level": 1,
+                "type": "condition",
+                "title": "16-Day Range",
+                "value": f"{range_16d:.2f}",
+                "label": f"Threshold: {threshold:.2f} (2/5 of range)"
+            },
+            {
+                "id": "bounce",
+                "level": 2,
+                "type": "condition",
+                "title": "Bounce Calculation",
+                "value": f"{highest_recovery:.2f}",
+                "label": f"From minute chart data"
+            },
+            {
+                "id": "result",
+                "level": 3,
+                "type": result_type,
+                "title": result_type.upper(),
+                "value": "✓" if is_success else "✗",
+                "label": f"Bounce {'≥' if is_success else '<'} {threshold:.2f}"
+            }
+        ],
+        "edges": [
+            {"from": "root", "to": "range", "label": "16-day analysis"},
+            {"from": "range", "to": "bounce", "label": "Calculate bounce"},
+            {"from": "bounce", "to": "result", "label": f"{'≥' if is_success else '<'} threshold"}
+        ],
+        "analysis": {
+            "peak_date": peak_date,
+            "peak_high": peak_high,
+            "range_16d": range_16d,
+            "threshold": threshold,
+            "bounce": highest_recovery,
+            "result": result_type,
+            "lowest_after_peak": lowest_after_peak if lowest_after_peak != float('inf') else 0
+        }
+    }
+    
+    return {"status": "success", "data": decision_tree}
@@ -0,0 +1,433 @@
+"""OpenCV chart drawing for datagather's chart images (candles + MAs, MA comparison lines, tiles).
+
+Everything here is a pure function of its arguments, so it runs the same in datagather
+and in renderpool's worker processes, which import only this module (and numpy/cv2).
+
+A render spec (built by renderpool.candle_spec()/line_spec()/tile_spec(), which do not
+need cv2) is a plain dict of the render_candle()/render_line()/render_tile() arguments
+plus its 'kind':
+    candles  = [{'label', 'open', 'high', 'low', 'close'}] oldest first
+    ma_lines = [{'values': [...|None], 'color': (b, g, r), 'visible': bool}]
+    series   = [{'values': [...|None], 'color': (b, g, r)}]
+render_png(spec) draws and encodes it; render_batch(specs) does a list of them in one call.
+
+`check` renders a fixed set of synthetic charts and compares their pixels with
+REFERENCE_DIGESTS, taken from the per-candle cv2.line/cv2.rectangle renderer the
+vectorized one replaced (with a cv2 whose Hershey text or line drawing changed they
+need retaking). `bench` times drawing and encoding 600-bar charts.
+
+usage: python chartrender.py check
+       python chartrender.py bench [bars] [repeat]
+"""
+import sys
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import cv2
+
+
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_COL_BG = (255, 255, 255)
+_COL_AXIS = (221, 221, 221)
+_COL_GRID = (242, 242, 242)
+_COL_GRAY = (119, 119, 119)
+_COL_DIV = (0, 168, 224)        # date divider line
+_COL_DATE_TXT = (0, 0, 0)       # date label (black)
+_COL_RISE = (53, 57, 229)       # #e53935
+_COL_FALL = (229, 136, 30)      # #1e88e5
+_COL_REF = (187, 187, 187)      # comparison reference line
+_COL_ERROR = (40, 40, 220)
+
+
+def _put_text_right(img, s, rx, cy, color, scale=0.34):
+    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
+    cv2.putText(img, s, (int(rx - w), int(cy + h / 2)), _FONT, scale, color, 1, cv2.LINE_8)
+
+
+def _put_text_cx(img, s, cx, ty, color, scale=0.3):
+    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
+    cv2.putText(img, s, (int(cx - w / 2), int(ty + h)), _FONT, scale, color, 1, cv2.LINE_8)
+
+
+def _put_text_center(img, s, color=(136, 136, 136), scale=0.5):
+    height, width = img.shape[:2]
+    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
+    cv2.putText(img, s, (int((width - w) / 2), int((height + h) / 2)), _FONT, scale, color, 1, cv2.LINE_8)
+
+
+def _draw_x_labels(img, labels, xs, base_y):
+    n = len(labels)
+    step = max(1, n // 12)
+    for i in range(0, n, step):
+        raw = str(labels[i])
+        if len(raw) == 8:
+            txt = raw[4:6] + '/' + raw[6:8]
+        elif len(raw) >= 12:
+            txt = raw[4:6] + '/' + raw[6:8] + ' ' + raw[8:10] + ':' + raw[10:12]
+        else:
+            txt = raw
+        _put_text_cx(img, txt, int(xs[i]), base_y + 6, _COL_GRAY)
+
+
+def _px(values):
+    """Pixel coordinates of float positions, rounded half to even like round()."""
+    return np.rint(values).astype(np.int64)
+
+
+def _fill_bars(img, x0, y0, y1, colors, width):
+    """Fill the bars [x0, x0 + width) x [y0, y1] (inclusive rows, either order) with their
+    colors, clipped to the image: the pixels cv2.line (width 1) or a filled cv2.rectangle
+    would set, in one fancy-indexed assignment per column of the bar width."""
+    height, img_w = img.shape[:2]
+    top = np.maximum(np.minimum(y0, y1), 0)
+    bottom = np.minimum(np.maximum(y0, y1), height - 1)
+    lengths = np.maximum(bottom - top + 1, 0)
+    bar = np.repeat(np.arange(len(x0)), lengths)
+    rows = top[bar] + np.arange(len(bar)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    for dx in range(width):
+        cols = x0[bar] + dx
+        inside = (cols >= 0) & (cols < img_w)
+        img[rows[inside], cols[inside]] = colors[bar[inside]]
+
+
+def _draw_series(img, x_at, ys, color):
+    """Polylines through the runs of consecutive points with a y (NaN breaks a line);
+    x_at maps point indexes to pixel x."""
+    idx = np.flatnonzero(~np.isnan(ys))
+    if len(idx) < 2:
+        return
+    pts = np.stack([x_at(idx), _px(ys[idx])], axis=1).astype(np.int32)
+    runs = np.split(pts, np.flatnonzero(np.diff(idx) != 1) + 1)
+    runs = [run for run in runs if len(run) > 1]
+    if runs:
+        cv2.polylines(img, runs, False, color, 1, cv2.LINE_8)
+
+
+def _values(values):
+    """float64 array of series values with None as NaN."""
+    return np.array(values, dtype=np.float64).reshape(-1)
+
+
+def render_candle(candles, ma_lines, height, pole_width, pole_spacing, date_dividers):
+    """Render a candlestick chart (with optional MA overlays) to a BGR numpy image.
+    ma_lines = [{ 'values':[...|None], 'color':(b,g,r), 'visible':bool }]
+    Pixel coordinates are computed for all bars at once; wicks and bodies are filled as
+    bars (pole_width < pole_spacing - 1, so bars never overlap) and each MA is one polylines call.
+    """
+    left, right, top, bottom = 64, 24, 16, 42
+    n = len(candles)
+    chart_w = n * pole_spacing
+    width = max(left + chart_w + right, 400)
+    chart_h = height - top - bottom
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    if n == 0:
+        _put_text_center(img, 'No data')
+        return img
+
+    opens = np.array([c['open'] for c in candles], dtype=np.float64)
+    highs = np.array([c['high'] for c in candles], dtype=np.float64)
+    lows = np.array([c['low'] for c in candles], dtype=np.float64)
+    closes = np.array([c['close'] for c in candles], dtype=np.float64)
+    lines = [(_values(line['values']), line['color']) for line in ma_lines if line['visible']]
+
+    lo, hi = float('inf'), float('-inf')
+    if (highs > 0).any():
+        hi = float(highs[highs > 0].max())
+    if (lows > 0).any():
+        lo = float(lows[lows > 0].min())
+    for values, _color in lines:
+        values = values[~np.isnan(values)]
+        if len(values):
+            hi = max(hi, float(values.max()))
+            lo = min(lo, float(values.min()))
+    if lo == float('inf') or hi == float('-inf'):
+        lo, hi = 0.0, 100.0
+    if lo == hi:
+        lo *= 0.95
+        hi *= 1.05
+    pad = max((hi - lo) * 0.05, 1)
+    lo -= pad
+    hi += pad
+    rng = hi - lo
+    scale = chart_h / rng if rng > 0 else 1
+
+    def price_to_y(p):
+        return top + chart_h - (p - lo) * scale
+
+    def x_at(i):
+        return _px(left + i * pole_spacing + pole_width / 2)
+
+    xs = x_at(np.arange(n))
+
+    # Y gridlines + labels
+    ticks = 8
+    for i in range(ticks + 1):
+        price = hi - rng * (i / ticks)
+        y = int(round(price_to_y(price)))
+        cv2.line(img, (left, y), (left + chart_w, y), _COL_GRID, 1, cv2.LINE_8)
+        _put_text_right(img, format(int(round(price)), ','), left - 6, y, _COL_GRAY)
+
+    # Axes
+    cv2.line(img, (left, top), (left, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
+    cv2.line(img, (left, top + chart_h), (left + chart_w, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
+
+    # Date-change vertical dividers (minute charts)
+    if date_dividers:
+        days = np.array([str(c['label'])[:8] for c in candles])
+        for i in (np.flatnonzero(days[1:] != days[:-1]) + 1).tolist():
+            d = str(days[i])
+            x = int(round(left + i * pole_spacing))
+            cv2.line(img, (x, top), (x, top + chart_h), _COL_DIV, 1, cv2.LINE_8)
+            txt = (d[4:6] + '/' + d[6:8]) if len(d) == 8 else d
+            _put_text_cx(img, txt, x, top + 2, _COL_DATE_TXT)
+
+    # Candles: wick then body, in the candle's color
+    colors = np.where((closes >= opens)[:, None], np.array(_COL_RISE, dtype=np.uint8),
+                      np.array(_COL_FALL, dtype=np.uint8))
+    _fill_bars(img, xs, _px(price_to_y(highs)), _px(price_to_y(lows)), colors, 1)
+    oy, cy = _px(price_to_y(opens)), _px(price_to_y(closes))
+    ytop = np.minimum(oy, cy)
+    bh = np.maximum(1, np.abs(cy - oy))
+    x0 = _px(xs - pole_width / 2)
+    _fill_bars(img, x0, ytop, ytop + bh, colors, pole_width + 1)
+
+    # MA overlay lines
+    for values, color in lines:
+        _draw_series(img, x_at, price_to_y(values), color)
+
+    _draw_x_labels(img, [c['label'] for c in candles], xs, top + chart_h)
+    return img
+
+
+def render_line(labels, series, ref_value, height):
+    """Render a multi-series line chart (MA comparison) to a BGR numpy image.
+    series = [{ 'values':[...|None], 'color':(b,g,r) }]
+    """
+    left, right, top, bottom = 64, 24, 16, 42
+    pole_spacing = 7
+    n = len(labels)
+    chart_w = n * pole_spacing
+    width = max(left + chart_w + right, 400)
+    chart_h = height - top - bottom
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    if n == 0:
+        _put_text_center(img, 'No data')
+        return img
+
+    lines = [(_values(s['values']), s['color']) for s in series]
+
+    lo, hi = float('inf'), float('-inf')
+    for values, _color in lines:
+        values = values[~np.isnan(values)]
+        if len(values):
+            hi = max(hi, float(values.max()))
+            lo = min(lo, float(values.min()))
+    if ref_value is not None:
+        hi = max(hi, ref_value)
+        lo = min(lo, ref_value)
+    if lo == float('inf') or hi == float('-inf'):
+        lo, hi = 0.9, 1.1
+    if lo == hi:
+        lo *= 0.99
+        hi *= 1.01
+    pad = max((hi - lo) * 0.08, 0.001)
+    lo -= pad
+    hi += pad
+    rng = hi - lo
+    scale = chart_h / rng if rng > 0 else 1
+
+    def val_to_y(v):
+        return top + chart_h - (v - lo) * scale
+
+    def x_at(i):
+        return _px(left + i * pole_spacing)
+
+    xs = x_at(np.arange(n))
+
+    ticks = 6
+    for i in range(ticks + 1):
+        val = hi - rng * (i / ticks)
+        y = int(round(val_to_y(val)))
+        cv2.line(img, (left, y), (left + chart_w, y), _COL_GRID, 1, cv2.LINE_8)
+        _put_text_right(img, '{:.3f}'.format(val), left - 6, y, _COL_GRAY)
+
+    cv2.line(img, (left, top), (left, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
+    cv2.line(img, (left, top + chart_h), (left + chart_w, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
+
+    # Reference line (dashed): 6 pixels on, 3 off
+    if ref_value is not None and lo <= ref_value <= hi:
+        y = int(round(val_to_y(ref_value)))
+        if 0 <= y < height:
+            cols = np.arange(left, left + chart_w + 1)
+            phase = (cols - left) % 9
+            img[y, cols[(phase <= 5) & (cols - phase < left + chart_w)]] = _COL_REF
+
+    for values, color in lines:
+        _draw_series(img, x_at, val_to_y(values), color)
+
+    _draw_x_labels(img, labels, xs, top + chart_h)
+    return img
+
+
+def render_tile(bars, lo, hi, height, bar_px, body_px, tile_bars):
+    """Render one charttiles tile to a BGR numpy image: candles only, bar i at
+    x = i * bar_px + bar_px // 2, prices on a log scale from lo (bottom edge) to hi (top).
+    bars = {'open', 'high', 'low', 'close'} arrays (a charttiles OHLC array)."""
+    img = np.full((height, tile_bars * bar_px, 3), 255, dtype=np.uint8)
+    n = len(bars['close'])
+    if n == 0 or lo is None or hi is None or hi <= lo:
+        return img
+    log_lo, log_hi = np.log(lo), np.log(hi)
+    scale = height / (log_hi - log_lo)
+
+    def price_to_y(p):
+        p = np.asarray(p, dtype=np.float64)
+        return (log_hi - np.log(np.where(p > 0, p, lo))) * scale
+
+    opens, closes = np.asarray(bars['open']), np.asarray(bars['close'])
+    colors = np.where((closes >= opens)[:, None], np.array(_COL_RISE, dtype=np.uint8),
+                      np.array(_COL_FALL, dtype=np.uint8))
+    xs = np.arange(n) * bar_px + bar_px // 2
+    _fill_bars(img, xs, _px(price_to_y(bars['high'])), _px(price_to_y(bars['low'])), colors, 1)
+    oy, cy = _px(price_to_y(opens)), _px(price_to_y(closes))
+    ytop = np.minimum(oy, cy)
+    _fill_bars(img, xs - body_px // 2, ytop, ytop + np.maximum(1, np.abs(cy - oy)), colors, body_px)
+    return img
+
+
+def encode_png(img):
+    ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise RuntimeError('PNG encode failed')
+    return buf.tobytes()
+
+
+def render_png(spec):
+    """PNG bytes of the chart a spec describes."""
+    if spec['kind'] == 'candle':
+        img = render_candle(spec['candles'], spec['ma_lines'], spec['height'],
+                            spec['pole_width'], spec['pole_spacing'], spec['date_dividers'])
+    elif spec['kind'] == 'line':
+        img = render_line(spec['labels'], spec['series'], spec['ref_value'], spec['height'])
+    elif spec['kind'] == 'tile':
+        img = render_tile(spec['bars'], spec['lo'], spec['hi'], spec['height'],
+                          spec['bar_px'], spec['body_px'], spec['tile_bars'])
+    else:
+        raise ValueError(f"Unknown render spec kind: {spec['kind']}")
+    return encode_png(img)
+
+
+def render_batch(specs):
+    """[(True, png bytes) or (False, error message)] for the specs, in order; one failing
+    spec does not fail the others in its batch."""
+    results = []
+    for spec in specs:
+        try:
+            results.append((True, render_png(spec)))
+        except Exception as e:
+            results.append((False, f'{type(e).__name__}: {e}'))
+    return results
+
+
+def error_png(message, height, width=600):
+    """PNG of a blank chart-sized image with the message in the middle."""
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    _put_text_center(img, message, _COL_ERROR)
+    return encode_png(img)
+
+
+def synthetic_candles(n, seed=0, minute=False):
+    """n random-walk candles labelled like ka10081 (or ka10080 with minute=True) bars, for benchmarks."""
+    rng = np.random.default_rng(seed)
+    close = np.maximum(100.0, 50000.0 + np.cumsum(rng.normal(0, 400, n))).round()
+    open_ = np.maximum(100.0, close + rng.normal(0, 300, n)).round()
+    high = np.maximum(open_, close) + rng.integers(0, 500, n)
+    low = np.maximum(50.0, np.minimum(open_, close) - rng.integers(0, 500, n))
+    start = datetime(2024, 1, 2, 9, 0)
+    candles = []
+    for i in range(n):
+        if minute:
+            day, slot = divmod(i, 26)  # 26 fifteen-minute bars a session
+            label = (start + timedelta(days=day, minutes=15 * slot)).strftime('%Y%m%d%H%M%S')
+        else:
+            label = (start + timedelta(days=i)).strftime('%Y%m%d')
+        candles.append({'label': label, 'open': float(open_[i]), 'high': float(high[i]),
+                        'low': float(low[i]), 'close': float(close[i])})
+    return candles
+
+
+def _synthetic_ma(closes, period):
+    sums = np.concatenate([[0.0], np.cumsum(closes)])
+    return [None if i < period - 1 else float((sums[i + 1] - sums[i + 1 - period]) / period) for i in range(len(closes))]
+
+
+def _reference_inputs(bars):
+    """[(name, render function, args)] of the synthetic charts check() and bench() draw."""
+    daily = synthetic_candles(bars)
+    minute = synthetic_candles(bars, seed=1, minute=True)
+    closes = [c['close'] for c in daily]
+    colors = [(75, 25, 230), (44, 160, 44), (216, 99, 67), (49, 130, 245)]
+    mas = [_synthetic_ma(closes, p) for p in (5, 20, 60, 120)]
+    mas[1] = [None if 100 <= i < 110 else v for i, v in enumerate(mas[1])]  # a gap in a line
+    ma_lines = [{'values': m, 'color': c, 'visible': i != 2} for i, (m, c) in enumerate(zip(mas, colors))]
+    series = [{'values': [v / b if v is not None and b else None for v, b in zip(m, mas[3])], 'color': c}
+              for m, c in zip(mas, colors)]
+    return [
+        ('daily', render_candle, (daily, ma_lines, 440, 4, 7, False)),
+        ('compare', render_line, ([c['label'] for c in daily], series, 1.0, 260)),
+        ('minute', render_candle, (minute, [], 380, 3, 5, True)),
+        ('short', render_candle, (daily[:3], ma_lines[:1], 440, 4, 7, False)),
+        ('empty', render_line, ([], [], 1.0, 260)),
+    ]
+
+
+def image_digest(img):
+    return hashlib.sha1(repr(img.shape).encode('ascii') + img.tobytes()).hexdigest()
+
+
+REFERENCE_DIGESTS = {
+    'daily': 'd3e6a82b856ef7e55eac6f3e3c987e70a79c403e',
+    'compare': 'e14392fa046edbfc7dd95eee649428b15f34de1d',
+    'minute': 'f22f1067092372fb916287b8f8e7f45f658341ae',
+    'short': '48771adaf5902c7ca71a398d6c6408e6343858f3',
+    'empty': '45a4d8ae6a0badd53a9a34dd312ec5bdaeffe09d',
+}
+
+
+def check():
+    """{name: True/False}: whether each reference chart still draws its reference pixels."""
+    return {name: image_digest(func(*args)) == REFERENCE_DIGESTS.get(name)
+            for name, func, args in _reference_inputs(600)}
+
+
+def bench(bars=600, repeat=20):
+    """Milliseconds per chart to draw and to PNG-encode the daily, compare and minute reference charts."""
+    result = {'bars': bars, 'repeat': repeat}
+    for name, func, args in _reference_inputs(bars)[:3]:
+        t = time.perf_counter()
+        for _ in range(repeat):
+            img = func(*args)
+        draw = (time.perf_counter() - t) / repeat
+        t = time.perf_counter()
+        for _ in range(repeat):
+            encode_png(img)
+        encode = (time.perf_counter() - t) / repeat
+        result[name] = {'draw_ms': round(draw * 1000, 2), 'encode_ms': round(encode * 1000, 2)}
+    return result
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    args = sys.argv[2:]
+    if command == 'check':
+        results = check()
+        print(json.dumps(results, indent=2))
+        sys.exit(0 if all(results.values()) else 1)
+    elif command == 'bench':
+        print(json.dumps(bench(int(args[0]) if args else 600, int(args[1]) if len(args) > 1 else 20), indent=2))
+    else:
+        print(__doc__.split('usage: ')[1])
+        sys.exit(1)
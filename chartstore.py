@@ -0,0 +1,940 @@
+"""Per-stock columnar chart store for datagather.
+
+chart_data/store/<code>/
+    daily.npy     one deduplicated ka10081 series, structured int64 columns, sorted by dt
+    minute.npy    one deduplicated ka10080 series, sorted by cntr_tm
+    daily.versions.npy / minute.versions.npy
+                  earlier contents of bars a later entry overwrote, with the date of that entry
+    daily.cold.npz / minute.cold.npz
+                  rows older than the hot file, moved there by compact(); one zlib-deflated,
+                  delta-encoded block per column
+    features.npy  daily indicators materialized by features.py
+chart_data/store/manifest.db (SQLite, WAL)
+    entries       (stock_code, date, series) -> first/last key, bar count and save time of the entry
+    stocks        stock_code -> name, bar counts and last bar time of both series
+
+An entry is what used to be one YYYYMMDD_code.json / YYYYMMDD_code_min.json pair:
+the rows it covered are the [first, last] key range of the merged series. Each (stock, key)
+bar is stored once; when a save changes a bar, the old content goes to the versions file,
+and read_entry() puts it back for entries older than the change, so every entry still
+reads the bars that were visible on its date.
+Writers update the manifest in one transaction per save while holding the stock's lock;
+listings and lookups are indexed queries on it, so they cost O(result) rather than a
+scan of the store.
+Reads memory-map the .npy files and slice them with searchsorted, so a range read
+is a view into the page cache rather than a parse.
+
+Bars older than the 10-day minute-fetch window never change again, so compact_all()
+moves them into the .cold.npz files. read_range() stitches cold and hot rows together,
+so callers do not see the tier; a cold block is decompressed on first use and kept in a
+small LRU cache.
+
+Writes that only append bars are done in place: the new rows are first written to
+<series>.npy.tail (temp file + rename), then appended to the .npy and the row count in
+its header is bumped, then the .tail file is removed. A .tail left by a crash is
+replayed before the next read or write. Rows already in the file are never changed in
+place, since other processes (bgjobs workers) may hold memory maps of it: anything that
+changes one (the last bar updated, backfilling older bars, deletes) rewrites the whole
+file through a temp file and os.replace, and existing maps keep the old file.
+
+Writes, compaction and tail replays hold the stock's lock: a thread lock plus, where
+fcntl exists, an flock on <code>/.lock, so a reader in another process never replays a
+tail the writer is still applying.
+
+usage: python chartstore.py migrate [chart_dir] [--remove]
+       python chartstore.py dedup [chart_dir]
+       python chartstore.py compact [days]
+       python chartstore.py bench [days] [stock_code ...]
+"""
+import os
+import sys
+import json
+import struct
+import sqlite3
+import threading
+import time as time_module
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: the per-process thread lock only
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(BASE_DIR, 'chart_data', 'store')
+LEGACY_CHART_DIR = os.path.join(BASE_DIR, 'chart_data', 'day')
+MIGRATED_MARKER = '.migrated'
+MANIFEST_FILE = 'manifest.db'
+LOCK_FILE = '.lock'
+HEADER_SPARE = 32  # spare .npy header bytes so the row count can grow in place
+COLD_AFTER_DAYS = 10  # same window as datagather's minute fetch
+COLD_CACHE_MAX = 32  # decoded cold series kept in memory
+
+DAILY_FIELDS = ['dt', 'cur_prc', 'open_pric', 'high_pric', 'low_pric', 'trde_qty', 'trde_prica']
+MINUTE_FIELDS = ['cntr_tm', 'cur_prc', 'open_pric', 'high_pric', 'low_pric', 'trde_qty']
+DAILY_DTYPE = np.dtype([(f, '<i8') for f in DAILY_FIELDS])
+MINUTE_DTYPE = np.dtype([(f, '<i8') for f in MINUTE_FIELDS])
+SERIES = {
+    'daily': ('daily.npy', DAILY_DTYPE, 'dt'),
+    'minute': ('minute.npy', MINUTE_DTYPE, 'cntr_tm'),
+}
+
+_locks = {}
+_locks_lock = threading.Lock()
+_flocks = {}  # stock_code -> [fd, depth] while this process holds the stock's file lock
+_mmap_cache = {}  # path -> ((mtime_ns, size), array)
+_mmap_cache_lock = threading.Lock()
+_tails = {}  # path -> {'rows': n, 'offset': data offset, 'header_len': bytes, 'last': last key}
+_cold_cache = OrderedDict()  # path -> ((mtime_ns, size), array), LRU
+_cold_cache_lock = threading.Lock()
+_local = threading.local()
+_imported = set()  # store dirs whose entries.json files were moved into the manifest
+
+
+def _thread_lock(stock_code):
+    with _locks_lock:
+        lock = _locks.get(stock_code)
+        if lock is None:
+            lock = _locks[stock_code] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def _stock_lock(stock_code):
+    """Hold the stock against other threads and other processes (re-entrant in a thread)."""
+    with _thread_lock(stock_code):
+        held = _flocks.get(stock_code)
+        if held is None and fcntl is not None:
+            d = _stock_dir(stock_code)
+            os.makedirs(d, exist_ok=True)
+            fd = os.open(os.path.join(d, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            held = _flocks[stock_code] = [fd, 0]
+        if held is not None:
+            held[1] += 1
+        try:
+            yield
+        finally:
+            if held is not None:
+                held[1] -= 1
+                if held[1] == 0:
+                    del _flocks[stock_code]
+                    fcntl.flock(held[0], fcntl.LOCK_UN)
+                    os.close(held[0])
+
+
+def _stock_dir(stock_code):
+    return os.path.join(STORE_DIR, stock_code)
+
+
+def _to_int(v):
+    """'+70,000' / '-69000' / '' -> int, keeping the sign the API sent."""
+    try:
+        return int(str(v).replace(',', '').strip() or 0)
+    except ValueError:
+        try:
+            return int(float(str(v).replace(',', '')))
+        except ValueError:
+            return 0
+
+
+def _records_to_array(records, dtype, key):
+    rows = []
+    for r in records or []:
+        if not isinstance(r, dict) or not r.get(key):
+            continue
+        rows.append(tuple(_to_int(r.get(f)) for f in dtype.names))
+    return np.array(rows, dtype=dtype)
+
+
+def to_records(arr):
+    """Structured rows -> list of dicts with string values, shaped like the ka10081/ka10080 rows."""
+    names = arr.dtype.names
+    cols = [arr[f].tolist() for f in names]
+    return [{f: str(v) for f, v in zip(names, vals)} for vals in zip(*cols)]
+
+
+def _series_path(stock_code, series):
+    return os.path.join(_stock_dir(stock_code), SERIES[series][0])
+
+
+def _load(stock_code, series, mmap=True):
+    _filename, dtype, _key = SERIES[series]
+    path = _series_path(stock_code, series)
+    if os.path.exists(path + '.tail'):
+        # waits for a writer still applying it; _replay_tail finds nothing left then
+        with _stock_lock(stock_code):
+            _replay_tail(path)
+    try:
+        st = os.stat(path)
+        sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return np.empty(0, dtype=dtype)
+    if not mmap:
+        return np.load(path)
+    with _mmap_cache_lock:
+        cached = _mmap_cache.get(path)
+        if cached and cached[0] == sig:
+            return cached[1]
+    arr = np.load(path, mmap_mode='r')
+    with _mmap_cache_lock:
+        _mmap_cache[path] = (sig, arr)
+    return arr
+
+
+def _npy_header(dtype, rows, size=None):
+    """A version 1.0 .npy header for a 1-d array of rows, padded to size bytes
+    (default: a multiple of 64 with HEADER_SPARE bytes to grow). None when it does not fit."""
+    text = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), rows)
+    if size is None:
+        size = -(-(10 + len(text) + 1 + HEADER_SPARE) // 64) * 64
+    pad = size - 10 - len(text) - 1
+    if pad < 0:
+        return None
+    body = (text + ' ' * pad + '\n').encode('latin1')
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(body)) + body
+
+
+def _tail_info(path, key):
+    """Row count, data offset, header size and last key of a series file (cached)."""
+    info = _tails.get(path)
+    if info is not None:
+        return info
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _fortran, _dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _fortran, _dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    arr = np.load(path, mmap_mode='r')
+    info = {
+        'rows': shape[0],
+        'offset': offset,
+        'header_len': offset if version == (1, 0) else 0,  # only 1.0 headers are rewritten in place
+        'last': int(arr[key][-1]) if len(arr) else None,
+    }
+    _tails[path] = info
+    return info
+
+
+def _write_array(stock_code, series, arr):
+    _filename, dtype, key = SERIES[series]
+    d = _stock_dir(stock_code)
+    os.makedirs(d, exist_ok=True)
+    path = _series_path(stock_code, series)
+    tmp = path + '.tmp'
+    header = _npy_header(dtype, len(arr))
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+    os.replace(tmp, path)
+    _tails[path] = {
+        'rows': len(arr),
+        'offset': len(header),
+        'header_len': len(header),
+        'last': int(arr[key][-1]) if len(arr) else None,
+    }
+
+
+def _apply_tail(path, row, rows, data):
+    """Write data over the file from row on and set the header row count to rows."""
+    _filename, dtype, key = next(v for v in SERIES.values() if path.endswith(v[0]))
+    info = _tail_info(path, key)
+    header = _npy_header(dtype, rows, info['header_len'])
+    with open(path, 'r+b') as f:
+        f.seek(info['offset'] + row * dtype.itemsize)
+        f.write(data)
+        f.seek(0)
+        f.write(header)
+        f.flush()
+        os.fsync(f.fileno())
+    info['rows'] = rows
+    tail = np.frombuffer(data, dtype=dtype)
+    if len(tail):
+        info['last'] = int(tail[key][-1])
+
+
+def _replay_tail(path):
+    """Finish an in-place tail write interrupted by a crash (idempotent)."""
+    tail_path = path + '.tail'
+    if not os.path.exists(tail_path):
+        return
+    try:
+        with open(tail_path, 'rb') as f:
+            row, rows = struct.unpack('<qq', f.read(16))
+            data = f.read()
+        _apply_tail(path, row, rows, data)
+        os.remove(tail_path)
+        print(f"Replayed chart tail write for {path}")
+    except Exception as e:
+        print(f"Error replaying chart tail {tail_path}: {e}")
+
+
+def _write_tail(stock_code, series, row, rows, tail):
+    """Replace rows [row, ...) of the series file with tail, leaving rows rows in total."""
+    path = _series_path(stock_code, series)
+    tail_path = path + '.tail'
+    data = np.ascontiguousarray(tail).tobytes()
+    tmp = tail_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack('<qq', row, rows))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, tail_path)
+    _apply_tail(path, row, rows, data)
+    os.remove(tail_path)
+
+
+def _versions_path(stock_code, series):
+    return os.path.join(_stock_dir(stock_code), series + '.versions.npy')
+
+
+def _versions_dtype(series):
+    return np.dtype(SERIES[series][1].descr + [('replaced_at', '<i8')])
+
+
+def _load_versions(stock_code, series):
+    path = _versions_path(stock_code, series)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=_versions_dtype(series))
+    return np.load(path)
+
+
+def _record_versions(stock_code, series, old, merged, date_str):
+    """Keep the old content of rows whose key is in merged with different values."""
+    _filename, dtype, key = SERIES[series]
+    if len(old) == 0:
+        return
+    idx = np.searchsorted(merged[key], old[key])  # a merge never drops keys
+    changed = old[merged[idx] != old]
+    if len(changed) == 0:
+        return
+    versions = np.empty(len(changed), dtype=_versions_dtype(series))
+    for f in dtype.names:
+        versions[f] = changed[f]
+    versions['replaced_at'] = int(date_str)
+    versions = np.concatenate([_load_versions(stock_code, series), versions])
+    path = _versions_path(stock_code, series)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, versions)
+    os.replace(tmp, path)
+
+
+def _merge_tail(stock_code, series, new, date_str):
+    """In-place append when new only adds rows after the end of the series (rows it
+    overlaps unchanged). Returns (updated, added, total), or None when a full rewrite is needed."""
+    _filename, dtype, key = SERIES[series]
+    path = _series_path(stock_code, series)
+    _replay_tail(path)
+    info = _tail_info(path, key)
+    if info is None or not info['header_len'] or info['last'] is None:
+        return None
+    if _npy_header(dtype, info['rows'] + len(new), info['header_len']) is None:
+        return None
+    n = info['rows']
+    new_min = int(new[key].min())
+    if new_min > info['last']:
+        pos, old_tail = n, np.empty(0, dtype=dtype)  # pure append: no old rows are read
+    else:
+        old = np.load(path, mmap_mode='r')
+        pos = int(np.searchsorted(old[key], new_min, side='left'))
+        if n - pos > len(new):
+            return None  # new rows reach back past the tail
+        old_tail = np.array(old[pos:])
+    combined = np.concatenate([new[::-1], old_tail])  # newest first so np.unique keeps it
+    _keys, idx = np.unique(combined[key], return_index=True)
+    merged = combined[idx]
+    added = len(merged) - len(old_tail)
+    updated = len(np.unique(new[key])) - added
+    same = len(old_tail)
+    if not np.array_equal(merged[:same], old_tail):
+        return None  # a stored row changed: other processes may have the file mapped
+    if added:
+        _write_tail(stock_code, series, n, n + added, merged[same:])
+    return updated, added, n + added
+
+
+def _cold_path(stock_code, series):
+    return os.path.join(_stock_dir(stock_code), series + '.cold.npz')
+
+
+def _load_cold(stock_code, series):
+    """The decoded cold rows of a series (empty when nothing was compacted)."""
+    _filename, dtype, _key = SERIES[series]
+    path = _cold_path(stock_code, series)
+    try:
+        st = os.stat(path)
+        sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return np.empty(0, dtype=dtype)
+    with _cold_cache_lock:
+        cached = _cold_cache.get(path)
+        if cached and cached[0] == sig:
+            _cold_cache.move_to_end(path)
+            return cached[1]
+    with np.load(path) as z:
+        arr = np.empty(len(z[dtype.names[0]]), dtype=dtype)
+        for f in dtype.names:
+            arr[f] = np.cumsum(z[f])
+    arr.flags.writeable = False
+    with _cold_cache_lock:
+        _cold_cache[path] = (sig, arr)
+        while len(_cold_cache) > COLD_CACHE_MAX:
+            _cold_cache.popitem(last=False)
+    return arr
+
+
+def _write_cold(stock_code, series, arr):
+    path = _cold_path(stock_code, series)
+    if len(arr) == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        # deltas of sorted keys and neighbouring prices are small numbers that deflate well
+        np.savez_compressed(f, **{name: np.diff(arr[name], prepend=0) for name in arr.dtype.names})
+    os.replace(tmp, path)
+
+
+def _load_all(stock_code, series):
+    """Cold rows below the hot file followed by the hot rows, as one in-memory array."""
+    _filename, _dtype, key = SERIES[series]
+    hot = _load(stock_code, series, mmap=False)
+    cold = _load_cold(stock_code, series)
+    if len(cold) and len(hot):
+        cold = cold[cold[key] < hot[key][0]]
+    return np.concatenate([cold, hot]) if len(cold) else hot
+
+
+def _write_all(stock_code, series, arr):
+    """Write a whole series, keeping rows up to the current cold boundary in the cold file."""
+    _filename, _dtype, key = SERIES[series]
+    cold = _load_cold(stock_code, series)
+    if len(cold):
+        n = int(np.searchsorted(arr[key], int(cold[key][-1]), side='right'))
+        if not np.array_equal(arr[:n], cold):
+            _write_cold(stock_code, series, arr[:n])
+        arr = arr[n:]
+    _write_array(stock_code, series, arr)
+
+
+def compact(stock_code, series, cutoff):
+    """Move rows with key < cutoff from the hot file into the cold file. Returns rows moved."""
+    _filename, _dtype, key = SERIES[series]
+    with _stock_lock(stock_code):
+        _replay_tail(_series_path(stock_code, series))
+        hot = _load(stock_code, series)
+        n = int(np.searchsorted(hot[key], int(cutoff), side='left')) if len(hot) else 0
+        if n == 0:
+            return 0
+        hot = _load(stock_code, series, mmap=False)
+        cold = _load_cold(stock_code, series)
+        cold = np.concatenate([cold[cold[key] < hot[key][0]], hot[:n]])
+        # cold first: after a crash in between, the rows are in both files and read_range
+        # drops the cold copies
+        _write_cold(stock_code, series, cold)
+        _write_array(stock_code, series, hot[n:])
+        return n
+
+
+def cold_cutoffs(days=COLD_AFTER_DAYS, now=None):
+    """{series: first key that stays hot} for rows older than days."""
+    day = ((now or datetime.now()) - timedelta(days=days)).strftime('%Y%m%d')
+    return {'daily': int(day), 'minute': int(day + '000000')}
+
+
+def compact_all(days=COLD_AFTER_DAYS, now=None, stop_event=None):
+    """Compact every stock in the manifest. Returns {'stocks': n, 'rows': moved}."""
+    cutoffs = cold_cutoffs(days, now)
+    summary = {'stocks': 0, 'rows': 0, 'errors': 0}
+    codes = [r[0] for r in _conn().execute('SELECT stock_code FROM stocks ORDER BY stock_code').fetchall()]
+    for stock_code in codes:
+        if stop_event is not None and stop_event.is_set():
+            break
+        try:
+            moved = sum(compact(stock_code, series, cutoffs[series]) for series in SERIES)
+            if moved:
+                summary['stocks'] += 1
+                summary['rows'] += moved
+        except Exception as e:
+            summary['errors'] += 1
+            print(f"Error compacting chart data for {stock_code}: {e}")
+    return summary
+
+
+def _conn():
+    """Thread-local connection to the manifest of the current STORE_DIR."""
+    path = os.path.join(STORE_DIR, MANIFEST_FILE)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != path:
+        os.makedirs(STORE_DIR, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                     'stock_code TEXT NOT NULL, date TEXT NOT NULL, series TEXT NOT NULL, '
+                     'first_key INTEGER NOT NULL, last_key INTEGER NOT NULL, rows INTEGER NOT NULL, '
+                     'saved_at INTEGER NOT NULL DEFAULT 0, '
+                     'PRIMARY KEY (stock_code, date, series))')
+        if 'saved_at' not in [r[1] for r in conn.execute('PRAGMA table_info(entries)').fetchall()]:
+            conn.execute('ALTER TABLE entries ADD COLUMN saved_at INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_series ON entries (series, stock_code, date)')
+        conn.execute('CREATE TABLE IF NOT EXISTS stocks ('
+                     'stock_code TEXT PRIMARY KEY, stock_name TEXT, '
+                     'daily_rows INTEGER NOT NULL DEFAULT 0, minute_rows INTEGER NOT NULL DEFAULT 0, '
+                     'last_dt INTEGER, last_cntr_tm INTEGER)')
+        conn.commit()
+        _local.conn = conn
+        _local.path = path
+        if STORE_DIR not in _imported:
+            _imported.add(STORE_DIR)
+            _import_entries_json(conn)
+    return conn
+
+
+def _import_entries_json(conn):
+    """Move <code>/entries.json files (stores written before the manifest) into it."""
+    if not os.path.isdir(STORE_DIR):
+        return
+    for stock_code in os.listdir(STORE_DIR):
+        path = os.path.join(STORE_DIR, stock_code, 'entries.json')
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            with _stock_lock(stock_code), conn:
+                for date_str, entry in entries.items():
+                    for series, (lo, hi) in entry.items():
+                        _put_entry(conn, stock_code, date_str, series, lo, hi)
+                for series in SERIES:
+                    _put_stock(conn, stock_code, series)
+            os.remove(path)
+        except Exception as e:
+            print(f"Error importing chart entries for {stock_code}: {e}")
+
+
+def _put_entry(conn, stock_code, date_str, series, lo, hi):
+    arr = read_range(stock_code, series, lo, hi)
+    conn.execute('INSERT OR REPLACE INTO entries (stock_code, date, series, first_key, last_key, rows, saved_at) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (stock_code, date_str, series, int(lo), int(hi), len(arr), time_module.time_ns()))
+
+
+def _put_stock(conn, stock_code, series):
+    """Refresh the stock row's bar count and last bar time for series."""
+    _filename, _dtype, key = SERIES[series]
+    rows, last = series_size(stock_code, series)
+    conn.execute('INSERT OR IGNORE INTO stocks (stock_code) VALUES (?)', (stock_code,))
+    conn.execute(f'UPDATE stocks SET {series}_rows = ?, last_{key} = ? WHERE stock_code = ?',
+                 (rows, last, stock_code))
+
+
+def series_size(stock_code, series):
+    """(rows, last key) of a whole series, hot and cold."""
+    _filename, _dtype, key = SERIES[series]
+    hot = _load(stock_code, series)
+    rows = len(hot)
+    if os.path.exists(_cold_path(stock_code, series)):
+        cold = _load_cold(stock_code, series)
+        rows += len(cold) if not len(hot) else int(np.searchsorted(cold[key], int(hot[key][0])))
+        if not len(hot):
+            hot = cold
+    return rows, (int(hot[key][-1]) if len(hot) else None)
+
+
+def series_signature(stock_code, series):
+    """(mtime_ns, size) of the hot and cold files: changes whenever a save or compact touches the series."""
+    sig = []
+    for path in (_series_path(stock_code, series), _cold_path(stock_code, series)):
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def load_entries(stock_code):
+    """{YYYYMMDD: {series: [first_key, last_key]}} of one stock."""
+    entries = {}
+    rows = _conn().execute('SELECT date, series, first_key, last_key FROM entries WHERE stock_code = ?',
+                           (stock_code,)).fetchall()
+    for date_str, series, lo, hi in rows:
+        entries.setdefault(date_str, {})[series] = [lo, hi]
+    return entries
+
+
+def manifest_entries(series='daily', stock_code=None):
+    """Manifest rows of every entry with the given series (optionally of one stock), by code and date."""
+    sql = ('SELECT e.stock_code, e.date, e.first_key, e.last_key, e.rows, s.stock_name '
+           'FROM entries e LEFT JOIN stocks s ON s.stock_code = e.stock_code WHERE e.series = ?')
+    args = [series]
+    if stock_code is not None:
+        sql += ' AND e.stock_code = ?'
+        args.append(stock_code)
+    sql += ' ORDER BY e.stock_code, e.date'
+    return [
+        {'stock_code': code, 'date': date_str, 'first': lo, 'last': hi, 'rows': n, 'stock_name': name or ''}
+        for code, date_str, lo, hi, n, name in _conn().execute(sql, args).fetchall()
+    ]
+
+
+def entry_fingerprints():
+    """{(stock_code, date): fingerprint} of every entry; the fingerprint changes whenever
+    a save touches the entry's daily or minute series."""
+    result = {}
+    rows = _conn().execute('SELECT stock_code, date, series, first_key, last_key, rows, saved_at FROM entries '
+                           'ORDER BY stock_code, date, series').fetchall()
+    for stock_code, date_str, series, lo, hi, n, saved_at in rows:
+        part = f"{series}:{lo}-{hi}-{n}-{saved_at}"
+        key = (stock_code, date_str)
+        result[key] = result[key] + '|' + part if key in result else part
+    return result
+
+
+def stock_info(stock_code):
+    """The manifest's stocks row as a dict, or None for an unknown stock."""
+    row = _conn().execute('SELECT stock_name, daily_rows, minute_rows, last_dt, last_cntr_tm '
+                          'FROM stocks WHERE stock_code = ?', (stock_code,)).fetchone()
+    if row is None:
+        return None
+    name, daily_rows, minute_rows, last_dt, last_cntr_tm = row
+    return {'stock_code': stock_code, 'stock_name': name or '', 'daily_rows': daily_rows,
+            'minute_rows': minute_rows, 'last_dt': last_dt, 'last_cntr_tm': last_cntr_tm}
+
+
+def set_stock_name(stock_code, stock_name):
+    conn = _conn()
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO stocks (stock_code) VALUES (?)', (stock_code,))
+        conn.execute('UPDATE stocks SET stock_name = ? WHERE stock_code = ?', (stock_name, stock_code))
+
+
+def _split_unchanged_cold(stock_code, series, new):
+    """Drop new rows equal to rows already in the cold file (gathers resend old bars).
+    Returns (rows dropped, new rows left), or (0, None) when a cold row would change."""
+    _filename, _dtype, key = SERIES[series]
+    if not os.path.exists(_cold_path(stock_code, series)):
+        return 0, new
+    cold = _load_cold(stock_code, series)
+    if len(cold) == 0 or int(new[key].min()) > int(cold[key][-1]):
+        return 0, new
+    old_part = new[new[key] <= cold[key][-1]]
+    idx = np.minimum(np.searchsorted(cold[key], old_part[key]), len(cold) - 1)
+    if not np.all(cold[idx] == old_part):
+        return 0, None
+    return len(np.unique(old_part[key])), new[new[key] > cold[key][-1]]
+
+
+def _save(stock_code, date_str, series, records):
+    """Merge records into the series (new rows win on equal key) and widen the entry range.
+    Returns (updated, added, total)."""
+    _filename, dtype, key = SERIES[series]
+    new = _records_to_array(records, dtype, key)
+    if len(new) == 0:
+        return 0, 0, series_size(stock_code, series)[0]
+    with _stock_lock(stock_code):
+        # the in-place tail merge must never put keys of the cold range into the hot file
+        unchanged, rest = _split_unchanged_cold(stock_code, series, new)
+        if rest is None:
+            result = None
+        elif len(rest) == 0:
+            result = (unchanged, 0, series_size(stock_code, series)[0])
+        else:
+            result = _merge_tail(stock_code, series, rest, date_str)
+            if result is not None:
+                result = (result[0] + unchanged,) + result[1:]
+        if result is None:
+            old = _load_all(stock_code, series)
+            combined = np.concatenate([new[::-1], old])  # newest first so np.unique keeps it
+            _keys, idx = np.unique(combined[key], return_index=True)
+            merged = combined[idx]
+            added = len(merged) - len(old)
+            updated = len(np.unique(new[key])) - added
+            if added or not np.array_equal(merged, old):
+                _record_versions(stock_code, series, old, merged, date_str)
+                _write_all(stock_code, series, merged)
+            result = (updated, added, len(merged))
+        else:
+            result = result[:2] + (series_size(stock_code, series)[0],)
+        conn = _conn()
+        lo, hi = int(new[key].min()), int(new[key].max())
+        row = conn.execute('SELECT first_key, last_key FROM entries WHERE stock_code = ? AND date = ? AND series = ?',
+                           (stock_code, date_str, series)).fetchone()
+        if row:
+            lo, hi = min(lo, row[0]), max(hi, row[1])
+        with conn:
+            _put_entry(conn, stock_code, date_str, series, lo, hi)
+            _put_stock(conn, stock_code, series)
+        return result
+
+
+def save_daily(stock_code, date_str, records):
+    return _save(stock_code, date_str, 'daily', records)
+
+
+def save_minute(stock_code, date_str, records):
+    return _save(stock_code, date_str, 'minute', records)
+
+
+def _slice(arr, key, start, end):
+    if len(arr) == 0:
+        return arr
+    keys = arr[key]
+    lo = 0 if start is None else int(np.searchsorted(keys, int(start), side='left'))
+    hi = len(arr) if end is None else int(np.searchsorted(keys, int(end), side='right'))
+    return arr[lo:hi]
+
+
+def read_range(stock_code, series, start=None, end=None):
+    """Rows with start <= key <= end: a read-only view of the mapped hot file, or a copy
+    when the range reaches into the compacted cold rows."""
+    _filename, _dtype, key = SERIES[series]
+    hot = _load(stock_code, series)
+    if len(hot) and start is not None and int(start) >= int(hot[key][0]):
+        return _slice(hot, key, start, end)
+    if not os.path.exists(_cold_path(stock_code, series)):
+        return _slice(hot, key, start, end)
+    cold = _load_cold(stock_code, series)
+    if len(hot):
+        cold = cold[:int(np.searchsorted(cold[key], int(hot[key][0]), side='left'))]
+    cold = _slice(cold, key, start, end)
+    if len(cold) == 0:
+        return _slice(hot, key, start, end)
+    return np.concatenate([cold, _slice(hot, key, start, end)])
+
+
+def read_daily(stock_code, start=None, end=None):
+    return read_range(stock_code, 'daily', start, end)
+
+
+def read_minute(stock_code, start=None, end=None):
+    return read_range(stock_code, 'minute', start, end)
+
+
+def read_entry(stock_code, date_str, series):
+    """Rows of one entry (the former per-day file) as they were on its date,
+    or None when the entry has no such series."""
+    rng = load_entries(stock_code).get(date_str, {}).get(series)
+    if not rng:
+        return None
+    _filename, _dtype, key = SERIES[series]
+    arr = read_range(stock_code, series, rng[0], rng[1])
+    versions = _load_versions(stock_code, series)
+    if len(arr) == 0 or len(versions) == 0:
+        return arr
+    versions = versions[(versions['replaced_at'] > int(date_str))
+                        & (versions[key] >= rng[0]) & (versions[key] <= rng[1])]
+    if len(versions) == 0:
+        return arr
+    # per key, the content replaced by the first change after this entry's date
+    versions = versions[np.lexsort((versions['replaced_at'], versions[key]))]
+    _keys, first = np.unique(versions[key], return_index=True)
+    versions = versions[first]
+    idx = np.searchsorted(arr[key], versions[key])
+    found = idx < len(arr)
+    found[found] = arr[key][idx[found]] == versions[key][found]
+    arr = np.array(arr)
+    for f in arr.dtype.names:
+        arr[f][idx[found]] = versions[f][found]
+    return arr
+
+
+def daily_records(stock_code, date_str=None):
+    arr = read_daily(stock_code) if date_str is None else read_entry(stock_code, date_str, 'daily')
+    return [] if arr is None else to_records(arr)
+
+
+def minute_records(stock_code, date_str=None):
+    arr = read_minute(stock_code) if date_str is None else read_entry(stock_code, date_str, 'minute')
+    return [] if arr is None else to_records(arr)
+
+
+def entry_exists(stock_code, date_str, series='daily'):
+    row = _conn().execute('SELECT 1 FROM entries WHERE stock_code = ? AND date = ? AND series = ?',
+                          (stock_code, date_str, series)).fetchone()
+    return row is not None
+
+
+def list_entries(series='daily'):
+    """[(stock_code, date_str)] of every entry that has the given series."""
+    rows = _conn().execute('SELECT stock_code, date FROM entries WHERE series = ? ORDER BY stock_code, date',
+                           (series,)).fetchall()
+    return [(stock_code, date_str) for stock_code, date_str in rows]
+
+
+def delete_entry(stock_code, date_str):
+    """Drop one entry and the rows no other entry covers. Returns the deleted series names."""
+    with _stock_lock(stock_code):
+        entries = load_entries(stock_code)
+        entry = entries.pop(date_str, None)
+        if not entry:
+            return []
+        for series in SERIES:
+            if series not in entry:
+                continue
+            _filename, _dtype, key = SERIES[series]
+            arr = _load_all(stock_code, series)
+            keep = np.zeros(len(arr), dtype=bool)
+            for other in entries.values():
+                if series in other:
+                    lo, hi = other[series]
+                    keep |= (arr[key] >= lo) & (arr[key] <= hi)
+            _write_all(stock_code, series, arr[keep])
+        conn = _conn()
+        with conn:
+            conn.execute('DELETE FROM entries WHERE stock_code = ? AND date = ?', (stock_code, date_str))
+            for series in entry:
+                _put_stock(conn, stock_code, series)
+        return [s for s in SERIES if s in entry]
+
+
+def _parse_legacy_name(filename):
+    """'YYYYMMDD_code.json' -> (code, date, 'daily'); '..._min.json' -> (code, date, 'minute')."""
+    if not filename.endswith('.json'):
+        return None
+    base, series = filename[:-5], 'daily'
+    if base.endswith('_min'):
+        base, series = base[:-4], 'minute'
+    parts = base.split('_')
+    if len(parts) != 2 or len(parts[0]) != 8 or not parts[0].isdigit():
+        return None
+    return parts[1], parts[0], series
+
+
+def parse_chart_filename(filename):
+    return _parse_legacy_name(os.path.basename(filename or ''))
+
+
+def migrate_json_dir(chart_dir=LEGACY_CHART_DIR, remove=False):
+    """Import every YYYYMMDD_code[_min].json in chart_dir. Returns a summary dict."""
+    summary = {'files': 0, 'rows': 0, 'json_bytes': 0, 'store_bytes': 0, 'errors': 0}
+    if os.path.isdir(chart_dir):
+        for filename in sorted(os.listdir(chart_dir)):
+            parsed = _parse_legacy_name(filename)
+            if not parsed:
+                continue
+            stock_code, date_str, series = parsed
+            path = os.path.join(chart_dir, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+                _save(stock_code, date_str, series, records if isinstance(records, list) else [])
+                summary['files'] += 1
+                summary['rows'] += len(records) if isinstance(records, list) else 0
+                summary['json_bytes'] += os.path.getsize(path)
+                if remove:
+                    os.remove(path)
+            except Exception as e:
+                summary['errors'] += 1
+                print(f"Error migrating {filename}: {e}")
+    for root, _dirs, files in os.walk(STORE_DIR):
+        summary['store_bytes'] += sum(os.path.getsize(os.path.join(root, n)) for n in files
+                                      if not n.startswith(MANIFEST_FILE))
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(os.path.join(STORE_DIR, MIGRATED_MARKER), 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+    return summary
+
+
+def dedup_stats():
+    """Bars stored once vs. bars referenced by all entries, plus kept old versions."""
+    conn = _conn()
+    result = {}
+    for series in SERIES:
+        stored, referenced = conn.execute(f'SELECT COALESCE(SUM({series}_rows), 0), '
+                                          f'(SELECT COALESCE(SUM(rows), 0) FROM entries WHERE series = ?) '
+                                          f'FROM stocks', (series,)).fetchone()
+        versions = 0
+        for (stock_code,) in conn.execute('SELECT stock_code FROM stocks').fetchall():
+            versions += len(_load_versions(stock_code, series))
+        result[series] = {'stored_rows': stored, 'referenced_rows': referenced, 'version_rows': versions}
+    return result
+
+
+def dedup_json_dir(chart_dir=LEGACY_CHART_DIR):
+    """Fold a directory of per-day JSON snapshots into the store (one copy per bar) and delete them."""
+    summary = migrate_json_dir(chart_dir, remove=True)
+    summary['dedup'] = dedup_stats()
+    return summary
+
+
+def is_migrated():
+    return os.path.exists(os.path.join(STORE_DIR, MIGRATED_MARKER))
+
+
+def _measure(stock_codes, repeat):
+    result = {'hot_bytes': 0, 'cold_bytes': 0, 'rows': 0, 'read_ms_first': 0.0, 'read_ms_cached': 0.0}
+    for stock_code in stock_codes:
+        for series in SERIES:
+            for path, name in ((_series_path(stock_code, series), 'hot_bytes'),
+                               (_cold_path(stock_code, series), 'cold_bytes')):
+                if os.path.exists(path):
+                    result[name] += os.path.getsize(path)
+            with _cold_cache_lock:
+                _cold_cache.clear()
+            t = time_module.perf_counter()
+            result['rows'] += len(read_range(stock_code, series))
+            result['read_ms_first'] += (time_module.perf_counter() - t) * 1000
+            t = time_module.perf_counter()
+            for _ in range(repeat):
+                read_range(stock_code, series)
+            result['read_ms_cached'] += (time_module.perf_counter() - t) * 1000 / repeat
+    if os.path.isdir(LEGACY_CHART_DIR):
+        codes = set(stock_codes)
+        names = [n for n in os.listdir(LEGACY_CHART_DIR) if (_parse_legacy_name(n) or ('',))[0] in codes]
+        t = time_module.perf_counter()
+        for n in names:
+            path = os.path.join(LEGACY_CHART_DIR, n)
+            result['json_bytes'] = result.get('json_bytes', 0) + os.path.getsize(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                json.load(f)
+        result['json_read_ms'] = (time_module.perf_counter() - t) * 1000
+    for k in ('read_ms_first', 'read_ms_cached', 'json_read_ms'):
+        if k in result:
+            result[k] = round(result[k], 3)
+    return result
+
+
+def bench(stock_codes=None, days=COLD_AFTER_DAYS, repeat=5):
+    """Bytes on disk and whole-series read latency before and after compact_all(days)."""
+    if not stock_codes:
+        stock_codes = [r[0] for r in _conn().execute('SELECT stock_code FROM stocks ORDER BY stock_code').fetchall()]
+    before = _measure(stock_codes, repeat)
+    compacted = compact_all(days)
+    after = _measure(stock_codes, repeat)
+    return {'stocks': len(stock_codes), 'before': before, 'compacted': compacted, 'after': after}
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    args = sys.argv[2:]
+    if command == 'migrate':
+        args = [a for a in args if a != '--remove']
+        print(json.dumps(migrate_json_dir(args[0] if args else LEGACY_CHART_DIR, '--remove' in sys.argv), indent=2))
+    elif command == 'dedup':
+        print(json.dumps(dedup_json_dir(args[0] if args else LEGACY_CHART_DIR), indent=2))
+    elif command == 'compact':
+        print(json.dumps(compact_all(int(args[0]) if args else COLD_AFTER_DAYS), indent=2))
+    elif command == 'bench':
+        days = int(args[0]) if args else COLD_AFTER_DAYS
+        print(json.dumps(bench(args[1:], days), indent=2))
+    else:
+        print(__doc__.split('usage: ')[1])
+        sys.exit(1)
@@ -0,0 +1,156 @@
+"""Multi-resolution tiles of a stock's stored daily history, for panning and zooming long charts.
+
+Level 0 is the chart store's daily bars, level 1 weekly and level 2 monthly bars
+aggregated from them (open of the first day, highest high, lowest low, close of the last
+day; a bar is dated by its first trading day). Each level is cut into tiles of
+TILE_BARS bars counted from the oldest bar, so tile x of a level always covers the same
+periods and a new day only changes the last tile. Tiles are TILE_BARS * BAR_PX wide and
+TILE_HEIGHT high whatever the history length, and all tiles of a stock share one log
+price scale from lo (bottom edge) to hi (top edge) with every level, so tiles line up
+side by side and a level switch keeps prices at the same height:
+    y = (log(hi) - log(price)) / (log(hi) - log(lo)) * TILE_HEIGHT
+
+pyramid() aggregates a stock's levels once per change of its daily series
+(chartstore.series_signature) and keeps the last PYRAMID_CACHE_MAX stocks.
+
+info(stock_code) ->
+{"stock_code": ..., "tile_bars": n, "bar_px": px, "tile_width": px, "tile_height": px,
+ "lo": price, "hi": price, "scale": "log",
+ "levels": [{"level": 0, "name": "daily", "bars": n, "tiles": n,
+             "first": "YYYYMMDD", "last": "YYYYMMDD", "tile_starts": ["YYYYMMDD", ...]}]}
+tile(stock_code, level, x) -> (OHLC rows of the tile, lo, hi, version)
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import chartstore
+
+
+LEVELS = ('daily', 'weekly', 'monthly')
+TILE_BARS = 64
+BAR_PX = 8
+BODY_PX = 5
+TILE_HEIGHT = 320
+PRICE_PAD = 0.03  # of the price range (in log space) left free above and below
+PYRAMID_CACHE_MAX = 16
+
+OHLC_DTYPE = np.dtype([('dt', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8')])
+
+_cache = OrderedDict()  # stock_code -> pyramid dict, LRU
+_cache_lock = threading.Lock()
+
+
+def _daily_bars(daily):
+    """OHLC rows of the stored daily bars that carry a price (the store keeps ka10081's signed prices)."""
+    out = np.zeros(len(daily), dtype=OHLC_DTYPE)
+    out['dt'] = daily['dt']
+    out['open'] = np.abs(daily['open_pric'])
+    out['high'] = np.abs(daily['high_pric'])
+    out['low'] = np.abs(daily['low_pric'])
+    out['close'] = np.abs(daily['cur_prc'])
+    priced = (out['open'] > 0) | (out['high'] > 0) | (out['low'] > 0) | (out['close'] > 0)
+    return out[priced]
+
+
+def _period_keys(dt, level):
+    if level == 2:
+        return dt // 100
+    # days since 1970-01-01 (a Thursday), shifted so weeks start on Monday
+    months = (dt // 10000 - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (dt // 100 % 100 - 1)
+    days = (months.astype('datetime64[D]') + (dt % 100 - 1)).astype(np.int64)
+    return (days + 3) // 7
+
+
+def aggregate(bars, level):
+    """OHLC rows of one level from the daily OHLC rows (oldest first)."""
+    if level == 0 or len(bars) == 0:
+        return bars
+    keys = _period_keys(bars['dt'], level)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    ends = np.concatenate([starts[1:], [len(bars)]]) - 1
+    out = np.zeros(len(starts), dtype=OHLC_DTYPE)
+    out['dt'] = bars['dt'][starts]
+    out['open'] = bars['open'][starts]
+    out['close'] = bars['close'][ends]
+    out['high'] = np.maximum.reduceat(bars['high'], starts)
+    lows = np.minimum.reduceat(np.where(bars['low'] > 0, bars['low'], np.inf), starts)
+    out['low'] = np.where(np.isinf(lows), 0, lows)
+    return out
+
+
+def _price_range(bars):
+    highs = bars['high'][bars['high'] > 0]
+    lows = bars['low'][bars['low'] > 0]
+    if not len(highs) or not len(lows):
+        return None, None
+    log_lo, log_hi = np.log(lows.min()), np.log(highs.max())
+    pad = max((log_hi - log_lo) * PRICE_PAD, 0.01)
+    return float(np.exp(log_lo - pad)), float(np.exp(log_hi + pad))
+
+
+def pyramid(stock_code):
+    """{'sig', 'levels': [OHLC rows per level], 'lo', 'hi'} of a stock, rebuilt when its daily series changed."""
+    sig = chartstore.series_signature(stock_code, 'daily')
+    with _cache_lock:
+        cached = _cache.get(stock_code)
+        if cached is not None and cached['sig'] == sig:
+            _cache.move_to_end(stock_code)
+            return cached
+    bars = _daily_bars(chartstore.read_daily(stock_code))
+    lo, hi = _price_range(bars)
+    result = {'sig': sig, 'levels': [aggregate(bars, level) for level in range(len(LEVELS))], 'lo': lo, 'hi': hi}
+    with _cache_lock:
+        _cache[stock_code] = result
+        _cache.move_to_end(stock_code)
+        while len(_cache) > PYRAMID_CACHE_MAX:
+            _cache.popitem(last=False)
+    return result
+
+
+def tile_count(bars):
+    return (len(bars) + TILE_BARS - 1) // TILE_BARS
+
+
+def info(stock_code):
+    """Tile geometry, price scale and per-level bar/tile counts of a stock (see the module docstring)."""
+    p = pyramid(stock_code)
+    levels = []
+    for level, bars in enumerate(p['levels']):
+        levels.append({
+            'level': level,
+            'name': LEVELS[level],
+            'bars': int(len(bars)),
+            'tiles': tile_count(bars),
+            'first': str(bars['dt'][0]) if len(bars) else None,
+            'last': str(bars['dt'][-1]) if len(bars) else None,
+            'tile_starts': [str(v) for v in bars['dt'][::TILE_BARS].tolist()],
+        })
+    return {
+        'stock_code': stock_code,
+        'tile_bars': TILE_BARS,
+        'bar_px': BAR_PX,
+        'tile_width': TILE_BARS * BAR_PX,
+        'tile_height': TILE_HEIGHT,
+        'lo': p['lo'],
+        'hi': p['hi'],
+        'scale': 'log',
+        'levels': levels,
+    }
+
+
+def tile(stock_code, level, x):
+    """(OHLC rows, lo, hi, version) of tile x of a level; version changes only when what
+    the tile shows does. ValueError for a level or tile that does not exist."""
+    if not 0 <= level < len(LEVELS):
+        raise ValueError(f'Unknown level: {level}')
+    p = pyramid(stock_code)
+    bars = p['levels'][level]
+    if not 0 <= x < tile_count(bars):
+        raise ValueError(f'No tile {x} at level {level} ({tile_count(bars)} tiles)')
+    rows = bars[x * TILE_BARS:(x + 1) * TILE_BARS]
+    digest = hashlib.sha1(rows.tobytes())
+    digest.update(repr((p['lo'], p['hi'], TILE_BARS, BAR_PX, BODY_PX, TILE_HEIGHT)).encode('ascii'))
+    return rows, p['lo'], p['hi'], digest.hexdigest()[:32]
@@ -0,0 +1,67 @@
+"""Poll config/state files and call a handler when one changes.
+
+watch(path, handler) registers a file; one daemon thread stats every registered file
+each CONFIG_WATCH_INTERVAL seconds and calls handler(path) from that thread when the
+mtime or size differs from what was seen before. Handlers validate and apply the
+new content themselves; an exception in a handler is printed and the old config stays.
+"""
+import os
+import threading
+
+
+CONFIG_WATCH_INTERVAL = 2.0  # seconds
+
+_watches = {}  # path -> {'handler': fn, 'sig': (mtime, size) or None}
+_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread = None
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def watch(path, handler):
+    """Call handler(path) whenever path changes from now on."""
+    with _lock:
+        _watches[path] = {'handler': handler, 'sig': _signature(path)}
+
+
+def check_now():
+    """Check every watched file once; returns the paths whose handler ran."""
+    changed = []
+    with _lock:
+        items = list(_watches.items())
+    for path, w in items:
+        sig = _signature(path)
+        if sig is None or sig == w['sig']:
+            continue  # a missing file (e.g. mid-replace) keeps the current config
+        w['sig'] = sig
+        try:
+            w['handler'](path)
+            changed.append(path)
+        except Exception as e:
+            print(f"Error applying changed {path}: {e}")
+    return changed
+
+
+def _watch_loop():
+    while not _stop_event.wait(CONFIG_WATCH_INTERVAL):
+        check_now()
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_watch_loop, daemon=True, name='ConfigWatchThread')
+    _thread.start()
+
+
+def stop():
+    _stop_event.set()
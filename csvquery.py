@@ -0,0 +1,196 @@
+"""Server-side queries over datagather's analysis CSVs (bounce_analysis_*.csv).
+
+The first query of a CSV parses it once into a column index saved next to it as
+.<name>.idx.npz: every column as a string array (what the CSV holds, so rows read back
+exactly as csv.DictReader gives them) plus a float64 array for the columns whose values
+are all numbers. The index records the CSV's (mtime_ns, size) and is rebuilt when that
+changes; the last INDEX_CACHE_MAX indexes stay loaded. A query is numpy masks and one
+stable argsort over the index, and only the requested page is turned into dicts.
+
+query(path, columns=['Stock Code', 'MA5/MA10'],
+      equals={'Success/Failure': ['success']},
+      ranges=[('Highest Date', 20250101, 20250630), ('MA5/MA10', 0.95, None)],
+      sort='Highest Date', descending=True, limit=100, cursor=None)
+-> {"columns": [...], "total": matching rows, "rows": [{...}], "next_cursor": str or None}
+
+A cursor is an opaque token holding the offset of the next page and the CSV signature
+it was made for; a cursor from before the CSV changed is rejected with ValueError.
+"""
+import os
+import csv
+import json
+import base64
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+INDEX_CACHE_MAX = 4  # column indexes kept in memory
+MAX_PAGE_ROWS = 1000
+
+_cache = OrderedDict()  # csv path -> index dict, LRU
+_cache_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _index_path(path):
+    head, name = os.path.split(path)
+    return os.path.join(head, '.' + name + '.idx.npz')
+
+
+def _to_float(values):
+    """float64 array of the values, or None when one of them is not a number."""
+    out = np.empty(len(values), dtype=np.float64)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v)
+        except ValueError:
+            return None
+    return out
+
+
+def _build(path, sig):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        cols = [[] for _ in header]
+        for row in reader:
+            if not row:
+                continue
+            for i in range(len(header)):
+                cols[i].append(row[i] if i < len(row) else '')
+    index = {'sig': sig, 'columns': header, 'rows': len(cols[0]) if cols else 0, 'text': {}, 'num': {}}
+    arrays = {'__sig__': np.array(sig, dtype=np.int64),
+              '__columns__': np.array(header, dtype=np.str_)}
+    for i, name in enumerate(header):
+        text = np.array(cols[i], dtype=np.str_)
+        index['text'][name] = text
+        arrays[f't{i}'] = text
+        num = _to_float(cols[i]) if cols[i] else None
+        if num is not None:
+            index['num'][name] = num
+            arrays[f'n{i}'] = num
+    try:
+        tmp = _index_path(path) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, _index_path(path))
+    except OSError as e:
+        print(f"Error saving CSV index for {path}: {e}")  # the in-memory index still serves
+    return index
+
+
+def _load_saved(path, sig):
+    idx_path = _index_path(path)
+    if not os.path.exists(idx_path):
+        return None
+    try:
+        with np.load(idx_path) as z:
+            if z['__sig__'].tolist() != sig:
+                return None
+            header = z['__columns__'].tolist()
+            index = {'sig': sig, 'columns': header, 'rows': 0, 'text': {}, 'num': {}}
+            for i, name in enumerate(header):
+                index['text'][name] = z[f't{i}']
+                if f'n{i}' in z.files:
+                    index['num'][name] = z[f'n{i}']
+            index['rows'] = len(index['text'][header[0]]) if header else 0
+            return index
+    except Exception as e:
+        print(f"Error reading CSV index {idx_path}: {e}")
+        return None
+
+
+def get_index(path):
+    """Column index of a CSV, from memory, the .idx.npz file, or a fresh parse."""
+    sig = _signature(path)
+    with _cache_lock:
+        index = _cache.get(path)
+        if index is not None and index['sig'] == sig:
+            _cache.move_to_end(path)
+            return index
+    with _build_lock:
+        index = _load_saved(path, sig) or _build(path, sig)
+    with _cache_lock:
+        _cache[path] = index
+        _cache.move_to_end(path)
+        while len(_cache) > INDEX_CACHE_MAX:
+            _cache.popitem(last=False)
+    return index
+
+
+def drop_index(path):
+    """Forget and delete the index of a CSV (call when the CSV is deleted or replaced)."""
+    with _cache_lock:
+        _cache.pop(path, None)
+    try:
+        os.remove(_index_path(path))
+    except OSError:
+        pass
+
+
+def _encode_cursor(offset, sig):
+    raw = json.dumps({'o': offset, 's': sig}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor, sig):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw.decode('utf-8'))
+        offset = int(data['o'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if data.get('s') != sig:
+        raise ValueError('CSV file changed since the cursor was issued; start from the first page')
+    return max(0, offset)
+
+
+def query(path, columns=None, equals=None, ranges=None, sort=None, descending=False, limit=100, cursor=None):
+    """One page of the CSV rows matching every filter (see the module docstring).
+    Unknown columns raise ValueError; range bounds of None are open."""
+    index = get_index(path)
+    names = index['columns']
+    columns = list(columns) if columns else list(names)
+    for name in columns + list((equals or {}).keys()) + [r[0] for r in (ranges or [])] + ([sort] if sort else []):
+        if name not in index['text']:
+            raise ValueError(f'Unknown column: {name}')
+    mask = np.ones(index['rows'], dtype=bool)
+    for name, values in (equals or {}).items():
+        mask &= np.isin(index['text'][name], [str(v) for v in values])
+    for name, lo, hi in ranges or []:
+        num = index['num'].get(name)
+        if num is None:
+            raise ValueError(f'Column is not numeric: {name}')
+        if lo is not None:
+            mask &= num >= float(lo)
+        if hi is not None:
+            mask &= num <= float(hi)
+    rows = np.flatnonzero(mask)
+    if sort:
+        key = index['num'].get(sort)
+        if key is not None:
+            # negated so equal keys keep file order both ways
+            order = np.argsort(-key[rows] if descending else key[rows], kind='stable')
+        else:
+            # rank of each distinct text, negated like the numbers so ties keep file order
+            _values, rank = np.unique(index['text'][sort][rows], return_inverse=True)
+            order = np.argsort(-rank if descending else rank, kind='stable')
+        rows = rows[order]
+    offset = _decode_cursor(cursor, index['sig']) if cursor else 0
+    limit = max(1, min(int(limit), MAX_PAGE_ROWS))
+    page = rows[offset:offset + limit]
+    cols = [index['text'][name][page].tolist() for name in columns]
+    next_offset = offset + len(page)
+    return {
+        'columns': columns,
+        'total': int(len(rows)),
+        'rows': [dict(zip(columns, vals)) for vals in zip(*cols)],
+        'next_cursor': _encode_cursor(next_offset, index['sig']) if next_offset < len(rows) else None,
+    }
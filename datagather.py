@@ -8,26 +8,62 @@ import threading
 import requests
 from datetime import datetime, timedelta, time as dt_time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse, Response
 import uvicorn
 import csv
-import numpy as np
-import cv2
+import zlib
+import sqlite3
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 
 from ka10081 import get_day_chart
 from ka10080 import get_bun_chart, fn_ka10080
-from au1001 import get_one_token
+from au1001 import get_one_token, reload_env_json
+import au1001
 from ka10100 import get_stockinfo
-from ka_condition import search_condition_by_name
+import statedb
+import configwatch
+import chartstore
+import bgjobs
+import bounce
+import features
+import csvquery
+import rendercache
+import renderpool
+import charttiles
+
+
+class _LazyModule:
+    """Import the named module on first attribute access (chartrender loads cv2, which only error images need here; charts render in renderpool's workers)."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+chartrender = _LazyModule('chartrender')
 
 # Configuration
 # Determine the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Define chart data directory: chart_data/day
+# Legacy per-day JSON charts (read once by the chart store migration)
 CHART_DIR = os.path.join(BASE_DIR, 'chart_data', 'day')
+# Per-stock columnar chart store (chartstore.py)
+CHART_STORE_DIR = os.path.join(BASE_DIR, 'chart_data', 'store')
+chartstore.STORE_DIR = CHART_STORE_DIR
+bgjobs.configure(bounce.init_worker, (CHART_STORE_DIR,))
 INTERESTED_STOCKS_FILE = os.path.join(BASE_DIR, 'interested_stocks.json')
+statedb.STATE_DB_FILE = os.path.join(BASE_DIR, statedb.STATE_DB_FILE)
 LAST_RUN_FILE = os.path.join(BASE_DIR, 'last_gathering_time.json')
+# Per-task completion of the current gathering run, so a restarted service resumes it
+GATHER_CHECKPOINT_FILE = os.path.join(BASE_DIR, 'gather_checkpoint.json')
+GATHER_WORKERS = 4  # stocks gathered at the same time
+GATHER_TR_PER_SEC = 4.0  # ka10081 + ka10080 calls per second, shared by all workers
 P3_POSTED_FILE = os.path.join(BASE_DIR, 'p3_interested_posted.json')
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 # Directory where server-rendered (OpenCV) chart PNGs are saved
@@ -137,38 +173,46 @@ status_lock = threading.Lock()
 # Background thread control
 thread_stop_event = threading.Event()
 background_thread = None
+compactor_thread = None
+prerender_thread = None
+gather_run_lock = threading.Lock()
+gather_checkpoint_lock = threading.Lock()
+tr_quota_lock = threading.Lock()
+tr_next_slot = 0.0
+CHART_COMPACT_INTERVAL = 6 * 3600  # seconds between cold-tier compactions
 last_p3_run_slot = None
 p3_lock = threading.Lock()
 
 def ensure_chart_dir():
-    """Ensure the chart data directory exists."""
-    if not os.path.exists(CHART_DIR):
+    """Ensure the chart store exists; the first run imports the legacy per-day JSON files."""
+    if not chartstore.is_migrated():
+        try:
+            summary = chartstore.migrate_json_dir(CHART_DIR)
+            print(f"Migrated {CHART_DIR} into {CHART_STORE_DIR}: {summary}")
+        except Exception as e:
+            print(f"Error migrating chart files into {CHART_STORE_DIR}: {e}")
+    if not os.path.exists(CHART_STORE_DIR):
         try:
-            os.makedirs(CHART_DIR)
-            print(f"Created directory: {CHART_DIR}")
+            os.makedirs(CHART_STORE_DIR)
+            print(f"Created directory: {CHART_STORE_DIR}")
         except OSError as e:
-            print(f"Error creating directory {CHART_DIR}: {e}")
+            print(f"Error creating directory {CHART_STORE_DIR}: {e}")
 
 def load_interested_stocks():
-    """Load interested stocks from JSON file."""
-    if not os.path.exists(INTERESTED_STOCKS_FILE):
-        print(f"Interested stocks file not found: {INTERESTED_STOCKS_FILE}")
-        return {}
-    
+    """Load interested stocks from the state store shared with autotr."""
     try:
-        with open(INTERESTED_STOCKS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        statedb.migrate_json('interested_stocks', INTERESTED_STOCKS_FILE)
+        return statedb.load_table('interested_stocks')
     except Exception as e:
-        print(f"Error loading {INTERESTED_STOCKS_FILE}: {e}")
+        print(f"Error loading interested_stocks from {statedb.STATE_DB_FILE}: {e}")
         return {}
 
 
 def save_interested_stocks_to_json(interested_stocks):
-	"""Save interested_stocks to JSON file"""
+	"""Save interested_stocks to the state store; only rows changed here are written."""
 	try:
-		with open(INTERESTED_STOCKS_FILE, 'w', encoding='utf-8') as f:
-			json.dump(interested_stocks, f, indent=2, ensure_ascii=False)
-		print(f"Saved interested_stocks to {INTERESTED_STOCKS_FILE}")
+		statedb.sync_table('interested_stocks', interested_stocks)
+		print(f"Saved interested_stocks to {statedb.STATE_DB_FILE}")
 		return True
 	except Exception as e:
 		print(f"Error saving interested_stocks: {e}")
@@ -218,127 +262,44 @@ def should_skip_initial_gathering():
 
 def save_chart_data(stock_code, date_str, data_list):
     """
-    Save chart data to file with date-based filename.
-    Filename format: YYYYMMDD_stockcode.json
-    Merges with existing data if file exists.
+    Merge daily chart rows into the stock's series in the chart store
+    and record them under the entry date_str (the former YYYYMMDD_stockcode.json).
     Overwrites existing records with same datetime (dt) by new data.
     """
-    file_path = os.path.join(CHART_DIR, f"{date_str}_{stock_code}.json")
-    
-    existing_data = []
-    
-    # Load existing data if file exists
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-        except Exception as e:
-            print(f"Error reading existing daily chart data for {stock_code}: {e}")
-    
-    # Create a dictionary keyed by datetime (dt) for efficient lookup and overwrite
-    data_dict = {}
-    
-    # Add existing data to dictionary
-    for record in existing_data:
-        dt = record.get('dt', '')
-        if dt:
-            data_dict[dt] = record
-    
-    # Overwrite with new data (new data takes precedence)
-    updated_count = 0
-    added_count = 0
-    for record in data_list:
-        dt = record.get('dt', '')
-        if dt:
-            if dt in data_dict:
-                # Overwrite existing record with same datetime
-                data_dict[dt] = record
-                updated_count += 1
-            else:
-                # Add new record
-                data_dict[dt] = record
-                added_count += 1
-    
-    # Convert back to list and sort by datetime
-    merged_data = list(data_dict.values())
-    merged_data.sort(key=lambda x: x.get('dt', ''))
-    
-    # Save merged data
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(merged_data, f, indent=4, ensure_ascii=False)
-        
+        updated_count, added_count, total = chartstore.save_daily(stock_code, date_str, data_list)
         if updated_count > 0 or added_count > 0:
-            print(f"[{stock_code}] Daily chart for {date_str}: Updated {updated_count} records, Added {added_count} new records. Total: {len(merged_data)}")
+            print(f"[{stock_code}] Daily chart for {date_str}: Updated {updated_count} records, Added {added_count} new records. Total: {total}")
         else:
-            print(f"[{stock_code}] Daily chart for {date_str}: No changes. Total: {len(merged_data)}")
+            print(f"[{stock_code}] Daily chart for {date_str}: No changes. Total: {total}")
+    except Exception as e:
+        print(f"Error saving daily chart for {stock_code} on {date_str}: {e}")
+        return
+    try:
+        if updated_count > 0 or added_count > 0:
+            features.update(stock_code)
     except Exception as e:
-        print(f"Error saving file for {stock_code} on {date_str}: {e}")
+        print(f"Error updating features for {stock_code}: {e}")
 
 def chart_file_exists(stock_code, date_str):
     """
-    Check if chart file already exists for the given stock and date.
+    Check if a daily chart entry already exists for the given stock and date.
     Only compares the date part (YYYYMMDD).
     """
-    file_path = os.path.join(CHART_DIR, f"{date_str}_{stock_code}.json")
-    return os.path.exists(file_path)
+    return chartstore.entry_exists(stock_code, date_str)
 
 def save_minute_chart_data(stock_code, date_str, new_data_list):
     """
-    Save minute chart data to file with date-based filename.
-    Filename format: YYYYMMDD_stockcode_min.json
-    Merges with existing data if file exists.
+    Merge minute chart rows into the stock's minute series in the chart store
+    and record them under the entry date_str (the former YYYYMMDD_stockcode_min.json).
     Overwrites existing records with same datetime (cntr_tm) by new data.
     """
-    file_path = os.path.join(CHART_DIR, f"{date_str}_{stock_code}_min.json")
-    
-    existing_data = []
-    
-    # Load existing data if file exists
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-        except Exception as e:
-            print(f"Error reading existing minute chart data for {stock_code}: {e}")
-    
-    # Create a dictionary keyed by datetime (cntr_tm) for efficient lookup and overwrite
-    data_dict = {}
-    
-    # Add existing data to dictionary
-    for record in existing_data:
-        cntr_tm = record.get('cntr_tm', '')
-        if cntr_tm:
-            data_dict[cntr_tm] = record
-    
-    # Overwrite with new data (new data takes precedence)
-    updated_count = 0
-    added_count = 0
-    for record in new_data_list:
-        cntr_tm = record.get('cntr_tm', '')
-        if cntr_tm:
-            if cntr_tm in data_dict:
-                # Overwrite existing record with same datetime
-                data_dict[cntr_tm] = record
-                updated_count += 1
-            else:
-                # Add new record
-                data_dict[cntr_tm] = record
-                added_count += 1
-    
-    # Convert back to list and sort by datetime
-    merged_data = list(data_dict.values())
-    merged_data.sort(key=lambda x: x.get('cntr_tm', ''))
-    
-    # Save merged data
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(merged_data, f, indent=4, ensure_ascii=False)
-        
+        updated_count, added_count, total = chartstore.save_minute(stock_code, date_str, new_data_list)
         if updated_count > 0 or added_count > 0:
-            print(f"[{stock_code}] Minute chart for {date_str}: Updated {updated_count} records, Added {added_count} new records. Total: {len(merged_data)}")
+            print(f"[{stock_code}] Minute chart for {date_str}: Updated {updated_count} records, Added {added_count} new records. Total: {total}")
         else:
-            print(f"[{stock_code}] Minute chart for {date_str}: No changes. Total: {len(merged_data)}")
+            print(f"[{stock_code}] Minute chart for {date_str}: No changes. Total: {total}")
     except Exception as e:
         print(f"Error saving minute chart for {stock_code} on {date_str}: {e}")
 
@@ -361,36 +322,39 @@ def should_fetch_minute_chart(update_date_str, current_date_str):
 
 def get_daily_chart_files():
     """
-    Scan the chart directory and return a list of daily chart files.
-    Returns list of tuples: (stock_code, date_str, file_path)
+    List the daily chart entries from the chart manifest.
+    Returns list of tuples: (stock_code, date_str)
     """
-    daily_charts = []
-    
-    if not os.path.exists(CHART_DIR):
-        return daily_charts
-    
     try:
-        for filename in os.listdir(CHART_DIR):
-            # Skip minute chart files
-            if filename.endswith('_min.json'):
-                continue
-            
-            # Parse daily chart filename: YYYYMMDD_stockcode.json
-            if filename.endswith('.json'):
-                parts = filename[:-5].split('_')  # Remove .json and split
-                if len(parts) == 2:
-                    date_str, stock_code = parts
-                    if len(date_str) == 8 and date_str.isdigit():
-                        file_path = os.path.join(CHART_DIR, filename)
-                        daily_charts.append((stock_code, date_str, file_path))
+        return chartstore.list_entries('daily')
     except Exception as e:
-        print(f"Error scanning chart directory: {e}")
-    
-    return daily_charts
+        print(f"Error reading chart manifest: {e}")
+        return []
+
+def get_chart_stock_name(stock_code, stock_name='', interested_stocks=None):
+    """
+    Name for a charted stock: the manifest name, else interested_stocks, else ka10100.
+    A name found outside the manifest is stored there so the lookup happens once per stock.
+    """
+    if stock_name:
+        return stock_name
+    if interested_stocks and stock_code in interested_stocks:
+        stock_name = interested_stocks[stock_code].get('stock_name', '')
+    if not stock_name:
+        try:
+            stock_name = get_stockinfo(stock_code).get('name', '')
+        except Exception as e:
+            print(f"Error getting stock name for {stock_code}: {e}")
+    if stock_name:
+        try:
+            chartstore.set_stock_name(stock_code, stock_name)
+        except Exception as e:
+            print(f"Error saving stock name for {stock_code}: {e}")
+    return stock_name or stock_code
 
 def gather_minute_charts(token, stocks):
     """
-    Scan for daily chart files and gather minute charts for those within 10-day limit.
+    Scan daily chart entries and gather minute charts for those within 10-day limit.
     Independent from daily chart gathering.
     """
     print(f"\n=== Starting minute chart gathering at {datetime.now()} ===")
@@ -399,13 +363,13 @@ def gather_minute_charts(token, stocks):
     daily_charts = get_daily_chart_files()
     
     if not daily_charts:
-        print("No daily chart files found in directory.")
+        print("No daily chart entries found in chart store.")
         return
     
-    print(f"Found {len(daily_charts)} daily chart files.")
+    print(f"Found {len(daily_charts)} daily chart entries.")
     
-    # Process each daily chart file
-    for stock_code, date_str, file_path in daily_charts:
+    # Process each daily chart entry
+    for stock_code, date_str in daily_charts:
         # Check if within 10-day limit
         if not should_fetch_minute_chart(date_str, current_date_str):
             print(f"[{stock_code}] Daily chart {date_str} is beyond 10-day limit. Skipping minute chart.")
@@ -434,19 +398,156 @@ def gather_minute_charts(token, stocks):
     
     print(f"=== Minute chart gathering finished at {datetime.now()} ===\n")
 
-def run_daily_job():
+def wait_tr_quota():
+    """Block until the next TR slot under GATHER_TR_PER_SEC (shared by all gather workers)."""
+    global tr_next_slot
+    with tr_quota_lock:
+        slot = max(time.monotonic(), tr_next_slot)
+        tr_next_slot = slot + 1.0 / GATHER_TR_PER_SEC
+    delay = slot - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+def load_gather_checkpoint():
+    """Checkpoint of an interrupted run started today, or None."""
+    if not os.path.exists(GATHER_CHECKPOINT_FILE):
+        return None
+    try:
+        with open(GATHER_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('run_id') != datetime.now().strftime("%Y%m%d"):
+            return None
+        checkpoint.setdefault('done', {})
+        return checkpoint
+    except Exception as e:
+        print(f"Error loading {GATHER_CHECKPOINT_FILE}: {e}")
+        return None
+
+def save_gather_checkpoint(checkpoint):
+    """Write the checkpoint atomically (temp file + rename)."""
+    try:
+        with gather_checkpoint_lock:
+            tmp = GATHER_CHECKPOINT_FILE + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f)
+            os.replace(tmp, GATHER_CHECKPOINT_FILE)
+    except Exception as e:
+        print(f"Error saving {GATHER_CHECKPOINT_FILE}: {e}")
+
+def mark_gather_task_done(checkpoint, task):
+    with gather_checkpoint_lock:
+        checkpoint['done'][task] = datetime.now().isoformat()
+    save_gather_checkpoint(checkpoint)
+
+def update_gather_progress(stock_code=None, state=None, tr_calls=0):
+    """Set one stock's state ('pending', 'daily', 'minute', 'done', 'error') and refresh ETA/throughput."""
+    with status_lock:
+        progress = status_info.get('progress')
+        if not progress:
+            return
+        if stock_code is not None:
+            progress['stocks'][stock_code] = state
+            if state in ('daily', 'minute'):
+                progress['in_flight'][stock_code] = state
+            else:
+                progress['in_flight'].pop(stock_code, None)
+            if state == 'done':
+                progress['done'] += 1
+            elif state == 'error':
+                progress['failed'] += 1
+        progress['tr_calls'] += tr_calls
+        finished = progress['done'] + progress['failed']
+        processed = finished - progress['resumed_done']
+        elapsed = time.monotonic() - progress['_t0']
+        progress['elapsed_seconds'] = round(elapsed, 1)
+        if processed > 0 and elapsed > 0:
+            rate = processed / elapsed
+            progress['stocks_per_min'] = round(rate * 60, 2)
+            progress['tr_per_sec'] = round(progress['tr_calls'] / elapsed, 2)
+            progress['eta_seconds'] = round((progress['total'] - finished) / rate, 1)
+
+def gather_stock(token, stock_code, stock_name, update_date, minute_dates, checkpoint):
+    """
+    Gather one stock: the daily chart (ka10081) for update_date when given, then one
+    minute chart (ka10080) saved under every in-window entry date of the stock.
+    Returns (daily charts saved, minute chart entries saved).
+    """
+    daily_count = 0
+    minute_count = 0
+    if update_date and f"daily:{stock_code}" not in checkpoint['done']:
+        update_gather_progress(stock_code, 'daily')
+        print(f"Processing {stock_code} ({stock_name}) for date {update_date}...")
+        wait_tr_quota()
+        # Fetch data using ka10081 with the update date
+        result = get_day_chart(token, stock_code, stock_name)
+        update_gather_progress(tr_calls=1)
+        
+        # Basic validation of result
+        if not isinstance(result, dict):
+            print(f"Invalid response format for {stock_code}")
+        elif 'return_code' in result and str(result['return_code']) != '0':
+            msg = result.get('return_msg', 'Unknown Error')
+            print(f"API Error for {stock_code}: {msg} (Code: {result['return_code']})")
+        else:
+            # Extract data list
+            # ka10081 main snippet uses 'stk_dt_pole_chart_qry'
+            data_list = result.get('stk_dt_pole_chart_qry')
+            
+            if data_list is None:
+                # Try fallback to 'output' if key differs
+                data_list = result.get('output')
+            
+            if data_list and isinstance(data_list, list):
+                save_chart_data(stock_code, update_date, data_list)
+                daily_count += 1
+            else:
+                print(f"No chart data found in response for {stock_code}")
+            mark_gather_task_done(checkpoint, f"daily:{stock_code}")
+    
+    # Minute charts only for entries whose daily chart exists
+    dates = [d for d in minute_dates if chart_file_exists(stock_code, d)]
+    if dates and f"minute:{stock_code}" not in checkpoint['done']:
+        update_gather_progress(stock_code, 'minute')
+        print(f"[{stock_code}] Daily chart(s) {', '.join(dates)} within 10-day limit. Fetching minute chart...")
+        wait_tr_quota()
+        minute_data = get_bun_chart(token, stock_code, stock_name)
+        update_gather_progress(tr_calls=1)
+        if minute_data and isinstance(minute_data, list):
+            for date_str in dates:
+                save_minute_chart_data(stock_code, date_str, minute_data)
+                minute_count += 1
+            mark_gather_task_done(checkpoint, f"minute:{stock_code}")
+        else:
+            # not marked done, so a resumed run fetches it again
+            print(f"[{stock_code}] No minute chart data returned")
+    return daily_count, minute_count
+
+def run_daily_job(resume=False):
+    """Run one gathering pass; with resume=True continue today's interrupted run if there is one."""
+    if not gather_run_lock.acquire(blocking=False):
+        print("A data gathering run is already in progress.")
+        return
+    try:
+        _run_daily_job(resume)
+    finally:
+        gather_run_lock.release()
+    request_prerender('gather')
+
+def _run_daily_job(resume):
     global status_info
     
+    checkpoint = load_gather_checkpoint() if resume else None
     with status_lock:
         status_info['status'] = 'running'
-        status_info['last_run'] = datetime.now().isoformat()
+        if checkpoint is None:
+            status_info['last_run'] = datetime.now().isoformat()
         status_info['daily_charts_processed'] = 0
         status_info['minute_charts_processed'] = 0
     
     # Save last run time to disk
     save_last_run_time()
     
-    print(f"Starting daily data gathering at {datetime.now()}")
+    print(f"Starting daily data gathering at {datetime.now()}" + (" (resuming)" if checkpoint else ""))
     
     # 1. Get Token
     try:
@@ -474,15 +575,20 @@ def run_daily_job():
     
     print(f"Found {len(stocks)} stocks to process.")
     
-    # 3. Process each stock - Daily charts only
-    print(f"\n=== Gathering daily charts ===")
-    daily_count = 0
+    if checkpoint is None:
+        checkpoint = {'run_id': datetime.now().strftime("%Y%m%d"), 'started': datetime.now().isoformat(), 'done': {}}
+        save_gather_checkpoint(checkpoint)
+    
+    # 3. Plan the run: daily charts for interested stocks in the 10-day window and
+    # minute charts for every daily chart entry in the window
     current_date_str = datetime.now().strftime("%Y%m%d")
     json_modified = False
-
+    minute_dates = {}  # stock_code -> [entry dates]
+    for stock_code, date_str in get_daily_chart_files():
+        if should_fetch_minute_chart(date_str, current_date_str):
+            minute_dates.setdefault(stock_code, []).append(date_str)
+    daily_dates = {}  # stock_code -> update date
     for stock_code, stock_info in stocks.items():
-        stock_name = stock_info.get('stock_name', stock_code)
-        
         # Get update date from stock_info, default to today if not present
         update_date = stock_info.get('yyyymmdd', '')
         if not update_date or len(update_date) != 8:
@@ -490,112 +596,91 @@ def run_daily_job():
             print(f"Warning: {stock_code} has no valid yyyymmdd field, using today's date: {update_date}")
             stock_info['yyyymmdd'] = update_date
             json_modified = True
-        
-        print(f"Processing {stock_code} ({stock_name}) for date {update_date}...")
-        
+        if not should_fetch_minute_chart(update_date, current_date_str):
+            print(f"[{stock_code}] Daily chart {update_date} is beyond 10-day limit. Skipping.")
+            continue
+        daily_dates[stock_code] = update_date
+        dates = minute_dates.setdefault(stock_code, [])
+        if update_date not in dates:
+            dates.append(update_date)
+    if json_modified:
+        save_interested_stocks_to_json(stocks)
+    
+    codes = sorted(set(daily_dates) | set(minute_dates))
+    done = checkpoint['done']
+    with status_lock:
+        status_info['progress'] = {
+            'run_id': checkpoint['run_id'],
+            'started': checkpoint['started'],
+            'resumed_done': 0,
+            'total': len(codes),
+            'done': 0,
+            'failed': 0,
+            'tr_calls': 0,
+            'tr_quota_per_sec': GATHER_TR_PER_SEC,
+            'workers': GATHER_WORKERS,
+            'elapsed_seconds': 0,
+            'stocks_per_min': None,
+            'tr_per_sec': None,
+            'eta_seconds': None,
+            'in_flight': {},
+            'stocks': {},
+            '_t0': time.monotonic(),
+        }
+        progress = status_info['progress']
+        for stock_code in codes:
+            finished = ((stock_code not in daily_dates or f"daily:{stock_code}" in done)
+                        and f"minute:{stock_code}" in done)
+            progress['stocks'][stock_code] = 'done' if finished else 'pending'
+            if finished:
+                progress['done'] += 1
+                progress['resumed_done'] += 1
+    print(f"\n=== Gathering daily and minute charts for {len(codes)} stocks "
+          f"({progress['resumed_done']} already done) ===")
+    
+    # 4. Gather stocks concurrently under the shared TR quota
+    daily_count = 0
+    minute_count = 0
+    
+    def run_one(stock_code):
+        if thread_stop_event.is_set():
+            return 0, 0
+        stock_name = stocks.get(stock_code, {}).get('stock_name', stock_code)
         try:
-            if not should_fetch_minute_chart(update_date, current_date_str):
-                print(f"[{stock_code}] Daily chart {update_date} is beyond 10-day limit. Skipping minute chart.")
-                continue
-        
-            # Fetch data using ka10081 with the update date
-            result = get_day_chart(token, stock_code, stock_name)
-            
-            # Basic validation of result
-            if not isinstance(result, dict):
-                print(f"Invalid response format for {stock_code}")
-                continue
-                
-            if 'return_code' in result and str(result['return_code']) != '0':
-                msg = result.get('return_msg', 'Unknown Error')
-                print(f"API Error for {stock_code}: {msg} (Code: {result['return_code']})")
-                continue
-                
-            # Extract data list
-            # ka10081 main snippet uses 'stk_dt_pole_chart_qry'
-            data_list = result.get('stk_dt_pole_chart_qry')
-            
-            if data_list is None:
-                # Try fallback to 'output' if key differs
-                data_list = result.get('output')
-            
-            if data_list and isinstance(data_list, list):
-                save_chart_data(stock_code, update_date, data_list)
-                daily_count += 1
-            else:
-                print(f"No chart data found in response for {stock_code}")
-                
-            # Be polite to the API rate limits
-            time.sleep(0.2)
-            
+            counts = gather_stock(token, stock_code, stock_name, daily_dates.get(stock_code),
+                                  minute_dates.get(stock_code, []), checkpoint)
+            update_gather_progress(stock_code, 'done')
+            return counts
         except Exception as e:
             print(f"Exception processing {stock_code}: {e}")
             traceback.print_exc()
+            update_gather_progress(stock_code, 'error')
             with status_lock:
                 status_info['errors'].append({'time': datetime.now().isoformat(), 'stock': stock_code, 'error': str(e)})
-    if json_modified:
-        save_interested_stocks_to_json(stocks)
-
-    with status_lock:
-        status_info['daily_charts_processed'] = daily_count
-
-    # 4. Gather minute charts independently by scanning directory
-    minute_count = gather_minute_charts_with_count(token, stocks)
+            return 0, 0
+    
+    pending = [c for c in codes if progress['stocks'][c] == 'pending']
+    with ThreadPoolExecutor(max_workers=GATHER_WORKERS, thread_name_prefix='Gather') as executor:
+        for d, m in executor.map(run_one, pending):
+            daily_count += d
+            minute_count += m
+    
+    interrupted = thread_stop_event.is_set()
+    if not interrupted:
+        try:
+            os.remove(GATHER_CHECKPOINT_FILE)
+        except OSError:
+            pass
     
     with status_lock:
+        status_info['daily_charts_processed'] = daily_count
         status_info['minute_charts_processed'] = minute_count
         status_info['status'] = 'idle'
         # Keep only last 10 errors
         if len(status_info['errors']) > 10:
             status_info['errors'] = status_info['errors'][-10:]
     
-    print(f"Daily job finished at {datetime.now()}")
-
-def gather_minute_charts_with_count(token, stocks):
-    """Wrapper for gather_minute_charts that returns count."""
-    print(f"\n=== Starting minute chart gathering at {datetime.now()} ===")
-    
-    current_date_str = datetime.now().strftime("%Y%m%d")
-    daily_charts = get_daily_chart_files()
-    
-    if not daily_charts:
-        print("No daily chart files found in directory.")
-        return 0
-    
-    print(f"Found {len(daily_charts)} daily chart files.")
-    
-    minute_count = 0
-    # Process each daily chart file
-    for stock_code, date_str, file_path in daily_charts:
-        # Check if within 10-day limit
-        if not should_fetch_minute_chart(date_str, current_date_str):
-            print(f"[{stock_code}] Daily chart {date_str} is beyond 10-day limit. Skipping minute chart.")
-            continue
-        
-        # Get stock name from interested_stocks if available
-        stock_name = stock_code
-        if stock_code in stocks:
-            stock_name = stocks[stock_code].get('stock_name', stock_code)
-        
-        print(f"[{stock_code}] Daily chart {date_str} is within 10-day limit. Fetching minute chart...")
-        
-        try:
-            minute_data = get_bun_chart(token, stock_code, stock_name)
-            if minute_data and isinstance(minute_data, list):
-                save_minute_chart_data(stock_code, date_str, minute_data)
-                minute_count += 1
-            else:
-                print(f"[{stock_code}] No minute chart data returned")
-            
-            # Be polite to the API rate limits
-            time.sleep(0.2)
-            
-        except Exception as e:
-            print(f"[{stock_code}] Error fetching minute chart: {e}")
-            traceback.print_exc()
-    
-    print(f"=== Minute chart gathering finished at {datetime.now()} ===\n")
-    return minute_count
+    print(f"Daily job {'interrupted (will resume)' if interrupted else 'finished'} at {datetime.now()}")
 
 
 def _normalize_p3_posted_data(raw_data):
@@ -756,6 +841,7 @@ def run_p3_condition_job(now):
         now=now,
     )
 
+    from ka_condition import search_condition_by_name  # websockets is only needed here
     stocks = search_condition_by_name(P3_CONDITION_NAME)
     print(f"[P3] Condition '{P3_CONDITION_NAME}' returned {len(stocks)} stock(s)")
     stock_summary = [
@@ -866,8 +952,11 @@ def background_data_gathering():
             status_info['last_run'] = last_run
         print(f"Loaded last run time from disk: {last_run}")
     
-    # Check if we should skip initial gathering
-    if should_skip_initial_gathering():
+    # Resume a run the service was stopped in the middle of, else check if we should skip initial gathering
+    if load_gather_checkpoint() is not None:
+        print("Resuming interrupted data gathering...")
+        run_daily_job(resume=True)
+    elif should_skip_initial_gathering():
         print("Last gathering was today. Skipping initial gathering.")
         with status_lock:
             status_info['status'] = 'idle'
@@ -905,16 +994,58 @@ def background_data_gathering():
     
     print("Background data gathering thread stopped.")
 
+def chart_compactor_loop():
+    """Move chart bars older than the minute-fetch window into the compressed cold tier."""
+    print("Chart compactor thread started.")
+    wait = 60  # first pass shortly after startup
+    while not thread_stop_event.wait(wait):
+        wait = CHART_COMPACT_INTERVAL
+        with status_lock:
+            gathering = status_info['status'] == 'running'
+        if gathering:
+            wait = 600  # the gather is writing the same files; try again later
+            continue
+        try:
+            summary = chartstore.compact_all(stop_event=thread_stop_event)
+            if summary['rows'] or summary['errors']:
+                datagather_log(f"chart compaction: {summary}")
+        except Exception as e:
+            print(f"Error compacting chart store: {e}")
+    print("Chart compactor thread stopped.")
+
+def apply_env_config():
+    """Apply datagather settings from env.json (P3_CONDITION_NAME)."""
+    global P3_CONDITION_NAME
+    env = au1001.env_json or {}
+    P3_CONDITION_NAME = env.get('P3_CONDITION_NAME', P3_CONDITION_NAME)
+
+
+def on_env_json_changed(path):
+    """env.json changed: reload accounts/host and the condition name without restarting."""
+    added, removed, changed = reload_env_json()
+    apply_env_config()
+    datagather_log(f'{path} reloaded: added={added} removed={removed} changed={changed} '
+                   f'condition={P3_CONDITION_NAME}')
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown."""
-    global background_thread, thread_stop_event, status_info
+    global background_thread, compactor_thread, prerender_thread, thread_stop_event, status_info
     
     # Startup
     print("Starting FastAPI application...")
     
     with status_lock:
         status_info['status'] = 'starting'
+
+    try:
+        au1001.load_env_json()
+        apply_env_config()
+    except Exception as e:
+        print(f"Error loading env.json: {e}")
+    configwatch.watch('env.json', on_env_json_changed)
+    configwatch.start()
     
     # Start background thread
     thread_stop_event.clear()
@@ -925,11 +1056,19 @@ async def lifespan(app: FastAPI):
     )
     background_thread.start()
     print("Background thread started successfully")
+    compactor_thread = threading.Thread(target=chart_compactor_loop, daemon=True, name="ChartCompactorThread")
+    compactor_thread.start()
+    prerender_thread = threading.Thread(target=prerender_loop, daemon=True, name="ChartPrerenderThread")
+    prerender_thread.start()
+    renderpool.start()
     
     yield
     
     # Shutdown
     print("Shutting down application...")
+    configwatch.stop()
+    bgjobs.shutdown()
+    renderpool.shutdown()
     thread_stop_event.set()
     if background_thread and background_thread.is_alive():
         print("Waiting for background thread to stop...")
@@ -1463,7 +1602,12 @@ async def logs_file_delete_api(path: str = Query("")):
 async def get_status():
     """Get current status as JSON."""
     with status_lock:
-        return JSONResponse(content=status_info.copy())
+        status = status_info.copy()
+        progress = status.get('progress')
+        if progress:
+            status['progress'] = {k: (v.copy() if isinstance(v, dict) else v)
+                                  for k, v in progress.items() if not k.startswith('_')}
+    return JSONResponse(content=status)
 
 @app.post("/api/trigger")
 @app.post("/stock/data/api/trigger")
@@ -1473,45 +1617,28 @@ async def trigger_job():
     return {"status": "success", "message": "Data gathering job triggered"}
 
 def get_stock_list():
-    """Get list of stocks with dates from chart_data directory with their names."""
+    """Get list of stocks with dates from the chart manifest with their names."""
     stocks = []
-    interested_stocks = load_interested_stocks()
-    
-    if not os.path.exists(CHART_DIR):
-        return stocks
+    names = {}
+    interested_stocks = None
     
     try:
-        for filename in os.listdir(CHART_DIR):
-            # Skip minute chart files
-            if filename.endswith('_min.json'):
-                continue
-            
-            # Parse daily chart filename: YYYYMMDD_stockcode.json
-            if filename.endswith('.json'):
-                parts = filename[:-5].split('_')  # Remove .json and split
-                if len(parts) == 2:
-                    date_str, stock_code = parts
-                    if len(date_str) == 8 and date_str.isdigit():
-                        # Get stock name from interested_stocks, or call get_stockname if not found
-                        stock_name = stock_code
-                        if stock_code in interested_stocks:
-                            stock_name = interested_stocks[stock_code].get('stock_name', stock_code)
-                        # If stock name is still just the stock code, try to get it from API
-                        if stock_name == stock_code:
-                            try:
-                                stock_info = get_stockinfo(stock_code)
-                                if not stock_name or stock_name == '':
-                                    stock_name = stock_code
-                            except Exception as e:
-                                print(f"Error getting stock name for {stock_code}: {e}")
-                                stock_name = stock_code
-                        stocks.append({
-                            'date': date_str,
-                            'stock_code': stock_code,
-                            'stock_name': stock_name
-                        })
+        for entry in chartstore.manifest_entries('daily'):
+            stock_code = entry['stock_code']
+            stock_name = names.get(stock_code) or entry['stock_name']
+            if not stock_name:
+                # Not in the manifest yet: interested_stocks, then the API (once per stock)
+                if interested_stocks is None:
+                    interested_stocks = load_interested_stocks()
+                stock_name = get_chart_stock_name(stock_code, '', interested_stocks)
+            names[stock_code] = stock_name
+            stocks.append({
+                'date': entry['date'],
+                'stock_code': stock_code,
+                'stock_name': stock_name
+            })
     except Exception as e:
-        print(f"Error scanning chart directory: {e}")
+        print(f"Error reading chart manifest: {e}")
     
     # Sort by date (descending, newest first) then by stock code
     stocks.sort(key=lambda x: (x['date'], x['stock_code']), reverse=True)
@@ -3131,31 +3258,8 @@ async def get_daily_chart_data(stock_code: str, date: str = Query(...)):
     """Get daily chart data for a stock matching both stock code and date."""
     print('get_daily_chart_data {} {}'.format(stock_code, date))
     try:
-        # Find daily chart files matching both stock code and date
-        all_data = []
-        
-        if not os.path.exists(CHART_DIR):
-            return JSONResponse(content={"status": "error", "message": "Chart directory not found"})
-        
-        for filename in os.listdir(CHART_DIR):
-            if filename.endswith('_min.json'):
-                continue
-            
-            if filename.endswith('.json'):
-                parts = filename[:-5].split('_')
-                if len(parts) == 2:
-                    date_str, file_stock_code = parts
-                    # Match both stock code and date
-                    if file_stock_code == stock_code and date_str == date and len(date_str) == 8:
-                        file_path = os.path.join(CHART_DIR, filename)
-                        print('get_daily_chart_data file_path={}'.format(file_path))
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                file_data = json.load(f)
-                                if isinstance(file_data, list):
-                                    all_data.extend(file_data)
-                        except Exception as e:
-                            print(f"Error reading {filename}: {e}")
+        # Rows of the daily chart entry matching both stock code and date
+        all_data = chartstore.daily_records(stock_code, date)
         
         # Sort by date
         all_data.sort(key=lambda x: x.get('dt', ''), reverse=True)
@@ -3174,33 +3278,8 @@ async def get_minute_chart_data(stock_code: str, date: str = Query(...)):
     print('get_minute_chart_data {} {}'.format(stock_code, date))
     """Get minute chart data for a stock matching both stock code and date."""
     try:
-        # Find minute chart files matching both stock code and date
-        all_data = []
-        
-        if not os.path.exists(CHART_DIR):
-            return JSONResponse(content={"status": "error", "message": "Chart directory not found"})
-        
-        for filename in os.listdir(CHART_DIR):
-            if not filename.endswith('_min.json'):
-                continue
-            
-            # Parse: YYYYMMDD_stockcode_min.json
-            if filename.endswith('_min.json'):
-                base_name = filename[:-9]  # Remove '_min.json'
-                parts = base_name.split('_')
-                if len(parts) == 2:
-                    date_str, file_stock_code = parts
-                    # Match both stock code and date
-                    if file_stock_code == stock_code and date_str == date and len(date_str) == 8:
-                        file_path = os.path.join(CHART_DIR, filename)
-                        print('get_minute_chart_data {} {} file_path={}'.format(stock_code, date, file_path))
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                file_data = json.load(f)
-                                if isinstance(file_data, list):
-                                    all_data.extend(file_data)
-                        except Exception as e:
-                            print(f"Error reading {filename}: {e}")
+        # Rows of the minute chart entry matching both stock code and date
+        all_data = chartstore.minute_records(stock_code, date)
         
         # Sort by time
         all_data.sort(key=lambda x: x.get('cntr_tm', ''), reverse=True)
@@ -3222,24 +3301,19 @@ COMPARE_CHART_H = 260
 MINUTE_CHART_H = 380
 
 MA_HEX = ['#e6194b', '#2ca02c', '#4363d8', '#f58231']
-_FONT = cv2.FONT_HERSHEY_SIMPLEX
-
-# BGR colors
-_COL_BG = (255, 255, 255)
-_COL_AXIS = (221, 221, 221)
-_COL_GRID = (242, 242, 242)
-_COL_GRAY = (119, 119, 119)
-_COL_DIV = (0, 168, 224)        # date divider line
-_COL_DATE_TXT = (0, 0, 0)       # date label (black)
-_COL_RISE = (53, 57, 229)       # #e53935
-_COL_FALL = (229, 136, 30)      # #1e88e5
-_COL_REF = (187, 187, 187)      # comparison reference line
 
 # Short-lived cache of fetched chart data to avoid refetching across the
-# separate image endpoints (daily/compare share the same daily data).
+# separate image endpoints (daily/compare share the same daily data), and a cache
+# of encoded PNGs keyed by everything they are drawn from. Both are LRUs bounded by bytes.
 CHART_CACHE_TTL = 60
-_chart_cache = {}
-_chart_cache_lock = threading.RLock()
+CANDLE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CANDLE_BYTES = 360  # approximate in-memory size of one normalized candle dict
+RENDER_VERSION = 1  # bump when the drawing code changes so image keys (and ETags) change
+_candle_cache = rendercache.ByteLRU(CANDLE_CACHE_MAX_BYTES, ttl=CHART_CACHE_TTL)
+_image_cache = rendercache.ByteLRU(IMAGE_CACHE_MAX_BYTES)
+_not_modified = {'count': 0}
+_not_modified_lock = threading.Lock()
 
 
 def _hex_bgr(h):
@@ -3276,252 +3350,99 @@ def _normalize_candles(raw, label_key):
     return sorted(seen.values(), key=lambda p: p['label'])
 
 
-def _compute_ma(closes, period):
+def _compute_ma(closes, period, stock_code=None, labels=None):
     n = len(closes)
-    out = [None] * n
     if not period or period <= 0:
-        return out
-    s = 0.0
-    for i in range(n):
-        s += closes[i]
-        if i >= period:
-            s -= closes[i - period]
-        if i >= period - 1:
-            out[i] = s / period
-    return out
-
-
-def _put_text_right(img, s, rx, cy, color, scale=0.34):
-    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
-    cv2.putText(img, s, (int(rx - w), int(cy + h / 2)), _FONT, scale, color, 1, cv2.LINE_8)
-
-
-def _put_text_cx(img, s, cx, ty, color, scale=0.3):
-    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
-    cv2.putText(img, s, (int(cx - w / 2), int(ty + h)), _FONT, scale, color, 1, cv2.LINE_8)
-
-
-def _put_text_center(img, s, color=(136, 136, 136), scale=0.5):
-    height, width = img.shape[:2]
-    (w, h), _ = cv2.getTextSize(s, _FONT, scale, 1)
-    cv2.putText(img, s, (int((width - w) / 2), int((height + h) / 2)), _FONT, scale, color, 1, cv2.LINE_8)
-
-
-def _draw_x_labels(img, labels, x_at, base_y, n):
-    step = max(1, n // 12)
-    for i in range(0, n, step):
-        raw = str(labels[i])
-        if len(raw) == 8:
-            txt = raw[4:6] + '/' + raw[6:8]
-        elif len(raw) >= 12:
-            txt = raw[4:6] + '/' + raw[6:8] + ' ' + raw[8:10] + ':' + raw[10:12]
-        else:
-            txt = raw
-        _put_text_cx(img, txt, x_at(i), base_y + 6, _COL_GRAY)
-
-
-def _render_candle_png(candles, ma_lines, height, pole_width, pole_spacing, date_dividers):
-    """Render a candlestick chart (with optional MA overlays) to a BGR numpy image.
-    ma_lines = [{ 'values':[...|None], 'color':(b,g,r), 'visible':bool }]
-    """
-    left, right, top, bottom = 64, 24, 16, 42
-    n = len(candles)
-    chart_w = n * pole_spacing
-    width = max(left + chart_w + right, 400)
-    chart_h = height - top - bottom
-    img = np.full((height, width, 3), 255, dtype=np.uint8)
-    if n == 0:
-        _put_text_center(img, 'No data')
-        return img
-
-    lo, hi = float('inf'), float('-inf')
-    for c in candles:
-        if c['high'] > 0:
-            hi = max(hi, c['high'])
-        if c['low'] > 0:
-            lo = min(lo, c['low'])
-    for line in ma_lines:
-        if not line['visible']:
-            continue
-        for v in line['values']:
-            if v is not None:
-                hi = max(hi, v)
-                lo = min(lo, v)
-    if lo == float('inf') or hi == float('-inf'):
-        lo, hi = 0.0, 100.0
-    if lo == hi:
-        lo *= 0.95
-        hi *= 1.05
-    pad = max((hi - lo) * 0.05, 1)
-    lo -= pad
-    hi += pad
-    rng = hi - lo
-    scale = chart_h / rng if rng > 0 else 1
-
-    def price_to_y(p):
-        return int(round(top + chart_h - (p - lo) * scale))
-
-    def x_at(i):
-        return int(round(left + i * pole_spacing + pole_width / 2))
-
-    # Y gridlines + labels
-    ticks = 8
-    for i in range(ticks + 1):
-        price = hi - rng * (i / ticks)
-        y = price_to_y(price)
-        cv2.line(img, (left, y), (left + chart_w, y), _COL_GRID, 1, cv2.LINE_8)
-        _put_text_right(img, format(int(round(price)), ','), left - 6, y, _COL_GRAY)
-
-    # Axes
-    cv2.line(img, (left, top), (left, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
-    cv2.line(img, (left, top + chart_h), (left + chart_w, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
-
-    # Date-change vertical dividers (minute charts)
-    if date_dividers:
-        prev = None
-        for i, c in enumerate(candles):
-            d = str(c['label'])[:8]
-            if prev is not None and d != prev:
-                x = int(round(left + i * pole_spacing))
-                cv2.line(img, (x, top), (x, top + chart_h), _COL_DIV, 1, cv2.LINE_8)
-                txt = (d[4:6] + '/' + d[6:8]) if len(d) == 8 else d
-                _put_text_cx(img, txt, x, top + 2, _COL_DATE_TXT)
-            prev = d
-
-    # Candles
-    for i, c in enumerate(candles):
-        x = x_at(i)
-        color = _COL_RISE if c['close'] >= c['open'] else _COL_FALL
-        cv2.line(img, (x, price_to_y(c['high'])), (x, price_to_y(c['low'])), color, 1, cv2.LINE_8)
-        oy, cy = price_to_y(c['open']), price_to_y(c['close'])
-        ytop = min(oy, cy)
-        bh = max(1, abs(cy - oy))
-        x0 = int(round(x - pole_width / 2))
-        cv2.rectangle(img, (x0, ytop), (x0 + pole_width, ytop + bh), color, -1, cv2.LINE_8)
-
-    # MA overlay lines
-    for line in ma_lines:
-        if not line['visible']:
-            continue
-        color = line['color']
-        prev_pt = None
-        for i, v in enumerate(line['values']):
-            if v is None:
-                prev_pt = None
-                continue
-            pt = (x_at(i), price_to_y(v))
-            if prev_pt is not None:
-                cv2.line(img, prev_pt, pt, color, 1, cv2.LINE_8)
-            prev_pt = pt
-
-    _draw_x_labels(img, [c['label'] for c in candles], x_at, top + chart_h, n)
-    return img
-
-
-def _render_line_png(labels, series, ref_value, height):
-    """Render a multi-series line chart (MA comparison) to a BGR numpy image.
-    series = [{ 'values':[...|None], 'color':(b,g,r) }]
-    """
-    left, right, top, bottom = 64, 24, 16, 42
-    pole_spacing = 7
-    n = len(labels)
-    chart_w = n * pole_spacing
-    width = max(left + chart_w + right, 400)
-    chart_h = height - top - bottom
-    img = np.full((height, width, 3), 255, dtype=np.uint8)
-    if n == 0:
-        _put_text_center(img, 'No data')
-        return img
-
-    lo, hi = float('inf'), float('-inf')
-    for s in series:
-        for v in s['values']:
-            if v is not None:
-                hi = max(hi, v)
-                lo = min(lo, v)
-    if ref_value is not None:
-        hi = max(hi, ref_value)
-        lo = min(lo, ref_value)
-    if lo == float('inf') or hi == float('-inf'):
-        lo, hi = 0.9, 1.1
-    if lo == hi:
-        lo *= 0.99
-        hi *= 1.01
-    pad = max((hi - lo) * 0.08, 0.001)
-    lo -= pad
-    hi += pad
-    rng = hi - lo
-    scale = chart_h / rng if rng > 0 else 1
-
-    def val_to_y(v):
-        return int(round(top + chart_h - (v - lo) * scale))
-
-    def x_at(i):
-        return int(round(left + i * pole_spacing))
-
-    ticks = 6
-    for i in range(ticks + 1):
-        val = hi - rng * (i / ticks)
-        y = val_to_y(val)
-        cv2.line(img, (left, y), (left + chart_w, y), _COL_GRID, 1, cv2.LINE_8)
-        _put_text_right(img, '{:.3f}'.format(val), left - 6, y, _COL_GRAY)
-
-    cv2.line(img, (left, top), (left, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
-    cv2.line(img, (left, top + chart_h), (left + chart_w, top + chart_h), _COL_AXIS, 1, cv2.LINE_8)
-
-    # Reference line (dashed)
-    if ref_value is not None and lo <= ref_value <= hi:
-        y = val_to_y(ref_value)
-        x = left
-        while x < left + chart_w:
-            cv2.line(img, (x, y), (min(x + 5, left + chart_w), y), _COL_REF, 1, cv2.LINE_8)
-            x += 9
-
-    for s in series:
-        color = s['color']
-        prev_pt = None
-        for i, v in enumerate(s['values']):
-            if v is None:
-                prev_pt = None
-                continue
-            pt = (x_at(i), val_to_y(v))
-            if prev_pt is not None:
-                cv2.line(img, prev_pt, pt, color, 1, cv2.LINE_8)
-            prev_pt = pt
-
-    _draw_x_labels(img, labels, x_at, top + chart_h, n)
-    return img
+        return [None] * n
+    values = None
+    if stock_code and labels:
+        try:
+            values = features.stored_ma(stock_code, labels, closes, period)
+        except Exception as e:
+            print(f"_compute_ma: feature store lookup failed for {stock_code}: {e}")
+    if values is None:
+        values = features.moving_average(closes, period)
+    return [None if v != v else float(v) for v in values.tolist()]
 
 
-def _save_png(img, filename):
-    """Encode image to PNG, save it to CHART_IMG_DIR, and return the PNG bytes."""
+def _write_png(data, filename):
+    """Save PNG bytes to CHART_IMG_DIR and return them."""
     os.makedirs(CHART_IMG_DIR, exist_ok=True)
-    ok, buf = cv2.imencode('.png', img)
-    if not ok:
-        raise RuntimeError('PNG encode failed')
-    data = buf.tobytes()
     try:
         with open(os.path.join(CHART_IMG_DIR, filename), 'wb') as f:
             f.write(data)
     except Exception as e:
-        print(f"_save_png: failed to save {filename}: {e}")
+        print(f"_write_png: failed to save {filename}: {e}")
     return data
 
 
-def _image_json(img, filename):
-    """Save the rendered image as a PNG file and return it as a JSON response
-    carrying a base64 data URI. JSON is used (instead of raw image/png bytes)
-    so the response passes intact through the gateway that wraps non-JSON
-    upstream responses, and so it works whether accessed directly or proxied.
+def _png_json(data, headers=None):
+    """Return PNG bytes as a JSON response carrying a base64 data URI. JSON is used
+    (instead of raw image/png bytes) so the response passes intact through the gateway
+    that wraps non-JSON upstream responses, and so it works whether accessed directly
+    or proxied.
     """
-    data = _save_png(img, filename)
     b64 = base64.b64encode(data).decode('ascii')
     return JSONResponse(
         content={"status": "success", "image": "data:image/png;base64," + b64},
-        headers={'Cache-Control': 'no-store'},
+        headers=headers or {'Cache-Control': 'no-store'},
     )
 
 
+def _error_image_json(message, height, filename):
+    """Render an error message as a chart-sized PNG, save it and return it as an uncached JSON response."""
+    return _png_json(_write_png(chartrender.error_png('Error: ' + message, height), filename))
+
+
+def _render_busy_json(e):
+    return JSONResponse(status_code=503, content={"status": "error", "message": str(e)},
+                        headers={'Retry-After': '1'})
+
+
+def _plan_image(kind, params, version, make_spec, filename, if_none_match=None):
+    """
+    Look an image up in the image cache. The cache key hashes kind, params and the data
+    version, and doubles as a strong ETag: a client already holding it gets a 304.
+    Returns (response, None) for a 304 or a cache hit, otherwise (None, plan) with the
+    chartrender spec from make_spec() for renderpool; _render_image() finishes the plan.
+    """
+    key = rendercache.content_key(kind, RENDER_VERSION, version, params)
+    etag = '"' + key + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if rendercache.etag_matches(if_none_match, etag):
+        with _not_modified_lock:
+            _not_modified['count'] += 1
+        return Response(status_code=304, headers=headers), None
+    data = _image_cache.get(key)
+    if data is not None:
+        return _png_json(data, headers), None
+    return None, {'key': key, 'headers': headers, 'spec': make_spec(), 'filename': filename}
+
+
+def _store_image(plan, data):
+    if plan['filename']:
+        _write_png(data, plan['filename'])
+    _image_cache.put(plan['key'], data, len(data))
+    return _png_json(data, plan['headers'])
+
+
+async def _render_image(planned):
+    """Response for a _plan_image() result, awaiting the render pool on a cache miss."""
+    response, plan = planned
+    if response is not None:
+        return response
+    data = await asyncio.wrap_future(renderpool.submit(plan['spec']))
+    return await asyncio.to_thread(_store_image, plan, data)
+
+
+def _render_image_now(planned):
+    """Blocking _render_image() for worker threads; waits for room in the render queue instead of failing."""
+    response, plan = planned
+    if response is not None:
+        return response
+    return _store_image(plan, renderpool.render(plan['spec']))
+
+
 def _clean_stock_code(stock_code):
     stock_code = (stock_code or '').strip()
     if stock_code.upper().startswith('A') and stock_code[1:].isdigit():
@@ -3530,27 +3451,27 @@ def _clean_stock_code(stock_code):
 
 
 def _cache_get(key):
-    with _chart_cache_lock:
-        e = _chart_cache.get(key)
-        if e and (time.time() - e['ts'] < CHART_CACHE_TTL):
-            return e['value']
-    return None
+    """(value, data version) of fetched candles, or None when absent or older than CHART_CACHE_TTL."""
+    return _candle_cache.get(key)
 
 
-def _cache_put(key, value):
-    with _chart_cache_lock:
-        _chart_cache[key] = {'ts': time.time(), 'value': value}
+def _cache_put(key, value, candles):
+    """Cache value (holding the candles) with a content hash of the candles as its data version."""
+    version = rendercache.content_key([(c['label'], c['open'], c['high'], c['low'], c['close']) for c in candles])
+    entry = (value, version)
+    _candle_cache.put(key, entry, 256 + CANDLE_BYTES * len(candles))
+    return entry
 
 
-def _get_daily_candles(stock_code):
-    """Return (stock_name, [normalized daily candles]) with short-lived caching."""
+def _fetch_daily_candles(stock_code):
+    """Return ((stock_name, [normalized daily candles]), data version) with short-lived caching."""
     key = 'daily:' + stock_code
     cached = _cache_get(key)
     if cached is not None:
         return cached
     token = get_one_token()
     if not token:
-        return ('', [])
+        return (('', []), '')
     name = ''
     try:
         info = get_stockinfo(stock_code)
@@ -3565,19 +3486,23 @@ def _get_daily_candles(stock_code):
             daily = _normalize_candles(resp.get('stk_dt_pole_chart_qry', []) or [], 'dt')
     except Exception as e:
         print(f"_get_daily_candles: get_day_chart failed: {e}")
-    result = (name, daily)
-    _cache_put(key, result)
-    return result
+    return _cache_put(key, (name, daily), daily)
 
 
-def _get_minute_candles(stock_code, tic):
+def _get_daily_candles(stock_code):
+    """Return (stock_name, [normalized daily candles]) with short-lived caching."""
+    return _fetch_daily_candles(stock_code)[0]
+
+
+def _fetch_minute_candles(stock_code, tic):
+    """Return ([normalized minute candles], data version) with short-lived caching (see _fetch_daily_candles)."""
     key = 'minute:' + stock_code + ':' + tic
     cached = _cache_get(key)
     if cached is not None:
         return cached
     token = get_one_token()
     if not token:
-        return []
+        return ([], '')
     minute = []
     try:
         if tic == '15':
@@ -3592,8 +3517,11 @@ def _get_minute_candles(stock_code, tic):
             minute = _normalize_candles(resp or [], 'cntr_tm')
     except Exception as e:
         print(f"_get_minute_candles: fetch failed (tic={tic}): {e}")
-    _cache_put(key, minute)
-    return minute
+    return _cache_put(key, minute, minute)
+
+
+def _get_minute_candles(stock_code, tic):
+    return _fetch_minute_candles(stock_code, tic)[0]
 
 
 def _parse_ma_params(ma, vis):
@@ -3610,89 +3538,325 @@ def _parse_ma_params(ma, vis):
     return periods, vis_flags
 
 
-def _build_daily_img(stock_code, ma, vis):
+def _plan_daily_img(stock_code, ma, vis, if_none_match=None):
     stock_code = _clean_stock_code(stock_code)
     periods, vis_flags = _parse_ma_params(ma, vis)
-    _name, daily = _get_daily_candles(stock_code)
-    closes = [c['close'] for c in daily]
-    ma_lines = []
-    for i, p in enumerate(periods):
-        ma_lines.append({
-            'values': _compute_ma(closes, p),
-            'color': _hex_bgr(MA_HEX[i % len(MA_HEX)]),
-            'visible': vis_flags[i] if i < len(vis_flags) else True,
-        })
-    img = _render_candle_png(daily, ma_lines, DAILY_CHART_H, 4, 7, False)
-    return _image_json(img, stock_code + '_daily.png')
+    (_name, daily), version = _fetch_daily_candles(stock_code)
+
+    def make_spec():
+        closes = [c['close'] for c in daily]
+        labels = [c['label'] for c in daily]
+        ma_lines = []
+        for i, p in enumerate(periods):
+            ma_lines.append({
+                'values': _compute_ma(closes, p, stock_code, labels),
+                'color': _hex_bgr(MA_HEX[i % len(MA_HEX)]),
+                'visible': vis_flags[i] if i < len(vis_flags) else True,
+            })
+        return renderpool.candle_spec(daily, ma_lines, DAILY_CHART_H, 4, 7, False)
 
+    # stored MAs can come from the feature store, so its daily series is part of the data version
+    return _plan_image('daily', (stock_code, periods, vis_flags[:len(periods)]),
+                       (version, chartstore.series_signature(stock_code, 'daily')),
+                       make_spec, stock_code + '_daily.png', if_none_match)
 
-def _build_compare_img(stock_code, ma, vis):
+
+def _plan_compare_img(stock_code, ma, vis, if_none_match=None):
     stock_code = _clean_stock_code(stock_code)
     periods, vis_flags = _parse_ma_params(ma, vis)
-    _name, daily = _get_daily_candles(stock_code)
-    closes = [c['close'] for c in daily]
-    ma_arrays = [_compute_ma(closes, p) for p in periods]
-    base_idx = 3 if len(ma_arrays) > 3 else (len(ma_arrays) - 1)
-    base = ma_arrays[base_idx] if ma_arrays else []
-    series = []
-    for i, p in enumerate(periods):
-        if not (vis_flags[i] if i < len(vis_flags) else True):
-            continue
-        vals = []
-        for k in range(len(ma_arrays[i])):
-            v = ma_arrays[i][k]
-            b = base[k] if k < len(base) else None
-            vals.append(v / b if (v is not None and b not in (None, 0)) else None)
-        series.append({'values': vals, 'color': _hex_bgr(MA_HEX[i % len(MA_HEX)])})
-    labels = [c['label'] for c in daily]
-    img = _render_line_png(labels, series, 1.0, COMPARE_CHART_H)
-    return _image_json(img, stock_code + '_compare.png')
-
-
-def _build_minute_img(stock_code, tic):
+    (_name, daily), version = _fetch_daily_candles(stock_code)
+
+    def make_spec():
+        closes = [c['close'] for c in daily]
+        labels = [c['label'] for c in daily]
+        ma_arrays = [_compute_ma(closes, p, stock_code, labels) for p in periods]
+        base_idx = 3 if len(ma_arrays) > 3 else (len(ma_arrays) - 1)
+        base = ma_arrays[base_idx] if ma_arrays else []
+        series = []
+        for i, p in enumerate(periods):
+            if not (vis_flags[i] if i < len(vis_flags) else True):
+                continue
+            vals = []
+            for k in range(len(ma_arrays[i])):
+                v = ma_arrays[i][k]
+                b = base[k] if k < len(base) else None
+                vals.append(v / b if (v is not None and b not in (None, 0)) else None)
+            series.append({'values': vals, 'color': _hex_bgr(MA_HEX[i % len(MA_HEX)])})
+        return renderpool.line_spec(labels, series, 1.0, COMPARE_CHART_H)
+
+    return _plan_image('compare', (stock_code, periods, vis_flags[:len(periods)]),
+                       (version, chartstore.series_signature(stock_code, 'daily')),
+                       make_spec, stock_code + '_compare.png', if_none_match)
+
+
+def _plan_minute_img(stock_code, tic, if_none_match=None):
     stock_code = _clean_stock_code(stock_code)
     valid_tics = {'15', '30', '60'}
     if tic not in valid_tics:
         tic = '15'
-    minute = _get_minute_candles(stock_code, tic)
-    img = _render_candle_png(minute, [], MINUTE_CHART_H, 3, 5, True)
-    return _image_json(img, stock_code + '_minute_' + tic + '.png')
+    minute, version = _fetch_minute_candles(stock_code, tic)
+    return _plan_image('minute', (stock_code, tic), version,
+                       lambda: renderpool.candle_spec(minute, [], MINUTE_CHART_H, 3, 5, True),
+                       stock_code + '_minute_' + tic + '.png', if_none_match)
 
 
-@app.get("/api/chart-img/daily/{stock_code}")
-@app.get("/stock/data/api/chart-img/daily/{stock_code}")
-async def chart_img_daily(stock_code: str, ma: str = Query('5,20,60,120'), vis: str = Query('1,1,1,1')):
-    try:
-        return await asyncio.to_thread(_build_daily_img, stock_code, ma, vis)
-    except Exception as e:
+def _plan_tile_img(stock_code, level, x, if_none_match=None):
+    stock_code = _clean_stock_code(stock_code)
+    bars, lo, hi, version = charttiles.tile(stock_code, level, x)
+    # tiles are only served from the image cache; there are too many to keep as files
+    return _plan_image('tile', (stock_code, level, x), version,
+                       lambda: renderpool.tile_spec(bars, lo, hi, charttiles.TILE_HEIGHT, charttiles.BAR_PX,
+                                                    charttiles.BODY_PX, charttiles.TILE_BARS),
+                       None, if_none_match)
+
+
+# Pre-rendering: after each gather the default images of holdings and interested stocks,
+# and after each autotr chart refresh those of holdings, are rendered into the image cache
+# ahead of the first view. A pass skips stocks it rendered less than about one pass
+# interval ago and fetches only candles older than CHART_CACHE_TTL, so each stock costs
+# at most one ka10081 + ka10080 per interval: those share the Kiwoom rate limit with
+# autotr's orders, hence the longer interval while the market (NXT included) is open.
+# Fetched candles stay in _candle_cache for CHART_CACHE_TTL like any others, so chart
+# views never get older prices because of the pass.
+PRERENDER_MIN_INTERVAL = 60  # seconds between passes; requests in between are merged into the next one
+PRERENDER_MIN_INTERVAL_MARKET = 900  # the same on weekdays between PRERENDER_MARKET_START and PRERENDER_MARKET_END
+PRERENDER_MARKET_START = dt_time(8, 0)
+PRERENDER_MARKET_END = dt_time(20, 0)
+PRERENDER_MA = '5,20,60,120'  # the chart-img endpoint defaults
+PRERENDER_VIS = '1,1,1,1'
+PRERENDER_TICS = ('15',)
+prerender_event = threading.Event()
+prerender_lock = threading.Lock()
+prerender_status = {
+    'state': 'idle',
+    'last_trigger': None,
+    'holdings_only': False,
+    'last_start': None,
+    'last_end': None,
+    'stocks': 0,
+    'holdings': 0,
+    'done': 0,
+    'skipped': 0,
+    'errors': 0,
+}
+prerender_full = False  # a pending request wants interested stocks too
+prerender_rendered = {}  # stock_code -> time.time() a pass last fetched and rendered it
+
+
+def prerender_interval(now=None):
+    """Minimum seconds between pre-render passes at now."""
+    now = now or datetime.now()
+    if now.weekday() < 5 and PRERENDER_MARKET_START <= now.time() < PRERENDER_MARKET_END:
+        return PRERENDER_MIN_INTERVAL_MARKET
+    return PRERENDER_MIN_INTERVAL
+
+
+def prerender_targets(holdings_only=False):
+    """([stock_code], holding count): holdings of every account first, then (unless
+    holdings_only) interested stocks."""
+    codes = {}
+    try:
+        jango = statedb.load_table('jango_data')
+    except Exception as e:
+        print(f"Error loading jango_data for pre-render: {e}")
+        jango = {}
+    for stocks in jango.values():
+        if isinstance(stocks, dict):
+            for stock_code, qty in stocks.items():
+                if int(qty or 0) > 0:
+                    codes.setdefault(stock_code, True)
+    holdings = len(codes)
+    if not holdings_only:
+        for stock_code in load_interested_stocks():
+            codes.setdefault(stock_code, True)
+    return list(codes), holdings
+
+
+def prerender_stock(stock_code, min_age):
+    """Fetch one stock's candles unless still cached and render its default daily, compare
+    and minute images into the cache; False (nothing done) when a pass did that less than
+    min_age seconds ago."""
+    last = prerender_rendered.get(stock_code)
+    if last is not None and time.time() - last < min_age:
+        return False
+    prerender_rendered[stock_code] = time.time()
+    if _cache_get('daily:' + stock_code) is None:
+        wait_tr_quota()
+    _fetch_daily_candles(stock_code)
+    for tic in PRERENDER_TICS:
+        if _cache_get('minute:' + stock_code + ':' + tic) is None:
+            wait_tr_quota()
+        _fetch_minute_candles(stock_code, tic)
+    _render_image_now(_plan_daily_img(stock_code, PRERENDER_MA, PRERENDER_VIS))
+    _render_image_now(_plan_compare_img(stock_code, PRERENDER_MA, PRERENDER_VIS))
+    for tic in PRERENDER_TICS:
+        _render_image_now(_plan_minute_img(stock_code, tic))
+    return True
+
+
+def run_prerender(holdings_only=False, min_age=0):
+    if not get_one_token():
+        print("Chart pre-render skipped: no token")
+        return
+    codes, holdings = prerender_targets(holdings_only)
+    with prerender_lock:
+        prerender_status.update({'state': 'running', 'last_start': datetime.now().isoformat(),
+                                 'holdings_only': holdings_only,
+                                 'stocks': len(codes), 'holdings': holdings, 'done': 0, 'skipped': 0, 'errors': 0})
+    for stock_code in codes:
+        if thread_stop_event.is_set():
+            break
+        try:
+            if not prerender_stock(stock_code, min_age):
+                with prerender_lock:
+                    prerender_status['skipped'] += 1
+        except Exception as e:
+            print(f"Error pre-rendering charts for {stock_code}: {e}")
+            with prerender_lock:
+                prerender_status['errors'] += 1
+        with prerender_lock:
+            prerender_status['done'] += 1
+    with prerender_lock:
+        prerender_status['state'] = 'idle'
+        prerender_status['last_end'] = datetime.now().isoformat()
+
+
+def request_prerender(trigger, holdings_only=False):
+    """Ask for a pre-render pass (non-blocking); the pre-render thread runs it. Requests
+    merged into one pass cover interested stocks if any of them does."""
+    global prerender_full
+    with prerender_lock:
+        prerender_status['last_trigger'] = trigger
+        if not holdings_only:
+            prerender_full = True
+    prerender_event.set()
+
+
+def prerender_loop():
+    """Run a pre-render pass whenever one was requested, at most once per prerender_interval()."""
+    global prerender_full
+    print("Chart pre-render thread started.")
+    last_start = 0.0
+    while not thread_stop_event.is_set():
+        if not prerender_event.wait(timeout=1.0):
+            continue
+        delay = last_start + prerender_interval() - time.time()
+        if delay > 0:
+            # waited in steps so a pass held back by the market-hours interval can start at the close
+            thread_stop_event.wait(min(delay, 60))
+            continue
+        with prerender_lock:
+            prerender_event.clear()
+            holdings_only = not prerender_full
+            prerender_full = False
+        last_start = time.time()
+        try:
+            # a stock rendered by the previous pass is due again by the time this one may start
+            run_prerender(holdings_only, min_age=prerender_interval() * 0.9)
+        except Exception as e:
+            print(f"Error in chart pre-render: {e}")
+            with prerender_lock:
+                prerender_status['state'] = 'idle'
+    print("Chart pre-render thread stopped.")
+
+
+@app.get("/api/chart-img/daily/{stock_code}")
+@app.get("/stock/data/api/chart-img/daily/{stock_code}")
+async def chart_img_daily(stock_code: str, request: Request, ma: str = Query('5,20,60,120'), vis: str = Query('1,1,1,1')):
+    try:
+        if_none_match = request.headers.get('if-none-match')
+        return await _render_image(await asyncio.to_thread(_plan_daily_img, stock_code, ma, vis, if_none_match))
+    except renderpool.RenderBusy as e:
+        return _render_busy_json(e)
+    except Exception as e:
         traceback.print_exc()
-        img = np.full((DAILY_CHART_H, 600, 3), 255, dtype=np.uint8)
-        _put_text_center(img, 'Error: ' + str(e), (40, 40, 220))
-        return _image_json(img, 'error_daily.png')
+        return await asyncio.to_thread(_error_image_json, str(e), DAILY_CHART_H, 'error_daily.png')
 
 
 @app.get("/api/chart-img/compare/{stock_code}")
 @app.get("/stock/data/api/chart-img/compare/{stock_code}")
-async def chart_img_compare(stock_code: str, ma: str = Query('5,20,60,120'), vis: str = Query('1,1,1,1')):
+async def chart_img_compare(stock_code: str, request: Request, ma: str = Query('5,20,60,120'), vis: str = Query('1,1,1,1')):
     try:
-        return await asyncio.to_thread(_build_compare_img, stock_code, ma, vis)
+        if_none_match = request.headers.get('if-none-match')
+        return await _render_image(await asyncio.to_thread(_plan_compare_img, stock_code, ma, vis, if_none_match))
+    except renderpool.RenderBusy as e:
+        return _render_busy_json(e)
     except Exception as e:
         traceback.print_exc()
-        img = np.full((COMPARE_CHART_H, 600, 3), 255, dtype=np.uint8)
-        _put_text_center(img, 'Error: ' + str(e), (40, 40, 220))
-        return _image_json(img, 'error_compare.png')
+        return await asyncio.to_thread(_error_image_json, str(e), COMPARE_CHART_H, 'error_compare.png')
 
 
 @app.get("/api/chart-img/minute/{stock_code}")
 @app.get("/stock/data/api/chart-img/minute/{stock_code}")
-async def chart_img_minute(stock_code: str, tic: str = Query('15')):
+async def chart_img_minute(stock_code: str, request: Request, tic: str = Query('15')):
+    try:
+        if_none_match = request.headers.get('if-none-match')
+        return await _render_image(await asyncio.to_thread(_plan_minute_img, stock_code, tic, if_none_match))
+    except renderpool.RenderBusy as e:
+        return _render_busy_json(e)
+    except Exception as e:
+        traceback.print_exc()
+        return await asyncio.to_thread(_error_image_json, str(e), MINUTE_CHART_H, 'error_minute.png')
+
+
+@app.get("/api/chart-tiles/{stock_code}")
+@app.get("/stock/data/api/chart-tiles/{stock_code}")
+async def chart_tiles_info(stock_code: str):
+    """Tile geometry, log price scale and per-level (daily/weekly/monthly) tile counts of a stock's stored history."""
     try:
-        return await asyncio.to_thread(_build_minute_img, stock_code, tic)
+        info = await asyncio.to_thread(charttiles.info, _clean_stock_code(stock_code))
+        return JSONResponse(content={"status": "success", "tiles": info})
     except Exception as e:
         traceback.print_exc()
-        img = np.full((MINUTE_CHART_H, 600, 3), 255, dtype=np.uint8)
-        _put_text_center(img, 'Error: ' + str(e), (40, 40, 220))
-        return _image_json(img, 'error_minute.png')
+        return JSONResponse(content={"status": "error", "message": str(e)})
+
+
+@app.get("/api/chart-tiles/{stock_code}/{level}/{x}")
+@app.get("/stock/data/api/chart-tiles/{stock_code}/{level}/{x}")
+async def chart_tile(stock_code: str, level: int, x: int, request: Request):
+    """One fixed-size tile (PNG data URI, with ETag) of a stock's chart at a zoom level."""
+    try:
+        if_none_match = request.headers.get('if-none-match')
+        return await _render_image(await asyncio.to_thread(_plan_tile_img, stock_code, level, x, if_none_match))
+    except renderpool.RenderBusy as e:
+        return _render_busy_json(e)
+    except ValueError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(content={"status": "error", "message": str(e)})
+
+
+@app.get("/api/chart-img/cache-stats")
+@app.get("/stock/data/api/chart-img/cache-stats")
+async def chart_img_cache_stats():
+    """Hit/miss/eviction counters and byte usage of the candle and image caches, and render pool counters."""
+    with _not_modified_lock:
+        not_modified = _not_modified['count']
+    return JSONResponse(content={
+        "status": "success",
+        "candles": _candle_cache.stats(),
+        "images": _image_cache.stats(),
+        "not_modified": not_modified,
+        "render_pool": renderpool.stats(),
+    })
+
+
+@app.get("/api/prerender")
+@app.get("/stock/data/api/prerender")
+async def get_prerender_status():
+    """State and progress of the chart pre-render stage."""
+    with prerender_lock:
+        status = dict(prerender_status)
+    return JSONResponse(content={"status": "success", "prerender": status})
+
+@app.post("/api/prerender")
+@app.post("/stock/data/api/prerender")
+async def trigger_prerender(source: str = Query('api'), scope: str = Query('all')):
+    """Request a pre-render pass of holdings and interested stocks, or with scope=holdings of
+    holdings only (autotr asks for that after each chart refresh)."""
+    request_prerender(source, holdings_only=scope == 'holdings')
+    return JSONResponse(content={"status": "success", "message": "Pre-render requested"})
 
 
 @app.get("/api/analysis-info/{stock_code}")
@@ -3795,7 +3959,10 @@ async def stock_analysis_page():
             <h1 id="title">종목 분석</h1>
             <div class="sub" id="subtitle">데이터를 불러오는 중...</div>
         </div>
-        <a href="javascript:location.reload()">새로고침</a>
+        <div>
+            <a id="tiles-link" href="#">장기 차트</a>
+            <a href="javascript:location.reload()">새로고침</a>
+        </div>
     </div>
 
     <div id="status" class="status-msg">차트 데이터를 불러오는 중입니다...</div>
@@ -4256,6 +4423,8 @@ async def stock_analysis_page():
             }
             document.getElementById('title').textContent =
                 (stockNameParam ? stockNameParam : '종목') + ' (' + stockCode + ') 분석';
+            document.getElementById('tiles-link').href = '/stock/data/chart-tiles?code=' +
+                encodeURIComponent(stockCode) + (stockNameParam ? '&name=' + encodeURIComponent(stockNameParam) : '');
             try {
                 const resp = await fetch(DATA_BASE + 'analysis-chart/' + encodeURIComponent(stockCode));
                 const result = await resp.json();
@@ -4295,6 +4464,252 @@ async def stock_analysis_page():
     return HTMLResponse(content=html_content)
 
 
+@app.get("/chart-tiles", response_class=HTMLResponse)
+@app.get("/stock/data/chart-tiles", response_class=HTMLResponse)
+@app.get("/stock/data/chart-tiles/", response_class=HTMLResponse)
+async def chart_tiles_page():
+    """Long-history chart viewer: pans over fixed-size daily/weekly/monthly tiles, loading only the visible ones."""
+    html_content = """
+<!DOCTYPE html>
+<html lang="ko">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>장기 차트</title>
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: #f0f2f5;
+            color: #222;
+            padding: 12px;
+        }
+        .header {
+            display: flex;
+            align-items: center;
+            justify-content: space-between;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: #fff;
+            padding: 14px 20px;
+            border-radius: 10px;
+            margin-bottom: 14px;
+        }
+        .header h1 { font-size: 20px; }
+        .header .sub { font-size: 13px; opacity: 0.9; margin-top: 4px; }
+        .levels button {
+            color: #fff; border: none; background: rgba(255,255,255,0.2); cursor: pointer;
+            padding: 8px 14px; border-radius: 6px; font-size: 13px; margin-left: 4px;
+        }
+        .levels button.active, .levels button:hover { background: rgba(255,255,255,0.45); }
+        .panel {
+            background: #fff; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.08);
+            display: flex; overflow: hidden;
+        }
+        .price-axis { position: relative; width: 70px; min-width: 70px; border-right: 1px solid #ddd; }
+        .price-axis span {
+            position: absolute; right: 6px; font-size: 11px; color: #777; transform: translateY(-50%);
+        }
+        .tile-wrap { flex: 1; min-width: 0; overflow-x: auto; overflow-y: hidden; cursor: grab; }
+        .tile-strip { position: relative; }
+        .tile-strip img { position: absolute; top: 0; image-rendering: pixelated; }
+        .tile-strip .grid { position: absolute; left: 0; right: 0; border-top: 1px solid #f0f0f0; }
+        .tile-strip .date {
+            position: absolute; font-size: 11px; color: #777; padding-left: 3px;
+            border-left: 1px solid #ddd; height: 22px; line-height: 22px;
+        }
+        .hint { font-size: 12px; color: #999; margin-top: 8px; }
+        .status-msg { padding: 30px; text-align: center; color: #888; font-size: 14px; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div>
+            <h1 id="title">장기 차트</h1>
+            <div class="sub" id="subtitle">데이터를 불러오는 중...</div>
+        </div>
+        <div class="levels" id="levels"></div>
+    </div>
+
+    <div id="status" class="status-msg">차트 정보를 불러오는 중입니다...</div>
+    <div class="panel" id="panel" style="display:none;">
+        <div class="price-axis" id="price-axis"></div>
+        <div class="tile-wrap" id="tile-wrap"><div class="tile-strip" id="tile-strip"></div></div>
+    </div>
+    <div class="hint">드래그하여 이동, 마우스 휠로 일봉/주봉/월봉 전환 (보이는 구간의 타일만 불러옵니다)</div>
+
+    <script>
+        const LEVEL_NAMES = ['일봉', '주봉', '월봉'];
+        const DATE_ROW = 22;
+        const params = new URLSearchParams(location.search);
+        const stockCode = (params.get('code') || '').trim();
+        const stockNameParam = (params.get('name') || '').trim();
+        const DATA_BASE = '/stock/data/api/';
+        const wrap = document.getElementById('tile-wrap');
+        const strip = document.getElementById('tile-strip');
+        let info = null;
+        let level = 0;
+        let requested = {};
+
+        function fmtDate(d) {
+            return d ? d.slice(0, 4) + '/' + d.slice(4, 6) + '/' + d.slice(6, 8) : '';
+        }
+
+        function dayNumber(d) {
+            return Date.UTC(+d.slice(0, 4), +d.slice(4, 6) - 1, +d.slice(6, 8)) / 86400000;
+        }
+
+        function priceToY(p) {
+            return (Math.log(info.hi) - Math.log(p)) / (Math.log(info.hi) - Math.log(info.lo)) * info.tile_height;
+        }
+
+        function drawPriceAxis() {
+            const axis = document.getElementById('price-axis');
+            axis.style.height = (info.tile_height + DATE_ROW) + 'px';
+            axis.innerHTML = '';
+            strip.querySelectorAll('.grid').forEach(el => el.remove());
+            const ticks = 8;
+            for (let i = 1; i < ticks; i++) {
+                const p = Math.exp(Math.log(info.lo) + (Math.log(info.hi) - Math.log(info.lo)) * i / ticks);
+                const y = priceToY(p);
+                const label = document.createElement('span');
+                label.style.top = y + 'px';
+                label.textContent = Math.round(p).toLocaleString();
+                axis.appendChild(label);
+                const grid = document.createElement('div');
+                grid.className = 'grid';
+                grid.style.top = y + 'px';
+                strip.appendChild(grid);
+            }
+        }
+
+        function centerDate() {
+            const lv = info.levels[level];
+            const bar = Math.min(lv.bars - 1, Math.max(0, Math.floor((wrap.scrollLeft + wrap.clientWidth / 2) / info.bar_px)));
+            const x = Math.floor(bar / info.tile_bars);
+            const start = dayNumber(lv.tile_starts[x]);
+            const end = x + 1 < lv.tiles ? dayNumber(lv.tile_starts[x + 1]) : dayNumber(lv.last);
+            return start + (end - start) * (bar - x * info.tile_bars) / info.tile_bars;
+        }
+
+        function scrollToDate(day) {
+            const lv = info.levels[level];
+            let x = 0;
+            while (x + 1 < lv.tiles && dayNumber(lv.tile_starts[x + 1]) <= day) x++;
+            const start = dayNumber(lv.tile_starts[x]);
+            const end = x + 1 < lv.tiles ? dayNumber(lv.tile_starts[x + 1]) : dayNumber(lv.last);
+            const frac = end > start ? Math.min(1, (day - start) / (end - start)) : 0;
+            wrap.scrollLeft = (x + frac) * info.tile_width - wrap.clientWidth / 2;
+        }
+
+        function setLevel(newLevel) {
+            if (newLevel < 0 || newLevel >= info.levels.length || info.levels[newLevel].tiles === 0) return;
+            const day = info.levels[level].tiles ? centerDate() : null;
+            level = newLevel;
+            requested = {};
+            strip.querySelectorAll('img, .date').forEach(el => el.remove());
+            const lv = info.levels[level];
+            strip.style.width = (lv.tiles * info.tile_width) + 'px';
+            strip.style.height = (info.tile_height + DATE_ROW) + 'px';
+            lv.tile_starts.forEach((d, x) => {
+                const label = document.createElement('div');
+                label.className = 'date';
+                label.style.left = (x * info.tile_width) + 'px';
+                label.style.top = info.tile_height + 'px';
+                label.textContent = fmtDate(d);
+                strip.appendChild(label);
+            });
+            document.querySelectorAll('#levels button').forEach((b, i) => b.classList.toggle('active', i === level));
+            document.getElementById('subtitle').textContent =
+                LEVEL_NAMES[level] + ' ' + lv.bars + '개 · ' + fmtDate(lv.first) + ' ~ ' + fmtDate(lv.last);
+            if (day === null) wrap.scrollLeft = strip.scrollWidth;
+            else scrollToDate(day);
+            loadVisibleTiles();
+        }
+
+        async function loadTile(lv, x) {
+            const key = lv + ':' + x;
+            if (requested[key]) return;
+            requested[key] = true;
+            try {
+                const resp = await fetch(DATA_BASE + 'chart-tiles/' + encodeURIComponent(stockCode) + '/' + lv + '/' + x);
+                if (resp.status === 503) {
+                    delete requested[key];
+                    setTimeout(loadVisibleTiles, 1000);
+                    return;
+                }
+                const result = await resp.json();
+                if (result.status !== 'success' || lv !== level) return;
+                const img = document.createElement('img');
+                img.src = result.image;
+                img.style.left = (x * info.tile_width) + 'px';
+                strip.appendChild(img);
+            } catch (e) {
+                delete requested[key];
+            }
+        }
+
+        function loadVisibleTiles() {
+            const lv = info.levels[level];
+            const first = Math.max(0, Math.floor(wrap.scrollLeft / info.tile_width) - 1);
+            const last = Math.min(lv.tiles - 1, Math.floor((wrap.scrollLeft + wrap.clientWidth) / info.tile_width) + 1);
+            for (let x = last; x >= first; x--) loadTile(level, x);
+        }
+
+        wrap.addEventListener('scroll', loadVisibleTiles);
+        window.addEventListener('resize', () => { if (info) loadVisibleTiles(); });
+        wrap.addEventListener('wheel', e => {
+            if (!info || Math.abs(e.deltaY) <= Math.abs(e.deltaX)) return;
+            e.preventDefault();
+            setLevel(level + (e.deltaY > 0 ? 1 : -1));
+        }, { passive: false });
+        let drag = null;
+        wrap.addEventListener('mousedown', e => { drag = { x: e.clientX, left: wrap.scrollLeft }; wrap.style.cursor = 'grabbing'; });
+        window.addEventListener('mouseup', () => { drag = null; wrap.style.cursor = ''; });
+        window.addEventListener('mousemove', e => { if (drag) wrap.scrollLeft = drag.left - (e.clientX - drag.x); });
+
+        async function loadInfo() {
+            if (!stockCode) {
+                document.getElementById('status').textContent = '종목 코드가 없습니다.';
+                return;
+            }
+            document.getElementById('title').textContent =
+                (stockNameParam ? stockNameParam : '종목') + ' (' + stockCode + ') 장기 차트';
+            try {
+                const resp = await fetch(DATA_BASE + 'chart-tiles/' + encodeURIComponent(stockCode));
+                const result = await resp.json();
+                if (result.status !== 'success') {
+                    document.getElementById('status').textContent = '오류: ' + (result.message || '데이터를 불러오지 못했습니다.');
+                    return;
+                }
+                info = result.tiles;
+                if (!info.levels[0].tiles || info.lo === null) {
+                    document.getElementById('status').textContent = '저장된 일봉 데이터가 없습니다.';
+                    return;
+                }
+                const levels = document.getElementById('levels');
+                info.levels.forEach((lv, i) => {
+                    const b = document.createElement('button');
+                    b.textContent = LEVEL_NAMES[i];
+                    b.onclick = () => setLevel(i);
+                    levels.appendChild(b);
+                });
+                document.getElementById('status').style.display = 'none';
+                document.getElementById('panel').style.display = 'flex';
+                drawPriceAxis();
+                setLevel(0);
+            } catch (e) {
+                document.getElementById('status').textContent = '오류: ' + e.message;
+            }
+        }
+
+        loadInfo();
+    </script>
+</body>
+</html>
+"""
+    return HTMLResponse(content=html_content)
+
+
 @app.get("/api/analysis-chart/{stock_code}")
 @app.get("/stock/data/api/analysis-chart/{stock_code}")
 async def get_analysis_chart_data(stock_code: str):
@@ -4483,6 +4898,19 @@ async def lookcsv_page():
             .stock-list.active {
                 display: block;
             }
+            .csv-filters {
+                display: flex;
+                flex-wrap: wrap;
+                gap: 5px;
+                align-items: center;
+                margin-bottom: 10px;
+            }
+            .stock-more {
+                display: none;
+                width: 100%;
+                padding: 8px;
+                cursor: pointer;
+            }
             .stock-item {
                 padding: 10px;
                 margin-bottom: 5px;
@@ -4564,7 +4992,19 @@ async def lookcsv_page():
                         <div id="csv-list-container"></div>
                     </div>
                     <div class="stock-list" id="stock-list-container">
+                        <div class="csv-filters">
+                            <select id="filter-result" onchange="reloadStockList()">
+                                <option value="">All</option>
+                                <option value="success">success</option>
+                                <option value="failure">failure</option>
+                            </select>
+                            <input id="filter-from" placeholder="From YYYYMMDD" size="10">
+                            <input id="filter-to" placeholder="To YYYYMMDD" size="10">
+                            <button onclick="reloadStockList()">Filter</button>
+                            <span id="stock-total"></span>
+                        </div>
                         <div id="stock-items-container"></div>
+                        <button id="stock-more" class="stock-more" onclick="loadStockPage(csvCursor)">More</button>
                     </div>
                 </div>
                 <div class="right-pane">
@@ -4606,7 +5046,9 @@ async def lookcsv_page():
                 }
             })();
 
-            let csvData = null;
+            const CSV_LIST_COLUMNS = ['Stock Code', 'Stock Name', 'Highest Date', 'Success/Failure', 'Daily Chart File', 'Minute Chart File'];
+            const CSV_PAGE_ROWS = 200;
+            let csvCursor = null;
             let selectedCsvFile = null;
             let dailyChartData = null;
             let minuteChartData = null;
@@ -4642,14 +5084,46 @@ async def lookcsv_page():
                     item.classList.remove('selected');
                 });
                 event.target.classList.add('selected');
-                
-                // Load CSV data
-                fetch(`./api/csv-data/${filename}`)
+                reloadStockList();
+            }
+            
+            function csvQueryUrl(cursor) {
+                // Filtering, sorting (highest date, newest first) and paging run on the server
+                const params = new URLSearchParams();
+                params.set('columns', CSV_LIST_COLUMNS.join(','));
+                params.set('sort', 'Highest Date');
+                params.set('order', 'desc');
+                params.set('limit', String(CSV_PAGE_ROWS));
+                const result = document.getElementById('filter-result').value;
+                const dateFrom = document.getElementById('filter-from').value.trim();
+                const dateTo = document.getElementById('filter-to').value.trim();
+                if (result) params.set('result', result);
+                if (dateFrom) params.set('date_from', dateFrom);
+                if (dateTo) params.set('date_to', dateTo);
+                if (cursor) params.set('cursor', cursor);
+                return `./api/csv-query/${encodeURIComponent(selectedCsvFile)}?${params.toString()}`;
+            }
+            
+            function reloadStockList() {
+                if (!selectedCsvFile) return;
+                document.getElementById('stock-items-container').innerHTML = '';
+                document.getElementById('stock-list-container').classList.add('active');
+                loadStockPage(null);
+            }
+            
+            function loadStockPage(cursor) {
+                const moreButton = document.getElementById('stock-more');
+                moreButton.style.display = 'none';
+                fetch(csvQueryUrl(cursor))
                     .then(response => response.json())
                     .then(data => {
                         if (data.status === 'success') {
-                            csvData = data.data;
-                            displayStockList();
+                            appendStockItems(data.rows);
+                            document.getElementById('stock-total').textContent = `${data.total} rows`;
+                            csvCursor = data.next_cursor;
+                            moreButton.style.display = csvCursor ? 'block' : 'none';
+                        } else {
+                            console.error('Error loading CSV data:', data.message);
                         }
                     })
                     .catch(error => {
@@ -4657,20 +5131,9 @@ async def lookcsv_page():
                     });
             }
             
-            function displayStockList() {
+            function appendStockItems(rows) {
                 const container = document.getElementById('stock-items-container');
-                container.innerHTML = '';
-                document.getElementById('stock-list-container').classList.add('active');
-                
-                // Sort entries by highest date (descending)
-                const sortedData = [...csvData].sort((a, b) => {
-                    const dateA = parseInt(a['Highest Date'] || '0') || 0;
-                    const dateB = parseInt(b['Highest Date'] || '0') || 0;
-                    return dateB - dateA;
-                });
-                
-                // Display all entries without numbered suffixes, ordered by highest date
-                sortedData.forEach((row, index) => {
+                rows.forEach(row => {
                     const code = row['Stock Code'];
                     const name = row['Stock Name'];
                     const highestDate = row['Highest Date'] || '';
@@ -5405,45 +5868,143 @@ async def get_csv_list():
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)})
 
+CSV_STREAM_CHUNK = 64 * 1024  # bytes per streamed file chunk
+CSV_JSON_BATCH = 500  # CSV rows per streamed JSON chunk
+
+def _csv_path(filename):
+    """Path of an analysis CSV in BASE_DIR, or None for names that would leave it."""
+    if os.path.basename(filename) != filename or not filename.endswith('.csv'):
+        return None
+    return os.path.join(BASE_DIR, filename)
+
+def _wants_gzip(request, gzip):
+    """gzip=true/false forces it; otherwise follow the client's Accept-Encoding."""
+    if gzip is not None:
+        return gzip
+    return 'gzip' in (request.headers.get('accept-encoding') or '').lower()
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _file_chunks(file_path):
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(CSV_STREAM_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+def _csv_json_chunks(file_path):
+    """The {"status": "success", "data": [rows]} body of /api/csv-data, CSV_JSON_BATCH rows at a time."""
+    yield '{"status": "success", "data": ['
+    sep = ''
+    with open(file_path, 'r', encoding='utf-8') as f:
+        batch = []
+        for row in csv.DictReader(f):
+            batch.append(json.dumps(row, ensure_ascii=False))
+            if len(batch) >= CSV_JSON_BATCH:
+                yield sep + ','.join(batch)
+                sep = ','
+                batch = []
+        if batch:
+            yield sep + ','.join(batch)
+    yield ']}'
+
+def _streaming_response(chunks, media_type, use_gzip, filename=None):
+    """Chunked response over a (sync) chunk generator; Starlette iterates it in a worker thread."""
+    headers = {'Vary': 'Accept-Encoding'}
+    if use_gzip:
+        chunks = _gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
 @app.get("/api/csv-data/{filename}")
 @app.get("/stock/data/api/csv-data/{filename}")
-async def get_csv_data(filename: str):
-    """Get CSV data as JSON."""
+async def get_csv_data(filename: str, request: Request, gzip: bool = Query(None)):
+    """Get CSV data as JSON, streamed in chunks (gzip-encoded when the client accepts it)."""
     try:
-        file_path = os.path.join(BASE_DIR, filename)
-        if not os.path.exists(file_path):
+        file_path = _csv_path(filename)
+        if not file_path or not os.path.exists(file_path):
             return JSONResponse(content={"status": "error", "message": "File not found"})
-        
-        csv_data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                csv_data.append(row)
-        
-        return JSONResponse(content={"status": "success", "data": csv_data})
+        return _streaming_response(_csv_json_chunks(file_path), 'application/json', _wants_gzip(request, gzip))
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "message": str(e)})
+
+@app.get("/api/csv-query/{filename}")
+@app.get("/stock/data/api/csv-query/{filename}")
+async def query_csv_data(filename: str,
+                         columns: str = Query(None),
+                         result: str = Query(None),
+                         stock_code: str = Query(None),
+                         date_from: str = Query(None),
+                         date_to: str = Query(None),
+                         date_column: str = Query('Highest Date'),
+                         ranges: list[str] = Query(None, alias='range'),
+                         sort: str = Query(None),
+                         order: str = Query('asc'),
+                         limit: int = Query(100),
+                         cursor: str = Query(None)):
+    """
+    One page of an analysis CSV, filtered and sorted on the server.
+    columns: comma-separated projection; result: success|failure; date_from/date_to: YYYYMMDD
+    bounds on date_column; range: column:min:max, repeatable, either bound may be empty
+    (e.g. range=MA5/MA10:0.95:1.05); sort/order: column and asc|desc; cursor: next_cursor
+    of the previous page.
+    """
+    try:
+        file_path = _csv_path(filename)
+        if not file_path or not os.path.exists(file_path):
+            if file_path:
+                csvquery.drop_index(file_path)  # CSV deleted outside the app; its index goes too
+            return JSONResponse(content={"status": "error", "message": "File not found"})
+
+        equals = {}
+        if result:
+            equals['Success/Failure'] = [r.strip() for r in result.split(',') if r.strip()]
+        if stock_code:
+            equals['Stock Code'] = [c.strip() for c in stock_code.split(',') if c.strip()]
+        range_filters = []
+        if date_from or date_to:
+            range_filters.append((date_column, date_from or None, date_to or None))
+        for spec in ranges or []:
+            parts = spec.rsplit(':', 2)
+            if len(parts) != 3:
+                return JSONResponse(content={"status": "error", "message": f"Invalid range: {spec}"})
+            range_filters.append((parts[0], parts[1] or None, parts[2] or None))
+
+        page = await asyncio.to_thread(
+            csvquery.query, file_path,
+            columns=[c.strip() for c in columns.split(',') if c.strip()] if columns else None,
+            equals=equals, ranges=range_filters, sort=sort or None,
+            descending=(order or '').lower() == 'desc', limit=limit, cursor=cursor or None)
+        page['status'] = 'success'
+        return JSONResponse(content=page)
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)})
     except Exception as e:
+        print(f"Error querying CSV {filename}: {e}")
         return JSONResponse(content={"status": "error", "message": str(e)})
 
 @app.get("/api/chart-data-from-files")
 @app.get("/stock/data/api/chart-data-from-files")
 async def get_chart_data_from_files(daily_file: str = Query(None), minute_file: str = Query(None)):
-    """Get chart data from file names."""
+    """Get chart data from file names (YYYYMMDD_code.json / YYYYMMDD_code_min.json name a chart store entry)."""
     try:
-        if daily_file:
-            file_path = os.path.join(CHART_DIR, daily_file)
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        return JSONResponse(content={"status": "success", "data": data})
-        
-        if minute_file:
-            file_path = os.path.join(CHART_DIR, minute_file)
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        return JSONResponse(content={"status": "success", "data": data})
+        for file_name in (daily_file, minute_file):
+            parsed = chartstore.parse_chart_filename(file_name)
+            if not parsed:
+                continue
+            stock_code, date_str, series = parsed
+            arr = chartstore.read_entry(stock_code, date_str, series)
+            if arr is not None:
+                return JSONResponse(content={"status": "success", "data": chartstore.to_records(arr)})
         
         return JSONResponse(content={"status": "error", "message": "File not found"})
     except Exception as e:
@@ -5452,482 +6013,250 @@ async def get_chart_data_from_files(daily_file: str = Query(None), minute_file:
 @app.get("/api/bounce-analysis/{stock_code}")
 @app.get("/stock/data/api/bounce-analysis/{stock_code}")
 async def bounce_analysis(stock_code: str, date: str = Query(None)):
-    """Analyze bounce after peak in 16 days daily chart using minute chart data."""
+    """Analyze bounce after peak in 16 days daily chart using minute chart data (runs as a background job)."""
     try:
-        # Get all daily chart files for this stock
-        all_daily_data = []
-        if not os.path.exists(CHART_DIR):
-            return JSONResponse(content={"status": "error", "message": "Chart directory not found"})
-        
-        for filename in os.listdir(CHART_DIR):
-            if filename.endswith('_min.json'):
-                continue
-            if filename.endswith('.json'):
-                parts = filename[:-5].split('_')
-                if len(parts) == 2:
-                    date_str, file_stock_code = parts
-                    if file_stock_code == stock_code and len(date_str) == 8 and date_str.isdigit():
-                        file_path = os.path.join(CHART_DIR, filename)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                daily_data = json.load(f)
-                                if isinstance(daily_data, list):
-                                    for item in daily_data:
-                                        item['_file_date'] = date_str
-                                    all_daily_data.extend(daily_data)
-                        except Exception as e:
-                            print(f"Error reading {filename}: {e}")
-                            continue
-        
-        if not all_daily_data:
-            return JSONResponse(content={"status": "error", "message": "No daily chart data found"})
-        
-        # Sort by date (oldest first)
-        all_daily_data.sort(key=lambda x: x.get('dt', x.get('_file_date', '')))
-        
-        # Get last 16 days
-        last_16_days = all_daily_data[-16:] if len(all_daily_data) >= 16 else all_daily_data
-        
-        if not last_16_days:
-            return JSONResponse(content={"status": "error", "message": "Insufficient data for 16-day analysis"})
-        
-        # Find date with highest high_pric
-        def parse_price(price_str):
-            if not price_str:
-                return 0
-            cleaned = str(price_str).replace('+', '').replace('-', '').replace(',', '')
-            return abs(float(cleaned)) if cleaned else 0
-        
-        highest_high = 0
-        peak_date = None
-        peak_high = 0
-        peak_low = 0
-        
-        for item in last_16_days:
-            high = parse_price(item.get('high_pric', 0))
-            low = parse_price(item.get('low_pric', 0))
-            if high > highest_high:
-                highest_high = high
-                peak_date = item.get('dt', item.get('_file_date', ''))
-                peak_high = high
-                peak_low = low
-        
-        if not peak_date:
-            return JSONResponse(content={"status": "error", "message": "Could not find peak date"})
-        
-        # Calculate 16-day range (highest - lowest)
-        all_highs = [parse_price(item.get('high_pric', 0)) for item in last_16_days]
-        all_lows = [parse_price(item.get('low_pric', 0)) for item in last_16_days]
-        range_16d = max(all_highs) - min(all_lows)
-        threshold = (1.0 / 5.0) * range_16d  # 2/5 of range
-        
-        # Get minute chart data for peak date and next 4 days
-        from datetime import datetime, timedelta
-        peak_datetime = datetime.strptime(peak_date, "%Y%m%d")
-        minute_data_all = []
-        
-        for day_offset in range(5):  # Peak day + next 4 days
-            check_date = peak_datetime + timedelta(days=day_offset)
-            check_date_str = check_date.strftime("%Y%m%d")
-            
-            minute_filename = f"{check_date_str}_{stock_code}_min.json"
-            minute_file_path = os.path.join(CHART_DIR, minute_filename)
-            
-            if os.path.exists(minute_file_path):
-                try:
-                    with open(minute_file_path, 'r', encoding='utf-8') as f:
-                        minute_data = json.load(f)
-                        if isinstance(minute_data, list):
-                            for item in minute_data:
-                                item['_analysis_date'] = check_date_str
-                            minute_data_all.extend(minute_data)
-                except Exception as e:
-                    print(f"Error reading minute chart {minute_filename}: {e}")
-        
-        # Sort minute data by timestamp
-        minute_data_all.sort(key=lambda x: x.get('cntr_tm', ''))
-        
-        # Calculate bounce from minute chart
-        # Bounce = maximum recovery from low after peak
-        # Find the lowest point after peak, then find highest recovery
-        peak_minute_high = 0
-        lowest_after_peak = float('inf')
-        highest_recovery = 0
-        
-        found_peak = False
-        for item in minute_data_all:
-            item_date = item.get('_analysis_date', '')
-            if item_date == peak_date:
-                high = parse_price(item.get('high_pric', 0))
-                if high > peak_minute_high:
-                    peak_minute_high = high
-                found_peak = True
-            elif found_peak:
-                low = parse_price(item.get('low_pric', 0))
-                high = parse_price(item.get('high_pric', 0))
-                if low < lowest_after_peak:
-                    lowest_after_peak = low
-                # Calculate recovery from lowest point
-                if lowest_after_peak != float('inf'):
-                    recovery = high - lowest_after_peak
-                    if recovery > highest_recovery:
-                        highest_recovery = recovery
-        
-        # Determine success/failure
-        # Success: bounce >= 2/5 of 16-day range
-        # Failure: bounce < 2/5 of 16-day range within 4 days
-        is_success = highest_recovery >= threshold
-        result_type = "success" if is_success else "failure"
-        
-        # Build decision tree structure
-        decision_tree = {
-            "nodes": [
-                {
-                    "id": "root",
-                    "level": 0,
-                    "type": "condition",
-                    "title": "Peak Analysis",
-                    "value": f"Peak Date: {peak_date}",
-                    "label": f"Highest High: {highest_high:.2f}"
-                },
-                {
-                    "id": "range",
-                    "level": 1,
-                    "type": "condition",
-                    "title": "16-Day Range",
-                    "value": f"{range_16d:.2f}",
-                    "label": f"Threshold: {threshold:.2f} (2/5 of range)"
-                },
-                {
-                    "id": "bounce",
-                    "level": 2,
-                    "type": "condition",
-                    "title": "Bounce Calculation",
-                    "value": f"{highest_recovery:.2f}",
-                    "label": f"From minute chart data"
-                },
-                {
-                    "id": "result",
-                    "level": 3,
-                    "type": result_type,
-                    "title": result_type.upper(),
-                    "value": "✓" if is_success else "✗",
-                    "label": f"Bounce {'≥' if is_success else '<'} {threshold:.2f}"
-                }
-            ],
-            "edges": [
-                {"from": "root", "to": "range", "label": "16-day analysis"},
-                {"from": "range", "to": "bounce", "label": "Calculate bounce"},
-                {"from": "bounce", "to": "result", "label": f"{'≥' if is_success else '<'} threshold"}
-            ],
-            "analysis": {
-                "peak_date": peak_date,
-                "peak_high": peak_high,
-                "range_16d": range_16d,
-                "threshold": threshold,
-                "bounce": highest_recovery,
-                "result": result_type,
-                "lowest_after_peak": lowest_after_peak if lowest_after_peak != float('inf') else 0
-            }
-        }
-        
-        return JSONResponse(content={"status": "success", "data": decision_tree})
-        
+        job_id = bgjobs.submit('bounce-analysis', bounce.bounce_decision_tree, [(stock_code,)],
+                               finish=lambda results: results[0], params={'stock_code': stock_code})
+        result = await asyncio.wrap_future(bgjobs.result_future(job_id))
+        return JSONResponse(content=result)
     except Exception as e:
         print(f"Error in bounce analysis: {e}")
         import traceback
         traceback.print_exc()
         return JSONResponse(content={"status": "error", "message": str(e)})
 
-@app.post("/api/make-bounce-csv")
-@app.post("/stock/data/api/make-bounce-csv")
-async def make_bounce_csv():
-    """Generate CSV file with bounce analysis dataset following the specified algorithm."""
-    try:
-        def parse_price(price_str):
-            if not price_str:
-                return 0
-            cleaned = str(price_str).replace('+', '').replace('-', '').replace(',', '')
-            return abs(float(cleaned)) if cleaned else 0
-        
-        def calculate_moving_average(data, index, period):
-            """Calculate moving average for a given index."""
-            start_idx = max(0, index - period + 1)
-            window = data[start_idx:index + 1]
-            if not window:
-                return 0
-            closes = [parse_price(item.get('cur_prc', 0)) for item in window]
-            return sum(closes) / len(closes) if closes else 0
-
-        # Collect daily chart files (each file separately, not merged)
-        daily_chart_files = []
-        
-        if not os.path.exists(CHART_DIR):
-            return JSONResponse(content={"status": "error", "message": "Chart directory not found"})
-        
-        for filename in os.listdir(CHART_DIR):
-            if filename.endswith('_min.json'):
-                continue
-            if filename.endswith('.json'):
-                parts = filename[:-5].split('_')
-                if len(parts) == 2:
-                    date_str, stock_code = parts
-                    if len(date_str) == 8 and date_str.isdigit():
-                        file_path = os.path.join(CHART_DIR, filename)
-                        daily_chart_files.append((stock_code, date_str, file_path))
-        
-        # Sort by stock code and date
-        daily_chart_files.sort(key=lambda x: (x[0], x[1]))
-        
-        # Load interested stocks to get stock names
-        interested_stocks = load_interested_stocks()
-        
-        # Prepare CSV data
-        csv_rows = []
-        csv_rows.append([
-            'Stock Code',
-            'Stock Name',
-            'Success/Failure',
-            'Highest Date',
-            'Enter Date',
-            'Enter Count',
-            'Daily Chart File',
-            'Minute Chart File',
-            'Trading Amount',
-            'Peak Rate',
-            'Gap/Dif16',
-            'MA5',
-            'MA10',
-            'MA20',
-            'MA60',
-            'MA120',
-            'MA5/MA10',
-            'MA10/MA20',
-            'MA20/MA60',
-            'MA60/MA120'
-        ])
-        
-        record_count = 0
-        seen_records = set()  # Track duplicate records by (stock_code, current_date)
-        
-        # Process each daily chart file separately
-        for stock_code, file_date_str, file_path in daily_chart_files:
-            # calling get_stockname is enough
-            stock_name = get_stockname(stock_code)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    daily_data = json.load(f)
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-                continue
-            
-            if not isinstance(daily_data, list) or len(daily_data) == 0:
-                continue
-            
-            # Sort by date (old to new) - use only this file's data
-            daily_data.sort(key=lambda x: x.get('dt', ''))
-
-            # Test 4 & 5: Load minute chart using the date from daily chart filename
-            # Use only one minute chart file that matches the date part of the daily chart filename
-            minute_filename = f"{file_date_str}_{stock_code}_min.json"
-            minute_file_path = os.path.join(CHART_DIR, minute_filename)
-
-            if not os.path.exists(minute_file_path):
-                continue  # Skip if minute chart file doesn't exist
-
-            try:
-                with open(minute_file_path, 'r', encoding='utf-8') as f:
-                    minute_data_all = json.load(f)
-            except Exception as e:
-                print(f"Error reading minute chart {minute_filename}: {e}")
+BOUNCE_CACHE_DB = os.path.join(BASE_DIR, 'bounce_cache.db')
+BOUNCE_CACHE_VERSION = 1  # bump when bounce.compute_bounce_rows changes so cached rows are rebuilt
+BOUNCE_CSV_HEADER = [
+    'Stock Code',
+    'Stock Name',
+    'Success/Failure',
+    'Highest Date',
+    'Enter Date',
+    'Enter Count',
+    'Daily Chart File',
+    'Minute Chart File',
+    'Trading Amount',
+    'Peak Rate',
+    'Gap/Dif16',
+    'MA5',
+    'MA10',
+    'MA20',
+    'MA60',
+    'MA120',
+    'MA5/MA10',
+    'MA10/MA20',
+    'MA20/MA60',
+    'MA60/MA120'
+]
+
+_bounce_cache_local = threading.local()
+
+def _bounce_cache_conn():
+    """Thread-local connection to the bounce row cache: one row per chart entry with the
+    entry fingerprint it was computed for and its CSV rows as JSON."""
+    conn = getattr(_bounce_cache_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(BOUNCE_CACHE_DB, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS bounce_rows ('
+                     'stock_code TEXT NOT NULL, date TEXT NOT NULL, fp TEXT NOT NULL, '
+                     'version INTEGER NOT NULL, rows TEXT NOT NULL, PRIMARY KEY (stock_code, date))')
+        conn.commit()
+        _bounce_cache_local.conn = conn
+    return conn
+
+def load_bounce_fingerprints():
+    """{(stock_code, date): fingerprint} of every cached entry; None for rows of another BOUNCE_CACHE_VERSION."""
+    rows = _bounce_cache_conn().execute('SELECT stock_code, date, fp, version FROM bounce_rows').fetchall()
+    return {(stock_code, date_str): (fp if version == BOUNCE_CACHE_VERSION else None)
+            for stock_code, date_str, fp, version in rows}
+
+def store_bounce_rows(shard_result, fingerprints):
+    """Cache the [[stock_code, date, rows]] one job shard computed. Unreadable entries
+    (rows None) are dropped from the cache so the next run retries them."""
+    conn = _bounce_cache_conn()
+    with conn:
+        for stock_code, file_date_str, rows in shard_result or []:
+            if rows is None:
+                conn.execute('DELETE FROM bounce_rows WHERE stock_code = ? AND date = ?', (stock_code, file_date_str))
                 continue
+            conn.execute('INSERT OR REPLACE INTO bounce_rows (stock_code, date, fp, version, rows) VALUES (?, ?, ?, ?, ?)',
+                         (stock_code, file_date_str, fingerprints.get((stock_code, file_date_str), ''),
+                          BOUNCE_CACHE_VERSION, json.dumps(rows, ensure_ascii=False)))
 
-            if not isinstance(minute_data_all, list) or len(minute_data_all) == 0:
-                continue
-
-            # Sort minute data by timestamp
-            minute_data_all.sort(key=lambda x: x.get('cntr_tm', ''))
-
-            min_date_in_minutes = minute_data_all[0].get('cntr_tm', '')[:8]
+def build_bounce_csv(daily_chart_files, removed_keys, recomputed):
+    """
+    Stream the bounce CSV from the row cache (which the job shards have just refreshed)
+    and return the make-bounce-csv response. Rows go from one ordered query straight to
+    the file, so memory does not grow with the number of entries or rows.
+    """
+    conn = _bounce_cache_conn()
+    if removed_keys:
+        with conn:
+            conn.executemany('DELETE FROM bounce_rows WHERE stock_code = ? AND date = ?', removed_keys)
+    entry_names = {}
+    for entry in daily_chart_files:
+        entry_names.setdefault(entry['stock_code'], entry['stock_name'])
+    interested_stocks = None
+    
+    record_count = 0
+    current_stock = None
+    stock_name = ''
+    seen_dates = set()  # Track duplicate records by (stock_code, current_date); rows come grouped by stock
+    
+    csv_filename = f"bounce_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    csv_filepath = os.path.join(BASE_DIR, csv_filename)
+    
+    with open(csv_filepath + '.tmp', 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(BOUNCE_CSV_HEADER)
+        cursor = conn.execute('SELECT stock_code, date, rows FROM bounce_rows WHERE version = ? '
+                              'ORDER BY stock_code, date', (BOUNCE_CACHE_VERSION,))
+        for stock_code, _file_date_str, rows_json in cursor:
+            if stock_code not in entry_names:
+                continue  # entry added or removed while the job ran
+            if stock_code != current_stock:
+                current_stock = stock_code
+                stock_name = None
+                seen_dates = set()
+            for row in json.loads(rows_json):
+                # Skip duplicate record (same stock_code and current_date)
+                if row[2] in seen_dates:
+                    continue
+                seen_dates.add(row[2])
+                if stock_name is None:
+                    if interested_stocks is None:
+                        interested_stocks = load_interested_stocks()
+                    stock_name = get_chart_stock_name(stock_code, entry_names[stock_code], interested_stocks)
+                writer.writerow([row[0], stock_name] + row[1:])
+                record_count += 1
+    os.replace(csv_filepath + '.tmp', csv_filepath)
+    csvquery.drop_index(csv_filepath)  # a rerun within the same second replaces the CSV
+    
+    return {
+        "status": "success",
+        "message": "CSV file created successfully",
+        "filename": csv_filename,
+        "record_count": record_count,
+        "entries": len(daily_chart_files),
+        "recomputed_entries": recomputed,
+        "download_url": f"./api/download-csv/{csv_filename}"
+    }
 
-            # Trace daily chart from old to new within this file
-            prev_cur_prc = parse_price(daily_data[15].get('cur_prc', 0))
-            for current_idx in range(16, len(daily_data)-1):
-                current_item = daily_data[current_idx]
-                current_date = current_item.get('dt', '')
+def submit_bounce_csv_job():
+    """
+    Start a make-bounce-csv job. Entries whose cached rows match the current fingerprint
+    are reused; the others are sharded by stock code over the job process pool, and each
+    shard's rows go into the cache as soon as the shard finishes.
+    """
+    # Daily chart entries (each entry separately, not merged), sorted by stock code and date
+    daily_chart_files = chartstore.manifest_entries('daily')
+    fingerprints = chartstore.entry_fingerprints()
+    cached = load_bounce_fingerprints()
+    
+    by_stock = {}
+    for entry in daily_chart_files:
+        key = (entry['stock_code'], entry['date'])
+        if cached.get(key) is None or cached[key] != fingerprints.get(key, ''):
+            by_stock.setdefault(entry['stock_code'], []).append(list(key))
+    current = {(entry['stock_code'], entry['date']) for entry in daily_chart_files}
+    removed_keys = [key for key in cached if key not in current]
+    recomputed = sum(len(entries) for entries in by_stock.values())
+    shard_count = min(len(by_stock), bgjobs.JOB_WORKERS * 4)
+    shards = [[] for _ in range(shard_count)]
+    for i, stock_code in enumerate(sorted(by_stock)):
+        shards[i % shard_count].extend(by_stock[stock_code])
+    
+    return bgjobs.submit(
+        'make-bounce-csv', bounce.compute_entries, [(shard,) for shard in shards],
+        finish=lambda _results: build_bounce_csv(daily_chart_files, removed_keys, recomputed),
+        on_result=lambda _i, shard_result: store_bounce_rows(shard_result, fingerprints),
+        params={'entries': len(daily_chart_files), 'stale_stocks': len(by_stock)})
 
-                if stock_code == '060370' and current_date=='20251212':
-                    pass
-                if not current_date or current_date < min_date_in_minutes :
-                    continue
-                    
-                current_high = parse_price(current_item.get('high_pric', 0))
-                current_trde_prica = parse_price(current_item.get('trde_prica', 0))
-                peak_rate = current_high / prev_cur_prc
-                prev_cur_prc = parse_price(current_item.get('cur_prc', 0))
-                if peak_rate < 0.12:
-                    continue
-                # Get 16 days window ending at current day (inclusive)
-                window_data = daily_data[current_idx - 15:current_idx + 1]
-                
-                # Test 1: Check if current day's high price is 16-day highest
-                window_highs = [parse_price(item.get('high_pric', 0)) for item in window_data]
-                max_high_in_window = max(window_highs) if window_highs else 0
-                
-                if current_high != max_high_in_window:
-                    continue  # Not highest, continue to next day
-                
-                # Test 2: Check if trading amount > 150000
-                if current_trde_prica <= 150000:
-                    continue  # Not large enough, continue to next day
-                
-                # Calculate dif16, h16, l16, touch_price, gap
-                window_lows = [parse_price(item.get('low_pric', 0)) for item in window_data]
-                h16 = max_high_in_window
-                l16 = min(window_lows) if window_lows else 0
-                dif16 = h16 - l16
-                touch_price = h16 - (dif16 / 10) * 4
-                gap = (h16 - l16) / 5
-                
-                # Test 4: During 2 data items after current day, find low price go under touch_price
-                # Get the dates from data items (current_idx + 1 and current_idx + 2)
-                if current_idx + 2 >= len(daily_data):
-                    continue
-                
-                # Filter minute data for the 2 data items after (using their date values)
-                day_count = 0
-                enter_count = 0 # day_count when low price cross touch_price
-                enter_date = ''  # date when price crosses below touch_price
-                prev_dt_minute = ''
-                touched = False
-                reached = False
-                low_bounce = None
-                # Check if high price goes over (low_bounce + gap) AND over touch_price
-                condition1_met = False  # high > (low_bounce + gap)
-                condition2_met = False  # high > touch_price
-                success_time = ''
-                for item in minute_data_all:
-                    # Extract date from cntr_tm (YYYYMMDDHHMMSS format)
-                    cntr_tm = str(item.get('cntr_tm', ''))
-                    if len(cntr_tm) >= 8:
-                        item_date_str = cntr_tm[:8]
-                    if item_date_str <= current_date:
-                        continue
-
-                    if item_date_str != prev_dt_minute:
-                        prev_dt_minute = item_date_str
-                        day_count += 1
-                    if day_count >= 5:
-                        break
-                    low = parse_price(item.get('low_pric', 0))
-                    if low_bounce is None or low < low_bounce:
-                        low_bounce = low
-                    if not touched : # test go below
-                        if low < touch_price:
-                            enter_count = day_count
-                            enter_date = item_date_str  # Store the date when price crosses below touch_price
-                            touched = True
-                    else: # touched
-                        high = parse_price(item.get('high_pric', 0))
-                        if high > (low_bounce + gap):
-                            condition1_met = True
-                        if high > touch_price:
-                            condition2_met = True
-                        if condition1_met and condition2_met:
-                            success_time = cntr_tm
-                            break
-                if not touched: # price never crossed down, or no minutes data for current_date
-                    continue
+@app.post("/api/make-bounce-csv")
+@app.post("/stock/data/api/make-bounce-csv")
+async def make_bounce_csv(wait: bool = Query(True)):
+    """
+    Generate CSV file with bounce analysis dataset following the specified algorithm.
+    Runs as a background job; wait=false returns the job id at once for /api/jobs polling.
+    """
+    try:
+        job_id = submit_bounce_csv_job()
+        if not wait:
+            return JSONResponse(content={"status": "success", "job_id": job_id})
+        result = await asyncio.wrap_future(bgjobs.result_future(job_id))
+        result['job_id'] = job_id
+        return JSONResponse(content=result)
+    except Exception as e:
+        print(f"Error making bounce CSV: {e}")
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(content={"status": "error", "message": str(e)})
 
-                # Tag as success if both conditions met, otherwise failure
-                is_success = condition1_met and condition2_met
-                success_failure = "success" if is_success else "failure"
-                
-                # Check for duplicate record (same stock_code and current_date)
-                record_key = (stock_code, current_date)
-                if record_key in seen_records:
-                    continue  # Skip duplicate record
-                seen_records.add(record_key)
-                
-                # Calculate moving averages at current day (using only this file's data)
-                ma5 = calculate_moving_average(daily_data, current_idx, 5)
-                ma10 = calculate_moving_average(daily_data, current_idx, 10)
-                ma20 = calculate_moving_average(daily_data, current_idx, 20)
-                ma60 = calculate_moving_average(daily_data, current_idx, 60)
-                ma120 = calculate_moving_average(daily_data, current_idx, 120)
-                
-                # Calculate ratios
-                ma5_10 = ma5 / ma10 if ma10 > 0 else 0
-                ma10_20 = ma10 / ma20 if ma20 > 0 else 0
-                ma20_60 = ma20 / ma60 if ma60 > 0 else 0
-                ma60_120 = ma60 / ma120 if ma120 > 0 else 0
-                
-                # Calculate gap/dif16
-                gap_dif16 = h16 / l16
-                
-                # Get file names
-                daily_chart_filename = f"{file_date_str}_{stock_code}.json"
-                minute_chart_filename = f"{file_date_str}_{stock_code}_min.json"
-                
-                # Add row to CSV
-                csv_rows.append([
-                    stock_code,
-                    stock_name,
-                    success_failure,
-                    current_date,
-                    enter_date,
-                    enter_count,
-                    daily_chart_filename,
-                    minute_chart_filename,
-                    f"{current_trde_prica:.2f}",
-                    f"{peak_rate:.6f}",
-                    f"{gap_dif16:.6f}",
-                    f"{ma5:.2f}",
-                    f"{ma10:.2f}",
-                    f"{ma20:.2f}",
-                    f"{ma60:.2f}",
-                    f"{ma120:.2f}",
-                    f"{ma5_10:.6f}",
-                    f"{ma10_20:.6f}",
-                    f"{ma20_60:.6f}",
-                    f"{ma60_120:.6f}"
-                ])
-                record_count += 1
-        
-        # Write CSV file
-        csv_filename = f"bounce_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        csv_filepath = os.path.join(BASE_DIR, csv_filename)
-        
-        with open(csv_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerows(csv_rows)
-        
+@app.get("/api/jobs")
+@app.get("/stock/data/api/jobs")
+async def list_jobs_api():
+    """Background analytics jobs, newest first."""
+    return JSONResponse(content={"status": "success", "jobs": bgjobs.list_jobs()})
+
+@app.get("/api/jobs/{job_id}")
+@app.get("/stock/data/api/jobs/{job_id}")
+async def get_job_api(job_id: str):
+    """State, progress and (when done) result of one background job."""
+    job = bgjobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"status": "error", "message": "Job not found"})
+    return JSONResponse(content={"status": "success", "job": job})
+
+@app.post("/api/jobs/{job_id}/cancel")
+@app.post("/stock/data/api/jobs/{job_id}/cancel")
+async def cancel_job_api(job_id: str):
+    """Cancel a queued or running background job."""
+    if not bgjobs.cancel(job_id):
+        return JSONResponse(content={"status": "error", "message": "Job not found or already finished"})
+    return JSONResponse(content={"status": "success", "message": f"Job {job_id} cancelled"})
+
+@app.get("/api/features/{stock_code}")
+@app.get("/stock/data/api/features/{stock_code}")
+async def get_features(stock_code: str, start: str = Query(None), end: str = Query(None), limit: int = Query(0)):
+    """
+    Materialized daily indicators of a stock (MA5-MA120, MA ratios, 16-day high/low), oldest first.
+    start/end are YYYYMMDD bounds; limit > 0 keeps only the last limit rows.
+    """
+    try:
+        stock_code = stock_code.strip()
+        if not stock_code:
+            return JSONResponse(content={"status": "error", "message": "stock_code is required"})
+        arr = await asyncio.to_thread(features.get, stock_code, start or None, end or None)
+        if limit > 0:
+            arr = arr[-limit:]
         return JSONResponse(content={
             "status": "success",
-            "message": "CSV file created successfully",
-            "filename": csv_filename,
-            "record_count": record_count,
-            "download_url": f"./api/download-csv/{csv_filename}"
+            "stock_code": stock_code,
+            "fields": ['dt'] + features.FEATURE_FIELDS,
+            "count": len(arr),
+            "rows": features.to_records(arr),
         })
-        
     except Exception as e:
-        print(f"Error making bounce CSV: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Error reading features for {stock_code}: {e}")
         return JSONResponse(content={"status": "error", "message": str(e)})
 
 @app.get("/api/download-csv/{filename}")
 @app.get("/stock/data/api/download-csv/{filename}")
-async def download_csv(filename: str):
-    """Download generated CSV file."""
+async def download_csv(filename: str, request: Request, gzip: bool = Query(None)):
+    """Download generated CSV file, streamed in chunks (gzip-encoded when the client accepts it)."""
     try:
-        file_path = os.path.join(BASE_DIR, filename)
-        if os.path.exists(file_path):
-            return FileResponse(
-                path=file_path,
-                filename=filename,
-                media_type='text/csv'
-            )
+        file_path = _csv_path(filename)
+        if file_path and os.path.exists(file_path):
+            if not _wants_gzip(request, gzip):
+                return FileResponse(
+                    path=file_path,
+                    filename=filename,
+                    media_type='text/csv'
+                )
+            return _streaming_response(_file_chunks(file_path), 'text/csv', True, filename)
         else:
             return JSONResponse(content={"status": "error", "message": "File not found"})
     except Exception as e:
@@ -5938,33 +6267,13 @@ async def download_csv(filename: str):
 async def delete_chart_data(stock_code: str, date_str: str):
     """Delete chart data files (daily and minute) for a specific stock and date."""
     try:
-        if not os.path.exists(CHART_DIR):
-            return JSONResponse(content={"status": "error", "message": "Chart directory not found"})
-        
-        deleted_files = []
-        deleted_count = 0
-        
-        # Delete daily chart file: YYYYMMDD_stockcode.json
-        daily_filename = f"{date_str}_{stock_code}.json"
-        daily_file_path = os.path.join(CHART_DIR, daily_filename)
-        if os.path.exists(daily_file_path):
-            try:
-                os.remove(daily_file_path)
-                deleted_files.append(daily_filename)
-                deleted_count += 1
-            except Exception as e:
-                print(f"Error deleting {daily_filename}: {e}")
-        
-        # Delete minute chart file: YYYYMMDD_stockcode_min.json
-        minute_filename = f"{date_str}_{stock_code}_min.json"
-        minute_file_path = os.path.join(CHART_DIR, minute_filename)
-        if os.path.exists(minute_file_path):
-            try:
-                os.remove(minute_file_path)
-                deleted_files.append(minute_filename)
-                deleted_count += 1
-            except Exception as e:
-                print(f"Error deleting {minute_filename}: {e}")
+        # Drop the entry (the former YYYYMMDD_stockcode.json / _min.json pair) from the chart store
+        deleted_series = chartstore.delete_entry(stock_code, date_str)
+        deleted_files = [
+            f"{date_str}_{stock_code}.json" if series == 'daily' else f"{date_str}_{stock_code}_min.json"
+            for series in deleted_series
+        ]
+        deleted_count = len(deleted_files)
         
         if deleted_count > 0:
             return JSONResponse(content={
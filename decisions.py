@@ -0,0 +1,159 @@
+"""Append-only journal of autotr trading decisions.
+
+Records are JSON lines in journal/yyyymmdd/seg_NNNN.jsonl; a segment is closed and a
+new one started when it passes SEGMENT_MAX_BYTES. Next to each segment an .idx file
+gets one "HHMMSS stk_cd offset" line per record, so query() only reads the index
+lines and seeks straight to the matching records.
+
+record:
+{
+    "ts": "2026-10-19 09:01:02", "acct": "...", "stk_cd": "005930",
+    "kind": "BUY" | "SELL" | "SPLIT_SELL" | "CANCEL" | "QUEUED_BUY",
+    "action": "order" | "skip_gap" | ...,
+    "inputs": {gap_price, bsum, order_count, color, ...},
+    "request": {market, qty, price, trde_tp, ...},
+    "result": broker ret_status
+}
+"""
+import os
+import json
+import threading
+from datetime import datetime
+
+
+JOURNAL_DIR = 'journal'
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+
+_lock = threading.Lock()
+_day = None
+_seq = 0
+_seg_file = None
+_idx_file = None
+
+
+def _segment_paths(yyyymmdd, seq):
+    day_dir = os.path.join(JOURNAL_DIR, yyyymmdd)
+    return os.path.join(day_dir, f'seg_{seq:04d}.jsonl'), os.path.join(day_dir, f'seg_{seq:04d}.idx')
+
+
+def _close_segment():
+    global _seg_file, _idx_file
+    for f in (_seg_file, _idx_file):
+        if f is not None:
+            try:
+                f.close()
+            except Exception as e:
+                print(f"Error closing decision journal: {e}")
+    _seg_file = None
+    _idx_file = None
+
+
+def _open_segment(yyyymmdd):
+    """Open the last segment of the day for append (or a new one when it is full)."""
+    global _day, _seq, _seg_file, _idx_file
+    _close_segment()
+    os.makedirs(os.path.join(JOURNAL_DIR, yyyymmdd), exist_ok=True)
+    segs = list_segments(yyyymmdd)
+    _seq = segs[-1] if segs else 1
+    seg_path, idx_path = _segment_paths(yyyymmdd, _seq)
+    if os.path.exists(seg_path) and os.path.getsize(seg_path) >= SEGMENT_MAX_BYTES:
+        _seq += 1
+        seg_path, idx_path = _segment_paths(yyyymmdd, _seq)
+    _seg_file = open(seg_path, 'ab')
+    _idx_file = open(idx_path, 'a', encoding='utf-8')
+    _day = yyyymmdd
+
+
+def record(acct, stk_cd, kind, action, inputs=None, request=None, result=None, ts=None):
+    """Append one decision (ts defaults to the wall clock); never raises into the trading path."""
+    global _seq, _seg_file, _idx_file
+    try:
+        if ts is None:
+            ts = datetime.now()
+        rec = {
+            'ts': ts.strftime('%Y-%m-%d %H:%M:%S'),
+            'acct': acct,
+            'stk_cd': stk_cd,
+            'kind': kind,
+            'action': action,
+            'inputs': inputs or {},
+            'request': request or {},
+            'result': result,
+        }
+        line = (json.dumps(rec, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        yyyymmdd = ts.strftime('%Y%m%d')
+        with _lock:
+            if _day != yyyymmdd or _seg_file is None:
+                _open_segment(yyyymmdd)
+            elif _seg_file.tell() >= SEGMENT_MAX_BYTES:
+                _close_segment()
+                _seq += 1
+                seg_path, idx_path = _segment_paths(yyyymmdd, _seq)
+                _seg_file = open(seg_path, 'ab')
+                _idx_file = open(idx_path, 'a', encoding='utf-8')
+            offset = _seg_file.tell()
+            _seg_file.write(line)
+            _seg_file.flush()
+            _idx_file.write(f"{ts.strftime('%H%M%S')} {stk_cd or '-'} {offset}\n")
+            _idx_file.flush()
+        return True
+    except Exception as e:
+        print(f"Error writing decision journal for {stk_cd}: {e}")
+        return False
+
+
+def list_segments(yyyymmdd):
+    day_dir = os.path.join(JOURNAL_DIR, yyyymmdd)
+    if not os.path.isdir(day_dir):
+        return []
+    segs = []
+    for name in os.listdir(day_dir):
+        if name.startswith('seg_') and name.endswith('.jsonl'):
+            try:
+                segs.append(int(name[4:-6]))
+            except ValueError:
+                continue
+    return sorted(segs)
+
+
+def query(yyyymmdd, stk_cd=None, start=None, end=None, kind=None, limit=1000):
+    """Return records of one day filtered by stock code, HHMMSS range [start, end] and kind."""
+    results = []
+    for seq in list_segments(yyyymmdd):
+        seg_path, idx_path = _segment_paths(yyyymmdd, seq)
+        if not os.path.exists(idx_path):
+            continue
+        offsets = []
+        with open(idx_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 3:
+                    continue  # torn last line after a crash
+                hms, code, offset = parts
+                if stk_cd and code != stk_cd:
+                    continue
+                if start and hms < start:
+                    continue
+                if end and hms > end:
+                    continue
+                offsets.append(int(offset))
+        if not offsets:
+            continue
+        with open(seg_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                try:
+                    rec = json.loads(f.readline().decode('utf-8'))
+                except ValueError:
+                    continue
+                if kind and rec.get('kind') != kind:
+                    continue
+                results.append(rec)
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+def close():
+    with _lock:
+        _close_segment()
@@ -0,0 +1,218 @@
+"""Daily technical indicators materialized next to the chart store.
+
+chart_data/store/<code>/features.npy
+    one row per daily bar, keyed by dt like daily.npy: the close/high/low the row was
+    computed from, MA5/10/20/60/120, the ratios of neighbouring MAs and the 16-day
+    high/low (float64, NaN until the window is full)
+
+update() compares the stored close/high/low columns with the daily series and only
+recomputes rows from the first bar that differs (a new day, or the day's bar revised
+by the next gather), reading the MAX_WINDOW-1 bars before it for the windows. get()
+refreshes a stock first when its daily series changed since the last update, so
+readers never see indicators of older bars.
+
+The same moving_average/rolling_max/rolling_min/gap_range functions are what the
+chart renderer, the bounce analysis and autotr's gap price use on their own bars.
+"""
+import os
+import threading
+
+import numpy as np
+
+import chartstore
+
+
+FEATURE_FILE = 'features.npy'
+MA_PERIODS = (5, 10, 20, 60, 120)
+RANGE_DAYS = 16
+MAX_WINDOW = max(MA_PERIODS + (RANGE_DAYS,))
+
+INPUT_FIELDS = ['close', 'high', 'low']
+MA_FIELDS = [f'ma{p}' for p in MA_PERIODS]
+RATIO_FIELDS = [f'ma{a}_{b}' for a, b in zip(MA_PERIODS, MA_PERIODS[1:])]
+RANGE_FIELDS = [f'h{RANGE_DAYS}', f'l{RANGE_DAYS}']
+FEATURE_FIELDS = INPUT_FIELDS + MA_FIELDS + RATIO_FIELDS + RANGE_FIELDS
+FEATURE_DTYPE = np.dtype([('dt', '<i8')] + [(f, '<f8') for f in FEATURE_FIELDS])
+
+_locks = {}
+_locks_lock = threading.Lock()
+_signatures = {}  # stock_code -> chartstore.series_signature of the daily series last materialized
+_signatures_lock = threading.Lock()
+
+
+def moving_average(values, period, partial=False):
+    """Average of the period values ending at each index. Before the window is full the
+    value is NaN, or with partial=True the average of the values so far."""
+    values = np.asarray(values)
+    sums = np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - period, 0)
+    out = (sums[end] - sums[start]) / (end - start)
+    if not partial:
+        out[:period - 1] = np.nan
+    return out
+
+
+def _rolling(values, days, func):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= days:
+        out[days - 1:] = func(np.lib.stride_tricks.sliding_window_view(values, days), axis=1)
+    return out
+
+
+def rolling_max(values, days=RANGE_DAYS):
+    return _rolling(values, days, np.max)
+
+
+def rolling_min(values, days=RANGE_DAYS):
+    return _rolling(values, days, np.min)
+
+
+def gap_range(high, low, days=RANGE_DAYS):
+    """(high index, low index) over oldest-first bars: the highest high of the last days
+    bars, and the lowest low of the days bars ending at that high (the latest bar wins
+    ties in both). None when there are fewer than days bars."""
+    n = len(high)
+    if n < days:
+        return None
+    window = np.asarray(high[n - days:])
+    hi = n - 1 - int(np.argmax(window[::-1]))
+    first = max(0, hi - days + 1)
+    lows = np.asarray(low[first:hi + 1])
+    lo = hi - int(np.argmin(lows[::-1]))
+    return hi, lo
+
+
+def compute(daily, start=0):
+    """Feature rows for daily[start:] (a daily chart store array); the bars before start
+    are only read for the windows."""
+    first = max(0, start - MAX_WINDOW + 1)
+    bars = daily[first:]
+    close = np.abs(bars['cur_prc'])
+    high = np.abs(bars['high_pric'])
+    low = np.abs(bars['low_pric'])
+    out = np.zeros(len(bars), dtype=FEATURE_DTYPE)
+    out['dt'] = bars['dt']
+    out['close'] = close
+    out['high'] = high
+    out['low'] = low
+    for p, f in zip(MA_PERIODS, MA_FIELDS):
+        out[f] = moving_average(close, p)
+    for f, (a, b) in zip(RATIO_FIELDS, zip(MA_FIELDS, MA_FIELDS[1:])):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[f] = np.where(out[b] > 0, out[a] / out[b], np.nan)
+    out[RANGE_FIELDS[0]] = rolling_max(high)
+    out[RANGE_FIELDS[1]] = rolling_min(low)
+    return out[start - first:]
+
+
+def _lock(stock_code):
+    with _locks_lock:
+        lock = _locks.get(stock_code)
+        if lock is None:
+            lock = _locks[stock_code] = threading.Lock()
+        return lock
+
+
+def _path(stock_code):
+    return os.path.join(chartstore.STORE_DIR, stock_code, FEATURE_FILE)
+
+
+def _load(stock_code):
+    try:
+        arr = np.load(_path(stock_code))
+    except (OSError, ValueError):
+        return np.empty(0, dtype=FEATURE_DTYPE)
+    if arr.dtype != FEATURE_DTYPE:
+        return np.empty(0, dtype=FEATURE_DTYPE)  # written with other fields: rebuild
+    return arr
+
+
+def _first_changed(stored, daily):
+    """Index of the first daily bar whose dt/close/high/low differ from the stored row."""
+    n = min(len(stored), len(daily))
+    same = ((stored['dt'][:n] == daily['dt'][:n])
+            & (stored['close'][:n] == np.abs(daily['cur_prc'][:n]))
+            & (stored['high'][:n] == np.abs(daily['high_pric'][:n]))
+            & (stored['low'][:n] == np.abs(daily['low_pric'][:n])))
+    return n if same.all() else int(np.argmin(same))
+
+
+def update(stock_code):
+    """Bring the stock's features up to its daily series. Returns the number of rows recomputed."""
+    with _lock(stock_code):
+        sig = chartstore.series_signature(stock_code, 'daily')
+        daily = chartstore.read_daily(stock_code)
+        stored = _load(stock_code)
+        start = _first_changed(stored, daily)
+        if start == len(daily) == len(stored):
+            with _signatures_lock:
+                _signatures[stock_code] = sig
+            return 0
+        merged = np.concatenate([stored[:start], compute(daily, start)])
+        path = _path(stock_code)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, merged)
+        os.replace(tmp, path)
+        with _signatures_lock:
+            _signatures[stock_code] = sig
+        return len(merged) - start
+
+
+def _refresh(stock_code):
+    with _signatures_lock:
+        known = _signatures.get(stock_code)
+    if known is None or known != chartstore.series_signature(stock_code, 'daily'):
+        update(stock_code)
+
+
+def get(stock_code, start=None, end=None):
+    """Feature rows with start <= dt <= end, refreshed first if the daily series changed."""
+    _refresh(stock_code)
+    arr = _load(stock_code)
+    lo = 0 if start is None else int(np.searchsorted(arr['dt'], int(start), side='left'))
+    hi = len(arr) if end is None else int(np.searchsorted(arr['dt'], int(end), side='right'))
+    return arr[lo:hi]
+
+
+def to_records(arr):
+    """[{'dt': 'YYYYMMDD', 'close': ..., 'ma5': ... }] with None for NaN, ready for JSON."""
+    rows = []
+    cols = [arr['dt'].tolist()] + [arr[f].tolist() for f in FEATURE_FIELDS]
+    for vals in zip(*cols):
+        row = {'dt': str(vals[0])}
+        for f, v in zip(FEATURE_FIELDS, vals[1:]):
+            row[f] = None if v != v else v
+        rows.append(row)
+    return rows
+
+
+def latest(stock_code):
+    """Feature record of the stock's last daily bar, or None when it has no daily bars."""
+    arr = get(stock_code)
+    return to_records(arr[-1:])[0] if len(arr) else None
+
+
+def stored_ma(stock_code, dts, closes, period):
+    """MA values for caller bars (dts oldest first, as ints or YYYYMMDD strings) taken from
+    the store when period is materialized and every stored close matches the caller's
+    close for the same dt; None otherwise, so the caller computes them itself."""
+    if period not in MA_PERIODS or not len(dts):
+        return None
+    arr = get(stock_code)
+    if len(arr) == 0:
+        return None
+    keys = np.asarray([int(d) for d in dts], dtype=np.int64)
+    idx = np.searchsorted(arr['dt'], keys)
+    found = idx < len(arr)
+    found[found] = arr['dt'][idx[found]] == keys[found]
+    matched = int(found.sum())
+    if not matched or not found[:matched].all() or np.any(np.diff(idx[:matched]) != 1):
+        return None  # the bars must be a run of stored bars followed by newer ones only
+    if not np.array_equal(arr['close'][idx[found]], np.asarray(closes, dtype=np.float64)[found]):
+        return None
+    out = moving_average(np.asarray(closes, dtype=np.float64), period)
+    out[found] = arr[f'ma{period}'][idx[found]]
+    return out
@@ -1,25 +1,8 @@
 import json
-import time
 import os
-import base64
-import asyncio
-import traceback
-import threading
 import requests
-from datetime import datetime, timedelta, time as dt_time
-from contextlib import asynccontextmanager
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
-import uvicorn
-import csv
-import numpy as np
-import cv2
 
-from ka10081 import get_day_chart
-from ka10080 import get_bun_chart, fn_ka10080
-from au1001 import get_one_token, get_key_list, get_token
-from ka10100 import get_stockinfo
-from ka_condition import search_condition_by_name
+from au1001 import get_one_token, get_key_list, get_token, get_api_host
 
 # Configuration
 # Determine the directory where this script is located
@@ -47,7 +30,7 @@ def get_yesu_detail(MY_ACCESS_TOKEN):
 def fn_kt00001(token, data, cont_yn='N', next_key=''):
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
@@ -1,14 +1,14 @@
 import requests
 import json
 
-from au1001 import get_key_list, get_token
+from au1001 import get_key_list, get_token, get_api_host
 
 
 # 주식 매수주문
 def fn_kt10000(token, stk_nm, data, cont_yn='N', next_key=''):
 	# 1. 요청할 API URL
 	#host = 'https://mockapi.kiwoom.com' # 모의투자
-	host = 'https://api.kiwoom.com' # 실전투자
+	host = get_api_host() # 실전투자 (env.json API_HOST)
 	endpoint = '/api/dostk/ordr'
 	url =  host + endpoint
 
@@ -40,7 +40,7 @@ import json
 def fn_kt10001(token, data, cont_yn='N', next_key=''):
 	# 1. 요청할 API URL
 	#host = 'https://mockapi.kiwoom.com' # 모의투자
-	host = 'https://api.kiwoom.com' # 실전투자
+	host = get_api_host() # 실전투자 (env.json API_HOST)
 	endpoint = '/api/dostk/ordr'
 	url =  host + endpoint
 
@@ -1,11 +1,13 @@
 import requests
 import json
 
+from au1001 import get_api_host
+
 # 시세표성정보요청
 def fn_ka10007(token, data, cont_yn='N', next_key=''):
 	# 1. 요청할 API URL
 	#host = 'https://mockapi.kiwoom.com' # 모의투자
-	host = 'https://api.kiwoom.com' # 실전투자
+	host = get_api_host() # 실전투자 (env.json API_HOST)
 	endpoint = '/api/dostk/mrkcond'
 	url =  host + endpoint
 
@@ -2,9 +2,8 @@ from urllib import response
 
 import requests
 import json
-import pandas as pd
 
-from au1001 import get_one_token
+from au1001 import get_one_token, get_api_host
 
 def get_price_index(color):
 	if color == 'R': # 빨 Red
@@ -102,7 +101,7 @@ def fn_ka10080(token, data, cont_yn='N', next_key=''):
 
 	# 1. 요청할 API URL
 	#host = 'https://mockapi.kiwoom.com' # 모의투자
-	host = 'https://api.kiwoom.com' # 실전투자
+	host = get_api_host() # 실전투자 (env.json API_HOST)
 	endpoint = '/api/dostk/chart'
 	url =  host + endpoint
 
@@ -1,7 +1,7 @@
 import requests
 import json
 
-from au1001 import get_one_token
+from au1001 import get_one_token, get_api_host
 
 log_day_chart = False
 
@@ -10,7 +10,7 @@ def fn_ka10081(token, data, cont_yn='N', next_key=''):
     global log_day_chart
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/chart'
     url =  host + endpoint
 
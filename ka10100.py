@@ -2,13 +2,13 @@ import requests
 import json
 import os
 
-from au1001 import get_one_token, get_key_list, get_token
+from au1001 import get_one_token, get_key_list, get_token, get_api_host
 
 # 종목정보 조회
 def fn_ka10100(token, data, cont_yn='N', next_key=''):
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/stkinfo'
     url =  host + endpoint
 
@@ -98,7 +98,7 @@ def next_getname(stk_cd, MY_ACCESS_TOKEN):
     result = fn_ka10001(token=MY_ACCESS_TOKEN, data=params)
 
 def fn_ka10001(token, data, cont_yn='N', next_key=''):
-    host = 'https://api.kiwoom.com'
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/stkinfo'
     url = host + endpoint
 
@@ -123,7 +123,7 @@ def fn_ka10001(token, data, cont_yn='N', next_key=''):
 def fn_ka10170(token, data, cont_yn='N', next_key=''):
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
@@ -166,7 +166,7 @@ def call_ka10170(MY_ACCESS_TOKEN, base_dt, ottks_dt='2', ch_crd_tp = '0'):
 def fn_ka10072(token, data, cont_yn='N', next_key=''):
     # 1. 요청할 API URL
     #host = 'https://mockapi.kiwoom.com' # 모의투자
-    host = 'https://api.kiwoom.com' # 실전투자
+    host = get_api_host() # 실전투자 (env.json API_HOST)
     endpoint = '/api/dostk/acnt'
     url =  host + endpoint
 
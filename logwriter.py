@@ -0,0 +1,172 @@
+"""Background writer for autotr's per-stock log files (logs/yyyymmdd/<code>_<name>.txt).
+
+log_print() only enqueues (yyyymmdd, stk_cd, line); the writer thread resolves the
+stock name, keeps one open handle per file for the current day, writes in batches,
+flushes every LOG_FLUSH_INTERVAL seconds and closes the previous day's handles when
+the date changes. When the queue is full new records are dropped and counted, and so
+are records logged after stop() (the atexit hook included) rather than starting a new
+writer; only an explicit start() runs it again.
+"""
+import os
+import queue
+import atexit
+import threading
+import time as time_module
+
+
+LOG_DIR = 'logs'
+LOG_QUEUE_MAX = 20000
+LOG_BATCH_MAX = 500
+LOG_FLUSH_INTERVAL = 1.0  # seconds
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_stop_event = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+_name_func = None  # stk_cd -> stock name, called on the writer thread
+
+stats = {
+    'enqueued': 0,
+    'written': 0,
+    'dropped': 0,
+    'dropped_stopped': 0,
+    'errors': 0,
+    'batches': 0,
+    'open_files': 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        stats[key] += n
+
+
+def start(name_func=None):
+    """Start the writer thread if it is not running. name_func(stk_cd) returns the file name part."""
+    global _thread, _name_func
+    if name_func is not None:
+        _name_func = name_func
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _stop_event.clear()
+        _thread = threading.Thread(target=_writer_loop, daemon=True, name='LogWriterThread')
+        _thread.start()
+
+
+def enqueue(yyyymmdd, stk_cd, line):
+    """Queue one log line without blocking; returns False when it was dropped."""
+    if _stop_event.is_set():
+        _count('dropped_stopped')
+        return False
+    if _thread is None or not _thread.is_alive():
+        start()
+    try:
+        _queue.put_nowait((yyyymmdd, stk_cd, line))
+        _count('enqueued')
+        return True
+    except queue.Full:
+        _count('dropped')
+        return False
+
+
+def get_stats():
+    with _stats_lock:
+        result = dict(stats)
+    result['queue_depth'] = _queue.qsize()
+    result['queue_max'] = LOG_QUEUE_MAX
+    result['running'] = _thread is not None and _thread.is_alive()
+    return result
+
+
+def stop(timeout=5.0):
+    """Drain the queue, flush and close every file."""
+    global _thread
+    _stop_event.set()
+    t = _thread
+    if t is not None and t.is_alive() and t is not threading.current_thread():
+        t.join(timeout=timeout)
+    _thread = None
+
+
+def _stock_name(stk_cd, names):
+    nm = names.get(stk_cd)
+    if nm is None:
+        nm = ''
+        if _name_func is not None:
+            try:
+                nm = _name_func(stk_cd) or ''
+            except Exception as e:
+                print(f"logwriter: name lookup failed for {stk_cd}: {e}")
+        if nm == '':
+            nm = stk_cd  # Fallback to stock code if the lookup fails
+        names[stk_cd] = nm
+    return nm
+
+
+def _writer_loop():
+    handles = {}  # (yyyymmdd, stk_cd) -> file
+    names = {}
+    current_day = None
+    last_flush = time_module.monotonic()
+    while True:
+        batch = []
+        try:
+            batch.append(_queue.get(timeout=LOG_FLUSH_INTERVAL))
+            while len(batch) < LOG_BATCH_MAX:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        for yyyymmdd, stk_cd, line in batch:
+            if yyyymmdd != current_day:
+                # day changed: close yesterday's files and re-resolve names
+                for key in [k for k in handles if k[0] != yyyymmdd]:
+                    _close(handles.pop(key))
+                names.clear()
+                current_day = yyyymmdd
+            try:
+                f = handles.get((yyyymmdd, stk_cd))
+                if f is None:
+                    log_dir = os.path.join(LOG_DIR, yyyymmdd)
+                    os.makedirs(log_dir, exist_ok=True)
+                    log_filepath = os.path.join(log_dir, f"{stk_cd}_{_stock_name(stk_cd, names)}.txt")
+                    f = open(log_filepath, 'a', encoding='utf-8')
+                    handles[(yyyymmdd, stk_cd)] = f
+                f.write(line)
+                _count('written')
+            except Exception as e:
+                _count('errors')
+                print(f"Error in log writer for {stk_cd}: {e}")
+        with _stats_lock:
+            if batch:
+                stats['batches'] += 1
+            stats['open_files'] = len(handles)
+
+        stopping = _stop_event.is_set()
+        if stopping or time_module.monotonic() - last_flush >= LOG_FLUSH_INTERVAL:
+            for f in handles.values():
+                try:
+                    f.flush()
+                except Exception as e:
+                    _count('errors')
+                    print(f"Error flushing log file: {e}")
+            last_flush = time_module.monotonic()
+        if stopping and _queue.empty():
+            break
+
+    for f in handles.values():
+        _close(f)
+    with _stats_lock:
+        stats['open_files'] = 0
+
+
+def _close(f):
+    try:
+        f.close()
+    except Exception as e:
+        print(f"Error closing log file: {e}")
+
+
+atexit.register(stop)
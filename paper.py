@@ -0,0 +1,496 @@
+"""Local paper-trading server for the Kiwoom REST TRs used by autotr.py / datagather.py.
+
+Set "API_HOST": "http://127.0.0.1:8009" in env.json and run `python paper.py`.
+Orders (kt10000/kt10001/kt10003) are kept in memory and filled against minute bars:
+a buy fills when a bar low reaches the limit price, a sell when a bar high reaches it.
+Bars come from the latest entry of datagather's chart store (chartstore.py), the legacy
+chart_data/day/YYYYMMDD_<code>_min.json (latest file) or, when there is neither, from a
+synthetic random walk seeded by the stock code.
+Sessions: NXT 08:00-08:50 and 15:30-20:00, KRX 09:00-15:30, KRX after-hours (trde_tp 62) 16:00-18:00.
+The clock is the wall clock unless fixed with POST /paper/clock {"tm": "HHMMSS"}.
+"""
+import os
+import json
+import random
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Request
+import uvicorn
+
+from au1001 import get_key_list
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHART_DIR = os.path.join(BASE_DIR, 'chart_data', 'day')
+PAPER_PORT = 8009
+PAPER_CASH = 100000000
+TOKEN_PREFIX = 'PAPER_'
+
+NXT_SESSIONS = [('0800', '0850'), ('1530', '2000')]
+KRX_SESSIONS = [('0900', '1530')]
+AFT_SESSIONS = [('1600', '1800')]
+
+paper_lock = threading.RLock()
+paper_time = None   # fixed 'HHMMSS' or None for wall clock
+accounts = {}       # acct -> {'cash': int, 'positions': {stk_cd: {...}}, 'realized': {stk_cd: int}}
+orders = {}         # ord_no -> order dict
+open_orders = {}    # ord_no -> order dict, status OPEN only
+order_seq = 0
+bars = {}           # stk_cd -> {'tms': ['HHMM', ...], 'bars': [{tm, open, high, low, close, vol}]}
+day_bars = {}       # stk_cd -> ka10081 rows, newest first
+
+
+def paper_now():
+    if paper_time:
+        return paper_time
+    return datetime.now().strftime('%H%M%S')
+
+
+def _abs_int(v):
+    try:
+        return abs(int(float(str(v).replace('+', ''))))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _clean_code(stk_cd):
+    stk_cd = (stk_cd or '').strip()
+    if stk_cd.startswith('A'):
+        stk_cd = stk_cd[1:]
+    return stk_cd.split('_')[0]
+
+
+def _latest_chart_file(stk_cd, suffix):
+    if not os.path.isdir(CHART_DIR):
+        return None
+    names = [n for n in os.listdir(CHART_DIR) if n.endswith(f'_{stk_cd}{suffix}.json') and n[:8].isdigit()]
+    if not names:
+        return None
+    return os.path.join(CHART_DIR, max(names))
+
+
+def _latest_chart_rows(stk_cd, series):
+    """Rows of the newest chart entry for stk_cd ('daily' / 'minute'), or None when there is none."""
+    try:
+        import chartstore
+        dates = [d for d, e in chartstore.load_entries(stk_cd).items() if series in e]
+        if dates:
+            if series == 'daily':
+                return chartstore.daily_records(stk_cd, max(dates))
+            return chartstore.minute_records(stk_cd, max(dates))
+    except ImportError:
+        pass  # numpy not installed: only the legacy files are readable
+    path = _latest_chart_file(stk_cd, '_min' if series == 'minute' else '')
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _synthetic_bars(stk_cd):
+    rnd = random.Random(stk_cd)
+    price = rnd.randint(20, 400) * 100
+    result = []
+    t = datetime(2000, 1, 1, 8, 0)
+    while t.hour < 20:
+        open_p = price
+        close_p = max(100, int(open_p * (1 + rnd.uniform(-0.004, 0.004))))
+        high_p = max(open_p, close_p) + rnd.randint(0, max(1, open_p // 500))
+        low_p = max(1, min(open_p, close_p) - rnd.randint(0, max(1, open_p // 500)))
+        result.append({'tm': t.strftime('%H%M'), 'open': open_p, 'high': high_p, 'low': low_p,
+                       'close': close_p, 'vol': rnd.randint(100, 5000)})
+        price = close_p
+        t += timedelta(minutes=1)
+    return result
+
+
+def get_bars(stk_cd):
+    """Minute bars for stk_cd, ascending by HHMM."""
+    with paper_lock:
+        if stk_cd in bars:
+            return bars[stk_cd]
+    result = []
+    try:
+        rows = _latest_chart_rows(stk_cd, 'minute')
+        if rows:
+            last_day = max(r.get('cntr_tm', '')[:8] for r in rows)
+            for r in rows:
+                cntr_tm = r.get('cntr_tm', '')
+                if cntr_tm[:8] != last_day:
+                    continue
+                result.append({'tm': cntr_tm[8:12], 'open': _abs_int(r.get('open_pric')),
+                               'high': _abs_int(r.get('high_pric')), 'low': _abs_int(r.get('low_pric')),
+                               'close': _abs_int(r.get('cur_prc')), 'vol': _abs_int(r.get('trde_qty'))})
+            result.sort(key=lambda b: b['tm'])
+    except Exception as e:
+        print(f"Error loading paper bars for {stk_cd}: {e}")
+        result = []
+    if not result:
+        result = _synthetic_bars(stk_cd)
+    entry = {'tms': [b['tm'] for b in result], 'bars': result}
+    with paper_lock:
+        bars[stk_cd] = entry
+    return entry
+
+
+def get_day_bars(stk_cd):
+    """ka10081 rows for stk_cd, newest first."""
+    with paper_lock:
+        if stk_cd in day_bars:
+            return day_bars[stk_cd]
+    rows = []
+    try:
+        rows = sorted(_latest_chart_rows(stk_cd, 'daily') or [], key=lambda r: r.get('dt', ''), reverse=True)
+    except Exception as e:
+        print(f"Error loading paper daily bars for {stk_cd}: {e}")
+        rows = []
+    if not rows:
+        rnd = random.Random(stk_cd + 'D')
+        price = get_bars(stk_cd)['bars'][0]['open']
+        day = datetime.now()
+        for _ in range(120):
+            day -= timedelta(days=1)
+            while day.weekday() >= 5:
+                day -= timedelta(days=1)
+            open_p = max(100, int(price * (1 + rnd.uniform(-0.03, 0.03))))
+            high_p = max(open_p, price) + rnd.randint(0, max(1, price // 50))
+            low_p = max(1, min(open_p, price) - rnd.randint(0, max(1, price // 50)))
+            rows.append({'dt': day.strftime('%Y%m%d'), 'cur_prc': str(price), 'open_pric': str(open_p),
+                         'high_pric': str(high_p), 'low_pric': str(low_p), 'trde_qty': str(rnd.randint(10000, 900000))})
+            price = open_p
+    with paper_lock:
+        day_bars[stk_cd] = rows
+    return rows
+
+
+def current_price(stk_cd, tm=None):
+    entry = get_bars(stk_cd)
+    idx = bisect.bisect_right(entry['tms'], (tm or paper_now())[:4]) - 1
+    if idx < 0:
+        return entry['bars'][0]['open']
+    return entry['bars'][idx]['close']
+
+
+def _in_sessions(hhmm, sessions):
+    return any(start <= hhmm < end for start, end in sessions)
+
+
+def order_sessions(stex, trde_tp):
+    if trde_tp == '62':
+        return AFT_SESSIONS
+    if stex == 'KRX':
+        return KRX_SESSIONS
+    if stex == 'NXT':
+        return NXT_SESSIONS
+    return KRX_SESSIONS + NXT_SESSIONS  # SOR
+
+
+def get_account(acct):
+    if acct not in accounts:
+        accounts[acct] = {'cash': PAPER_CASH, 'positions': {}, 'realized': {}}
+    return accounts[acct]
+
+
+def open_sell_qty(acct_no, stk_cd):
+    return sum(o['oso_qty'] for o in open_orders.values()
+               if o['acct'] == acct_no and o['stk_cd'] == stk_cd and o['side'] == 'SELL')
+
+
+def fill_order(order, price):
+    acct = get_account(order['acct'])
+    qty = order['oso_qty']
+    stk_cd = order['stk_cd']
+    if order['side'] == 'BUY':
+        acct['cash'] += (order['price'] - price) * qty  # release the unused reservation
+        pos = acct['positions'].setdefault(stk_cd, {'qty': 0, 'pur_amt': 0, 'stk_nm': order['stk_nm']})
+        pos['qty'] += qty
+        pos['pur_amt'] += price * qty
+    else:
+        pos = acct['positions'][stk_cd]
+        cost = pos['pur_amt'] * qty // pos['qty']
+        pos['qty'] -= qty
+        pos['pur_amt'] -= cost
+        acct['cash'] += price * qty
+        acct['realized'][stk_cd] = acct['realized'].get(stk_cd, 0) + price * qty - cost
+        if pos['qty'] == 0:
+            del acct['positions'][stk_cd]
+    order['cntr_qty'] = qty
+    order['cntr_pric'] = price
+    order['oso_qty'] = 0
+    order['status'] = 'FILLED'
+    open_orders.pop(order['ord_no'], None)
+
+
+def match_orders():
+    """Fill open orders against bars between their last check and now."""
+    now_hhmm = paper_now()[:4]
+    with paper_lock:
+        for order in list(open_orders.values()):
+            if order['checked'] >= now_hhmm:
+                continue
+            entry = get_bars(order['stk_cd'])
+            lo = bisect.bisect_right(entry['tms'], order['checked'])
+            hi = bisect.bisect_right(entry['tms'], now_hhmm)
+            for bar in entry['bars'][lo:hi]:
+                if not _in_sessions(bar['tm'], order['sessions']):
+                    continue
+                if order['side'] == 'BUY' and bar['low'] <= order['price']:
+                    fill_order(order, min(order['price'], bar['open']))
+                    break
+                if order['side'] == 'SELL' and bar['high'] >= order['price']:
+                    fill_order(order, max(order['price'], bar['open']))
+                    break
+            order['checked'] = max(order['checked'], now_hhmm)
+
+
+def _reject(msg):
+    return {'return_code': 20, 'return_msg': msg}
+
+
+def place_order(acct_no, side, data):
+    global order_seq
+    stk_cd = _clean_code(data.get('stk_cd'))
+    stex = (data.get('dmst_stex_tp') or 'KRX').upper()
+    trde_tp = str(data.get('trde_tp') or '0')
+    qty = _abs_int(data.get('ord_qty'))
+    price = _abs_int(data.get('ord_uv'))
+    now = paper_now()
+    sessions = order_sessions(stex, trde_tp)
+    if not _in_sessions(now[:4], sessions):
+        if now[:4] < sessions[0][0]:
+            return _reject('[2000](505182:장개시전입니다.)')
+        return _reject('[2000](505217:장 종료되었습니다.)')
+    if qty <= 0:
+        return _reject('[2000](paper:주문수량을 확인하세요)')
+    market_order = trde_tp == '3'
+    if market_order or price <= 0:
+        price = current_price(stk_cd)
+
+    with paper_lock:
+        acct = get_account(acct_no)
+        if side == 'BUY':
+            if acct['cash'] < price * qty:
+                return _reject('[2000](paper:주문가능금액을 초과합니다)')
+            acct['cash'] -= price * qty
+        else:
+            pos = acct['positions'].get(stk_cd)
+            selling = open_sell_qty(acct_no, stk_cd)
+            if not pos or pos['qty'] - selling < qty:
+                return _reject('[2000](paper:매도가능수량을 초과합니다)')
+        order_seq += 1
+        ord_no = f'{order_seq:07d}'
+        stk_nm = acct['positions'].get(stk_cd, {}).get('stk_nm') or data.get('stk_nm') or stk_cd
+        order = {
+            'ord_no': ord_no, 'acct': acct_no, 'side': side, 'stk_cd': stk_cd, 'stk_nm': stk_nm,
+            'stex': stex, 'trde_tp': trde_tp, 'ord_qty': qty, 'oso_qty': qty, 'price': price,
+            'tm': now, 'checked': now[:4], 'sessions': sessions, 'status': 'OPEN',
+            'cntr_qty': 0, 'cntr_pric': 0,
+        }
+        orders[ord_no] = order
+        open_orders[ord_no] = order
+        # marketable orders fill at once at the current price
+        cur = current_price(stk_cd)
+        if market_order or (side == 'BUY' and price >= cur) or (side == 'SELL' and price <= cur):
+            fill_order(order, cur)
+    kind = '매수' if side == 'BUY' else '매도'
+    return {'return_code': 0, 'return_msg': f'{kind}주문이 완료되었습니다.', 'ord_no': ord_no, 'dmst_stex_tp': stex}
+
+
+def cancel_order(acct_no, data):
+    global order_seq
+    orig_ord_no = str(data.get('orig_ord_no') or '').strip()
+    with paper_lock:
+        order = orders.get(orig_ord_no)
+        if not order or order['acct'] != acct_no:
+            return _reject('[2000](paper:원주문번호가 존재하지 않습니다)')
+        if order['status'] != 'OPEN':
+            return _reject('[2000](paper:취소가능수량이 없습니다)')
+        if order['side'] == 'BUY':
+            get_account(acct_no)['cash'] += order['price'] * order['oso_qty']
+        cncl_qty = order['oso_qty']
+        order['oso_qty'] = 0
+        order['status'] = 'CANCELLED'
+        open_orders.pop(orig_ord_no, None)
+        order_seq += 1
+        ord_no = f'{order_seq:07d}'
+    return {'return_code': 0, 'return_msg': '취소주문이 완료되었습니다.', 'ord_no': ord_no,
+            'base_orig_ord_no': orig_ord_no, 'cncl_qty': str(cncl_qty)}
+
+
+def jango_view(acct_no):
+    """kt00018 response."""
+    with paper_lock:
+        acct = get_account(acct_no)
+        rows = []
+        tot_pur = tot_evlt = 0
+        for stk_cd, pos in acct['positions'].items():
+            cur = current_price(stk_cd)
+            selling = open_sell_qty(acct_no, stk_cd)
+            evlt = cur * pos['qty']
+            prft = evlt - pos['pur_amt']
+            tot_pur += pos['pur_amt']
+            tot_evlt += evlt
+            rows.append({
+                'stk_cd': 'A' + stk_cd, 'stk_nm': pos['stk_nm'],
+                'evltv_prft': str(prft),
+                'prft_rt': f"{prft * 100 / pos['pur_amt']:.2f}" if pos['pur_amt'] else '0.00',
+                'pur_pric': str(pos['pur_amt'] // pos['qty']),
+                'rmnd_qty': str(pos['qty']), 'trde_able_qty': str(pos['qty'] - selling),
+                'cur_prc': str(cur), 'pur_amt': str(pos['pur_amt']), 'evlt_amt': str(evlt),
+            })
+        return {
+            'return_code': 0, 'return_msg': '조회가 완료되었습니다.',
+            'tot_pur_amt': str(tot_pur), 'tot_evlt_amt': str(tot_evlt), 'tot_evlt_pl': str(tot_evlt - tot_pur),
+            'tot_prft_rt': f'{(tot_evlt - tot_pur) * 100 / tot_pur:.2f}' if tot_pur else '0.00',
+            'prsm_dpst_aset_amt': str(acct['cash'] + tot_evlt),
+            'acnt_evlt_remn_indv_tot': rows,
+        }
+
+
+def miche_view(acct_no, data):
+    """ka10075 response."""
+    stex_code = {'KRX': '1', 'NXT': '2', 'SOR': '0'}
+    want_cd = _clean_code(data.get('stk_cd')) if data.get('all_stk_tp') == '1' else ''
+    want_side = {'1': 'SELL', '2': 'BUY'}.get(str(data.get('trde_tp', '0')))
+    with paper_lock:
+        oso = []
+        for o in open_orders.values():
+            if o['acct'] != acct_no:
+                continue
+            if want_cd and o['stk_cd'] != want_cd:
+                continue
+            if want_side and o['side'] != want_side:
+                continue
+            oso.append({
+                'acnt_no': acct_no, 'ord_no': o['ord_no'], 'stk_cd': o['stk_cd'], 'stk_nm': o['stk_nm'],
+                'ord_stt': '접수', 'ord_qty': str(o['oso_qty']), 'ord_pric': str(o['price']),
+                'oso_qty': str(o['oso_qty']), 'orig_ord_no': '', 'trde_tp': o['trde_tp'],
+                'io_tp_nm': '+매수' if o['side'] == 'BUY' else '-매도', 'tm': o['tm'],
+                'cur_prc': str(current_price(o['stk_cd'])),
+                'stex_tp': stex_code.get(o['stex'], '0'), 'stex_tp_txt': o['stex'],
+                'sor_yn': 'Y' if o['stex'] == 'SOR' else 'N',
+            })
+    return {'return_code': 0, 'return_msg': '조회가 완료되었습니다.', 'oso': oso}
+
+
+def minute_chart_view(stk_cd):
+    """ka10080 response, newest first, up to the current paper time."""
+    entry = get_bars(stk_cd)
+    hi = bisect.bisect_right(entry['tms'], paper_now()[:4])
+    today = datetime.now().strftime('%Y%m%d')
+    rows = [{'cntr_tm': today + b['tm'] + '00', 'cur_prc': str(b['close']), 'open_pric': str(b['open']),
+             'high_pric': str(b['high']), 'low_pric': str(b['low']), 'trde_qty': str(b['vol'])}
+            for b in reversed(entry['bars'][:hi])]
+    return {'return_code': 0, 'stk_cd': stk_cd, 'stk_min_pole_chart_qry': rows}
+
+
+def handle_tr(api_id, acct_no, data):
+    match_orders()
+    stk_cd = _clean_code(data.get('stk_cd'))
+    if api_id == 'kt10000':
+        return place_order(acct_no, 'BUY', data)
+    if api_id == 'kt10001':
+        return place_order(acct_no, 'SELL', data)
+    if api_id == 'kt10003':
+        return cancel_order(acct_no, data)
+    if api_id == 'kt00018':
+        return jango_view(acct_no)
+    if api_id == 'ka10075':
+        return miche_view(acct_no, data)
+    if api_id == 'kt00001':
+        with paper_lock:
+            cash = str(get_account(acct_no)['cash'])
+        return {'return_code': 0, 'entr': cash, 'd1_entra': cash, 'd2_entra': cash}
+    if api_id == 'ka10170':
+        with paper_lock:
+            realized = dict(get_account(acct_no)['realized'])
+        return {'return_code': 0, 'tdy_trde_diary': [{'stk_cd': 'A' + cd} for cd in realized]}
+    if api_id == 'ka10072':
+        with paper_lock:
+            pl = get_account(acct_no)['realized'].get(stk_cd, 0)
+        return {'return_code': 0, 'dt_stk_div_rlzt_pl': [{'stk_nm': stk_cd, 'tdy_sel_pl': str(pl)}]}
+    if api_id == 'ka10080':
+        return minute_chart_view(stk_cd)
+    if api_id == 'ka10081':
+        return {'return_code': 0, 'stk_cd': stk_cd, 'stk_dt_pole_chart_qry': get_day_bars(stk_cd)}
+    if api_id == 'ka10007':
+        prev_close = _abs_int(get_day_bars(stk_cd)[0]['cur_prc'])
+        return {'return_code': 0, 'stk_cd': stk_cd, 'upl_pric': str(int(prev_close * 1.3))}
+    if api_id in ('ka10100', 'ka10001'):
+        return {'return_code': 0, 'code': stk_cd, 'name': stk_cd, 'nxtEnable': 'Y'}
+    return {'return_code': 1, 'return_msg': f'paper: unsupported api-id {api_id}'}
+
+
+app = FastAPI()
+
+
+@app.post("/oauth2/token")
+async def token_api(request: Request):
+    data = await request.json()
+    acct_no = data.get('appkey', '')
+    try:
+        for acct, key in get_key_list().items():
+            if key.get('AK') == acct_no:
+                acct_no = acct
+                break
+    except Exception as e:
+        print(f"Error reading key list: {e}")
+    expires_dt = (datetime.now() + timedelta(days=1)).strftime('%Y%m%d%H%M%S')
+    return {'return_code': 0, 'token': TOKEN_PREFIX + acct_no, 'expires_dt': expires_dt, 'token_type': 'bearer'}
+
+
+@app.post("/api/dostk/{tr_group}")
+async def tr_api(tr_group: str, request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    auth = request.headers.get('authorization', '')
+    token = auth.split(' ', 1)[-1]
+    acct_no = token[len(TOKEN_PREFIX):] if token.startswith(TOKEN_PREFIX) else token
+    return handle_tr(request.headers.get('api-id', ''), acct_no, data or {})
+
+
+@app.post("/paper/clock")
+async def set_clock_api(request: dict):
+    """Fix the paper clock to HHMMSS, or follow the wall clock when tm is empty."""
+    global paper_time
+    tm = (request.get('tm') or '').strip()
+    if tm and (len(tm) != 6 or not tm.isdigit()):
+        return {"status": "error", "message": "tm must be HHMMSS"}
+    paper_time = tm or None
+    match_orders()
+    return {"status": "success", "tm": paper_now()}
+
+
+@app.post("/paper/reset")
+async def reset_api():
+    global order_seq
+    with paper_lock:
+        accounts.clear()
+        orders.clear()
+        open_orders.clear()
+        order_seq = 0
+    return {"status": "success"}
+
+
+@app.get("/paper/state")
+async def state_api():
+    match_orders()
+    with paper_lock:
+        open_count = len(open_orders)
+        filled_count = sum(1 for o in orders.values() if o['status'] == 'FILLED')
+        return {
+            "status": "success",
+            "tm": paper_now(),
+            "orders": len(orders),
+            "open": open_count,
+            "filled": filled_count,
+            "accounts": {acct: {'cash': a['cash'], 'positions': a['positions']} for acct, a in accounts.items()},
+        }
+
+
+if __name__ == '__main__':
+    uvicorn.run(app, host="127.0.0.1", port=PAPER_PORT)
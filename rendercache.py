@@ -0,0 +1,90 @@
+"""Size-bounded LRU caches for datagather's chart images.
+
+ByteLRU keeps entries up to a total byte budget and evicts the least recently used
+ones past it; an optional ttl drops entries older than that on lookup (the candle
+cache needs it, since live quotes change). Sizes are what the caller says an entry
+costs: len() of PNG bytes, an estimate for candle lists.
+
+content_key() hashes everything an image is made from (kind, stock, tic, MA params,
+a version of the data) into a short hex key. Rendering is deterministic, so the key
+is also a strong ETag for the image: a request whose If-None-Match carries it can be
+answered 304 without rendering anything.
+
+stats (per cache):
+{"entries": n, "bytes": used, "max_bytes": budget, "hits": n, "misses": n,
+ "evictions": n, "expired": n}
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ByteLRU:
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (size, stored_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[1] >= self.ttl:
+                self._drop(key)
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[2]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._entries[key] = (size, time.time(), value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._drop(old_key)
+                self._stats['evictions'] += 1
+
+    def _drop(self, key):
+        size, _stored_at, _value = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            result = {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+            result.update(self._stats)
+            return result
+
+
+def content_key(*parts):
+    """Short hex digest of the parts (any repr-able values), used as cache key and ETag."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header value names etag (or is *)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
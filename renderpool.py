@@ -0,0 +1,285 @@
+"""Chart rendering off the event loop for datagather: chartrender specs drawn by a process pool.
+
+submit(spec) queues a chartrender spec (candle_spec()/line_spec()/tile_spec()) and returns
+a concurrent.futures.Future resolved with the PNG bytes (await it with asyncio.wrap_future).
+A dispatcher thread hands queued specs to a spawned pool of RENDER_WORKERS processes
+(one per core by default), separate from bgjobs' analytics pool and from the threads
+that fetch candles, so drawing and PNG encoding hold neither the event loop nor the GIL
+of the API process. Workers import only chartrender (numpy + cv2), never datagather's
+state.
+
+Batching: the dispatcher sends a spec as soon as a pool slot is free; specs that queue
+up while every slot is busy go together, up to RENDER_BATCH_MAX per task, so a burst
+costs one pickle/IPC round trip per batch instead of per image while a lone request
+waits for nothing. A spec whose future was cancelled before dispatch (the client went
+away) is dropped without rendering.
+
+Back-pressure: at most RENDER_INFLIGHT batches are in the pool and RENDER_QUEUE_MAX specs
+wait behind them. submit() raises RenderBusy when the queue is full (the chart endpoints
+answer 503); submit(spec, block=True) waits for room instead (the pre-render thread).
+
+stats():
+{"workers": n, "queued": n, "inflight": batches, "submitted": n, "rendered": n,
+ "failed": n, "rejected": n, "cancelled": n, "batches": n, "avg_batch": x}
+
+usage: python renderpool.py bench [images] [workers]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import spawnpool
+
+
+RENDER_WORKERS = max(1, os.cpu_count() or 1)
+RENDER_INFLIGHT = RENDER_WORKERS * 2  # batches in the pool: one running and one ready per worker
+RENDER_BATCH_MAX = 8
+RENDER_QUEUE_MAX = 256
+
+_start_lock = threading.Lock()
+_queue = queue.Queue(maxsize=RENDER_QUEUE_MAX)  # (spec, Future)
+_slots = threading.BoundedSemaphore(RENDER_INFLIGHT)
+_dispatcher = None
+_stop = threading.Event()
+_stats = {'submitted': 0, 'rendered': 0, 'failed': 0, 'rejected': 0, 'cancelled': 0, 'batches': 0, 'inflight': 0}
+_stats_lock = threading.Lock()
+
+
+class RenderBusy(Exception):
+    """The render queue is full; the caller should retry later."""
+
+
+class RenderError(Exception):
+    """A spec failed to render in the worker."""
+
+
+def candle_spec(candles, ma_lines, height, pole_width, pole_spacing, date_dividers):
+    return {'kind': 'candle', 'candles': candles, 'ma_lines': ma_lines, 'height': height,
+            'pole_width': pole_width, 'pole_spacing': pole_spacing, 'date_dividers': date_dividers}
+
+
+def line_spec(labels, series, ref_value, height):
+    return {'kind': 'line', 'labels': labels, 'series': series, 'ref_value': ref_value, 'height': height}
+
+
+def tile_spec(bars, lo, hi, height, bar_px, body_px, tile_bars):
+    return {'kind': 'tile', 'bars': bars, 'lo': lo, 'hi': hi, 'height': height,
+            'bar_px': bar_px, 'body_px': body_px, 'tile_bars': tile_bars}
+
+
+def _init_worker():
+    import chartrender
+    chartrender.cv2.setNumThreads(1)  # one process per core already; cv2's own threads would oversubscribe
+
+
+def _render_batch(specs):
+    import chartrender
+    return chartrender.render_batch(specs)
+
+
+def _warm():
+    return os.getpid()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+_pool = spawnpool.SpawnPool(RENDER_WORKERS, _init_worker)
+
+
+def start(warm=True):
+    """Start the dispatcher (and with warm=True the worker processes, so the first chart
+    does not pay for spawning them). submit() starts it too when needed."""
+    global _dispatcher
+    with _start_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _stop.clear()
+            _dispatcher = threading.Thread(target=_dispatch_loop, daemon=True, name='ChartRenderDispatcher')
+            _dispatcher.start()
+    if warm:
+        pool = _pool.get()
+        for _ in range(RENDER_WORKERS):
+            pool.submit(_warm)
+
+
+def shutdown():
+    """Stop dispatching, fail the queued specs and stop the workers."""
+    _stop.set()
+    if _dispatcher is not None:
+        _dispatcher.join(timeout=2.0)
+    while True:
+        try:
+            _spec, fut = _queue.get_nowait()
+        except queue.Empty:
+            break
+        _fail_shut_down(fut)
+    _pool.reset()
+
+
+def _fail_shut_down(fut):
+    if fut.set_running_or_notify_cancel():
+        fut.set_exception(RenderBusy('render pool shut down'))
+
+
+def submit(spec, block=False):
+    """Queue a spec; returns a Future of its PNG bytes. Raises RenderBusy when the queue is
+    full, unless block=True."""
+    if _dispatcher is None or not _dispatcher.is_alive():
+        start(warm=False)
+    fut = Future()
+    try:
+        _queue.put((spec, fut), block=block)
+    except queue.Full:
+        _count('rejected')
+        raise RenderBusy(f'chart render queue is full ({RENDER_QUEUE_MAX} waiting)')
+    _count('submitted')
+    return fut
+
+
+def render(spec):
+    """PNG bytes of a spec, waiting for room in the queue and for the render."""
+    return submit(spec, block=True).result()
+
+
+def _dispatch_loop():
+    while not _stop.is_set():
+        try:
+            first = _queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        # specs submitted while every slot is busy join this batch
+        acquired = False
+        while not acquired and not _stop.is_set():
+            acquired = _slots.acquire(timeout=0.5)
+        if not acquired:
+            _fail_shut_down(first[1])  # shutdown() fails the specs still queued
+            break
+        batch = [first]
+        while len(batch) < RENDER_BATCH_MAX:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        live = [(spec, fut) for spec, fut in batch if fut.set_running_or_notify_cancel()]
+        if len(live) < len(batch):
+            _count('cancelled', len(batch) - len(live))
+        if not live:
+            _slots.release()
+            continue
+        try:
+            task = _pool.get().submit(_render_batch, [spec for spec, _fut in live])
+        except Exception as e:
+            _slots.release()
+            _pool.reset()
+            for _spec, fut in live:
+                fut.set_exception(e)
+            continue
+        with _stats_lock:
+            _stats['batches'] += 1
+            _stats['inflight'] += 1
+        task.add_done_callback(lambda task, live=live: _finish_batch(task, live))
+
+
+def _finish_batch(task, live):
+    _slots.release()
+    with _stats_lock:
+        _stats['inflight'] -= 1
+    try:
+        results = task.result()
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _pool.reset()
+        print(f"Error in chart render batch: {e}")
+        _count('failed', len(live))
+        for _spec, fut in live:
+            fut.set_exception(e)
+        return
+    for (ok, value), (_spec, fut) in zip(results, live):
+        if ok:
+            _count('rendered')
+            fut.set_result(value)
+        else:
+            _count('failed')
+            fut.set_exception(RenderError(value))
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['workers'] = RENDER_WORKERS
+    result['queued'] = _queue.qsize()
+    result['avg_batch'] = round((result['rendered'] + result['failed']) / result['batches'], 2) if result['batches'] else 0.0
+    return result
+
+
+def _bench_specs(images, bars):
+    """The three images of a stock page (daily candles + 4 MAs, MA comparison, 15-minute
+    candles) in rotation, drawn from synthetic bars."""
+    import chartrender
+    import features
+    daily = chartrender.synthetic_candles(bars)
+    minute = chartrender.synthetic_candles(bars, seed=1, minute=True)
+    closes = [c['close'] for c in daily]
+    colors = [(75, 25, 230), (44, 160, 44), (216, 99, 67), (49, 130, 245)]
+    mas = [[None if v != v else float(v) for v in features.moving_average(closes, p).tolist()] for p in (5, 20, 60, 120)]
+    ma_lines = [{'values': m, 'color': c, 'visible': True} for m, c in zip(mas, colors)]
+    base = mas[3]
+    series = [{'values': [v / b if v is not None and b else None for v, b in zip(m, base)], 'color': c}
+              for m, c in zip(mas, colors)]
+    page = [candle_spec(daily, ma_lines, 440, 4, 7, False),
+            line_spec([c['label'] for c in daily], series, 1.0, 260),
+            candle_spec(minute, [], 380, 3, 5, True)]
+    return [page[i % len(page)] for i in range(images)]
+
+
+def bench(images=300, workers=None, bars=600):
+    """Images/sec of stock-page charts (bars candles each) rendered serially in this process,
+    then through the pool with the given number of workers, and the pool rate per core in use."""
+    global RENDER_WORKERS, _slots
+    import chartrender
+    specs = _bench_specs(images, bars)
+    t = time.perf_counter()
+    for spec in specs:
+        chartrender.render_png(spec)
+    serial = images / (time.perf_counter() - t)
+
+    shutdown()
+    if workers:
+        RENDER_WORKERS = _pool.max_workers = int(workers)
+        _slots = threading.BoundedSemaphore(RENDER_WORKERS * 2)
+    start(warm=False)
+    wait([_pool.get().submit(_warm) for _ in range(RENDER_WORKERS * 2)])  # spawned and imported before timing
+    t = time.perf_counter()
+    futures = [submit(spec, block=True) for spec in specs]
+    wait(futures)
+    elapsed = time.perf_counter() - t
+    errors = sum(1 for f in futures if f.exception() is not None)
+    cores = min(RENDER_WORKERS, os.cpu_count() or 1)
+    result = {
+        'images': images, 'bars': bars, 'workers': RENDER_WORKERS, 'cores': cores,
+        'serial_images_per_sec': round(serial, 1),
+        'pool_images_per_sec': round(images / elapsed, 1),
+        'pool_images_per_sec_per_core': round(images / elapsed / cores, 1),
+        'speedup': round(images / elapsed / serial, 2),
+        'errors': errors,
+        'stats': stats(),
+    }
+    shutdown()
+    return result
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    args = sys.argv[2:]
+    if command == 'bench':
+        print(json.dumps(bench(int(args[0]) if args else 300, int(args[1]) if len(args) > 1 else None), indent=2))
+    else:
+        print(__doc__.split('usage: ')[1])
+        sys.exit(1)
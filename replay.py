@@ -0,0 +1,240 @@
+"""Replay a recorded trading day through autotr.daily_work with a virtual clock.
+
+Recording file (JSON):
+{
+    "date": "20261019",
+    "interested_stocks": {...},          # same shape as interested_stocks.json
+    "auto_sell_enabled": {acct: mode},   # same shape as auto_sell_enabled.json
+    "upper_limits": {stk_cd: price},     # optional, ka10007 answers
+    "kt00018": [{"tm": "080000", "data": {acct: kt00018 response}}, ...],
+    "ka10075": [{"tm": "080000", "data": {acct: ka10075 response}}, ...],
+    "ka10080": [{"tm": "080000", "data": {stk_cd: stk_min_pole_chart_qry list}}, ...],
+    "ka10081": [{"tm": "080000", "data": {stk_cd: ka10081 response}}, ...]
+}
+Each tick uses the latest snapshot whose tm <= virtual time.
+Orders (kt10000/kt10001/kt10003) go to a simulated gateway and are only recorded.
+
+usage: python replay.py recording.json [step_seconds] [out_dir]
+"""
+import sys
+import os
+import json
+import copy
+import bisect
+import time as time_module
+from datetime import datetime, timedelta
+
+import autotr
+
+
+REPLAY_START = '060000'
+REPLAY_END = '200000'
+
+recording = {}
+replay_now = None
+replay_orders = []
+
+
+def replay_clock():
+    return replay_now
+
+
+def snapshot_at(name, tm):
+    """Return data of the latest snapshot at or before tm (HHMMSS)."""
+    snaps = recording.get(name, [])
+    tms = [s['tm'] for s in snaps]
+    idx = bisect.bisect_right(tms, tm) - 1
+    if idx < 0:
+        return {}
+    return snaps[idx]['data']
+
+
+def replay_get_token(ACCT):
+    return f'REPLAY-{ACCT}'
+
+
+def token_acct(token):
+    return token[len('REPLAY-'):]
+
+
+def replay_fn_kt00018(log_jango, token, data, cont_yn='N', next_key=''):
+    j = snapshot_at('kt00018', replay_now.strftime('%H%M%S')).get(token_acct(token))
+    return copy.deepcopy(j) if j else {}
+
+
+def replay_fn_ka10075(token, data, cont_yn='N', next_key=''):
+    m = snapshot_at('ka10075', replay_now.strftime('%H%M%S')).get(token_acct(token))
+    return copy.deepcopy(m) if m else {'return_code': 0, 'oso': []}
+
+
+def replay_fn_ka10007(token, data, cont_yn='N', next_key=''):
+    stk_cd = data.get('stk_cd', '')
+    upl_pric = recording.get('upper_limits', {}).get(stk_cd, 99999999)
+    return {'return_code': 0, 'stk_cd': stk_cd, 'upl_pric': str(upl_pric)}
+
+
+def record_order(api_id, token, params):
+    order = {
+        'tm': replay_now.strftime('%H%M%S'),
+        'api-id': api_id,
+        'ACCT': token_acct(token),
+    }
+    order.update(params)
+    replay_orders.append(order)
+    return {'return_code': 0, 'return_msg': f'replay {api_id} accepted', 'ord_no': f'{len(replay_orders):07d}'}
+
+
+def replay_sell_order(MY_ACCESS_TOKEN, dmst_stex_tp='KRX', stk_cd='', ord_qty='0', ord_uv='0', trde_tp='0', cond_uv=''):
+    return record_order('kt10001', MY_ACCESS_TOKEN, {
+        'dmst_stex_tp': dmst_stex_tp, 'stk_cd': stk_cd, 'ord_qty': ord_qty, 'ord_uv': ord_uv, 'trde_tp': trde_tp})
+
+
+def replay_buy_order(MY_ACCESS_TOKEN, stk_nm, dmst_stex_tp='KRX', stk_cd='', ord_qty='0', ord_uv='0', trde_tp='0', cond_uv=''):
+    return record_order('kt10000', MY_ACCESS_TOKEN, {
+        'dmst_stex_tp': dmst_stex_tp, 'stk_cd': stk_cd, 'ord_qty': ord_qty, 'ord_uv': ord_uv, 'trde_tp': trde_tp})
+
+
+def replay_fn_kt10003(now, token, data, cont_yn='N', next_key=''):
+    return record_order('kt10003', token, data)
+
+
+stockinfo_cache = {}
+
+
+def replay_get_stockinfo(stk_cd):
+    # never call ka10100 during replay
+    info = stockinfo_cache.get(stk_cd)
+    if info:
+        return info
+    return {'code': stk_cd, 'name': stk_cd, 'nxtEnable': 'Y'}
+
+
+def install_replay():
+    """Point autotr at the virtual clock, recorded TRs and the simulated gateway."""
+    import ka10100
+    stockinfo_cache.update(ka10100.stockinfos)
+
+    autotr.now_func = replay_clock
+    autotr.get_token = replay_get_token
+    autotr.fn_kt00018 = replay_fn_kt00018
+    autotr.fn_ka10075 = replay_fn_ka10075
+    autotr.fn_ka10007 = replay_fn_ka10007
+    autotr.fn_kt10003 = replay_fn_kt10003
+    autotr.sell_order = replay_sell_order
+    autotr.buy_order = replay_buy_order
+    autotr.get_stockinfo = replay_get_stockinfo
+
+    accounts = set()
+    for snap in recording.get('kt00018', []):
+        accounts.update(snap['data'].keys())
+    autotr.key_list = {acct: {'ACCT': acct} for acct in sorted(accounts)}
+    autotr.interested_stocks = copy.deepcopy(recording.get('interested_stocks', {}))
+    autotr.auto_sell_enabled = copy.deepcopy(recording.get('auto_sell_enabled', {}))
+    autotr.buy_queue = []
+
+
+def update_charts(tm):
+    """Do what update_bun_charts_thread would have done by this time."""
+    bun = snapshot_at('ka10080', tm)
+    day = snapshot_at('ka10081', tm)
+    with autotr.bun_charts_lock:
+        autotr.bun_charts.update(copy.deepcopy(bun))
+        for stk_cd in bun:
+            autotr.bun_times[stk_cd] = replay_now
+    with autotr.daily_charts_lock:
+        now_ts = time_module.time()
+        for stk_cd, data in day.items():
+            autotr.daily_charts[stk_cd] = {'data': copy.deepcopy(data), 'ts': now_ts}
+
+
+def market_phase(now):
+    """Same phase boundaries as daily_work."""
+    if autotr.is_between(now, autotr.nxt_start_time, autotr.nxt_end_time):
+        return 'NXT'
+    elif autotr.is_between(now, autotr.nxt_end_time, autotr.krx_start_time):
+        return 'NXT->KRX'
+    elif autotr.is_between(now, autotr.krx_start_time, autotr.krx_end_time_1531):
+        return 'KRX'
+    elif autotr.is_between(now, autotr.krx_end_time_1531, autotr.krx_aft_time_1601):
+        return 'KRX->AFT'
+    elif autotr.is_between(now, autotr.krx_aft_time_1601, autotr.nxt_fin_time_2000):
+        return 'AFT'
+    return 'OFF'
+
+
+def run_replay(step_seconds=1):
+    global replay_now
+
+    day = datetime.strptime(recording['date'], '%Y%m%d')
+    replay_now = datetime.strptime(recording['date'] + REPLAY_START, '%Y%m%d%H%M%S')
+    end = datetime.strptime(recording['date'] + REPLAY_END, '%Y%m%d%H%M%S')
+    autotr.now = replay_now
+    autotr.today_yyyymmdd = day.strftime('%Y%m%d')
+
+    phases = {}
+    ticks = 0
+    start = time_module.perf_counter()
+    while replay_now < end:
+        tm = replay_now.strftime('%H%M%S')
+        update_charts(tm)
+        orders_before = len(replay_orders)
+        t0 = time_module.perf_counter()
+        autotr.periodic_timer_handler()
+        elapsed = time_module.perf_counter() - t0
+
+        phase = phases.setdefault(market_phase(replay_now), {'ticks': 0, 'total': 0.0, 'max': 0.0, 'orders': 0})
+        phase['ticks'] += 1
+        phase['total'] += elapsed
+        phase['max'] = max(phase['max'], elapsed)
+        phase['orders'] += len(replay_orders) - orders_before
+
+        ticks += 1
+        autotr.skip_delay_loop = False
+        replay_now += timedelta(seconds=step_seconds)
+    wall = time_module.perf_counter() - start
+
+    report = {
+        'date': recording['date'],
+        'step_seconds': step_seconds,
+        'ticks': ticks,
+        'wall_seconds': round(wall, 3),
+        'ticks_per_second': round(ticks / wall, 1) if wall > 0 else 0,
+        'orders': len(replay_orders),
+        'orders_by_api': {},
+        'phases': {},
+    }
+    for o in replay_orders:
+        report['orders_by_api'][o['api-id']] = report['orders_by_api'].get(o['api-id'], 0) + 1
+    for name, p in phases.items():
+        report['phases'][name] = {
+            'ticks': p['ticks'],
+            'orders': p['orders'],
+            'avg_ms': round(p['total'] / p['ticks'] * 1000, 3),
+            'max_ms': round(p['max'] * 1000, 3),
+        }
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python replay.py recording.json [step_seconds] [out_dir]')
+        sys.exit(1)
+    recording_file = os.path.abspath(sys.argv[1])
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    out_dir = os.path.abspath(sys.argv[3] if len(sys.argv) > 3 else 'replay_out')
+
+    with open(recording_file, 'r', encoding='utf-8') as f:
+        recording = json.load(f)
+
+    # autotr writes autotr_state.db, logs/ etc. relative to cwd; keep them away from the live files
+    os.makedirs(out_dir, exist_ok=True)
+    os.chdir(out_dir)
+
+    install_replay()
+    report = run_replay(step)
+
+    with open('replay_orders.json', 'w', encoding='utf-8') as f:
+        json.dump(replay_orders, f, indent=2, ensure_ascii=False)
+    with open('replay_report.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,35 @@
+"""A process pool of spawned workers, created on first use: the pool of bgjobs and of renderpool.
+
+pool = SpawnPool(max_workers, initializer, initargs)
+pool.get() returns the ProcessPoolExecutor, starting it when there is none; reset() shuts
+it down without waiting and cancels what has not started (after a BrokenProcessPool, or
+at shutdown), and the next get() starts a fresh one. max_workers, initializer and
+initargs may be changed before the next start.
+"""
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class SpawnPool:
+    def __init__(self, max_workers, initializer=None, initargs=()):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process full of threads can copy held locks into the child
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=self.initializer, initargs=self.initargs)
+            return self._executor
+
+    def reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
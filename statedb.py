@@ -0,0 +1,114 @@
+"""SQLite (WAL) store for autotr state shared with datagather.
+
+Every state table (interested_stocks, sell_exclude, auto_sell_enabled, pc_settings,
+buy_queue, jango_data) is kept as rows (tbl, key) -> JSON value.
+sync_table() writes only the rows that changed since the last sync, in one transaction,
+and get_table() reads through an in-memory copy of the last synced rows.
+"""
+import os
+import json
+import sqlite3
+import threading
+
+
+# Relative like the other autotr state files; datagather joins it with its BASE_DIR.
+STATE_DB_FILE = 'autotr_state.db'
+
+_local = threading.local()
+_cache = {}  # {tbl: {key: json_text}} as last read from / written to the db
+_cache_lock = threading.RLock()
+
+
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != STATE_DB_FILE:
+        conn = sqlite3.connect(STATE_DB_FILE, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS state ('
+                     'tbl TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (tbl, key))')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.commit()
+        _local.conn = conn
+        _local.path = STATE_DB_FILE
+    return conn
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def load_table(tbl):
+    """Read tbl from the db (refreshing the cache) and return {key: value}."""
+    rows = _conn().execute('SELECT key, value FROM state WHERE tbl = ? ORDER BY key', (tbl,)).fetchall()
+    with _cache_lock:
+        _cache[tbl] = {k: v for k, v in rows}
+    return {k: json.loads(v) for k, v in rows}
+
+
+def get_table(tbl):
+    """Return {key: value} for tbl from the cache, reading the db on first use."""
+    with _cache_lock:
+        rows = _cache.get(tbl)
+        if rows is not None:
+            return {k: json.loads(v) for k, v in rows.items()}
+    return load_table(tbl)
+
+
+def sync_tables(tables):
+    """Make the stored rows equal to {tbl: {key: value}} in one transaction; returns rows written."""
+    conn = _conn()
+    changed = 0
+    with _cache_lock:
+        new_cache = {}
+        upserts = []
+        deletes = []
+        for tbl, data in tables.items():
+            if tbl not in _cache:
+                load_table(tbl)
+            old_rows = _cache[tbl]
+            new_rows = {str(k): _dumps(v) for k, v in data.items()}
+            for k, v in new_rows.items():
+                if old_rows.get(k) != v:
+                    upserts.append((tbl, k, v))
+            for k in old_rows:
+                if k not in new_rows:
+                    deletes.append((tbl, k))
+            new_cache[tbl] = new_rows
+        if upserts or deletes:
+            with conn:
+                conn.executemany('INSERT INTO state (tbl, key, value) VALUES (?, ?, ?) '
+                                 'ON CONFLICT(tbl, key) DO UPDATE SET value = excluded.value', upserts)
+                conn.executemany('DELETE FROM state WHERE tbl = ? AND key = ?', deletes)
+            changed = len(upserts) + len(deletes)
+        _cache.update(new_cache)
+    return changed
+
+
+def sync_table(tbl, data):
+    return sync_tables({tbl: data})
+
+
+def migrate_json(tbl, json_file, convert=None):
+    """Import json_file into tbl once. convert(loaded) -> {key: value} for non-dict files.
+    Returns True when rows were imported."""
+    conn = _conn()
+    marker = f'migrated:{tbl}'
+    if conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+        return False
+    imported = False
+    if os.path.exists(json_file):
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            data = convert(loaded) if convert else loaded
+            if isinstance(data, dict):
+                sync_table(tbl, data)
+                imported = True
+                print(f"Migrated {json_file} into {STATE_DB_FILE}:{tbl} ({len(data)} rows)")
+        except Exception as e:
+            print(f"Error migrating {json_file}: {e}")
+            return False
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (marker, json_file))
+    return imported